@@ -12,16 +12,20 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
 
 import customtkinter as ctk
-from datetime import datetime
 import tkinter.messagebox as messagebox
 
 # Import backend modules
 import database
-from database import init_db, save_data, get_next_id
-
-# Helper to get current data store (always fresh reference)
-def get_data_store():
-    return database.DATA_STORE
+import backup
+import clock
+import heatmap
+from database import init_db
+from drug_names import DRUGS
+from mem_profile import MEM_PROFILE, store_sizes
+from service import SERVICE
+from stock_index import days_remaining
+from ui_metrics import UI_METRICS
+from writer import WRITER
 
 # Set appearance and theme
 ctk.set_appearance_mode("dark")
@@ -61,6 +65,18 @@ LIGHT_THEME = {
 
 COLORS = dict(DARK_THEME)
 
+# Idle time before deleted medications are physically removed from storage
+COMPACT_DELAY_MS = 5000
+# How often an incremental backup snapshot is taken while the app runs
+BACKUP_INTERVAL_MS = 60 * 60 * 1000
+# Search boxes filter once typing has paused this long
+SEARCH_DELAY_MS = 200
+# History rows rendered at once; "Show more" adds the next batch
+HISTORY_BATCH = 200
+# Name suggestions under the Add Medication name field
+SUGGESTION_COUNT = 6
+SUGGEST_DELAY_MS = 80
+
 
 class FontManager:
     """Central font registry to scale text without resizing widgets"""
@@ -99,6 +115,66 @@ def scale(value):
     """Scale numeric sizes (heights/padding) with current font scale"""
     return max(1, int(round(value * FONT_MANAGER.scale)))
 
+
+class T:
+    """Translated text option: a translation key or a callable building the text"""
+    def __init__(self, source):
+        self.source = source
+
+
+class C:
+    """Theme color option: a role name from the COLORS palette"""
+    def __init__(self, role):
+        self.role = role
+
+
+class WidgetRegistry:
+    """Remembers which widget options hold translated text or theme colors,
+    so language and theme switches reconfigure widgets in place"""
+    def __init__(self):
+        self.translate = lambda key: key
+        self.entries = []
+        self._prune_at = 500
+    
+    def resolve(self, value):
+        if isinstance(value, T):
+            return value.source() if callable(value.source) else self.translate(value.source)
+        if isinstance(value, C):
+            return COLORS[value.role]
+        return value
+    
+    def create(self, cls, master, *args, **kwargs):
+        dynamic = {k: v for k, v in kwargs.items() if isinstance(v, (T, C))}
+        resolved = {k: self.resolve(v) for k, v in kwargs.items()}
+        widget = cls(master, *args, **resolved)
+        if dynamic:
+            self.track(widget, **dynamic)
+        return widget
+    
+    def track(self, widget, **options):
+        """Record T/C options of an existing widget"""
+        self.entries.append((widget, options))
+        if len(self.entries) > self._prune_at:
+            self.prune()
+            self._prune_at = max(500, 2 * len(self.entries))
+    
+    def prune(self):
+        self.entries = [(w, opts) for w, opts in self.entries if w.winfo_exists()]
+    
+    def apply(self):
+        """Re-resolve every tracked option for the current language and palette"""
+        self.prune()
+        for widget, options in self.entries:
+            widget.configure(**{k: self.resolve(v) for k, v in options.items()})
+
+
+WIDGETS = WidgetRegistry()
+
+
+def make_widget(cls, master, *args, **kwargs):
+    """Create a widget whose T/C options follow language and theme changes"""
+    return WIDGETS.create(cls, master, *args, **kwargs)
+
 # ============================================
 # LANGUAGE TRANSLATIONS
 # ============================================
@@ -134,6 +210,7 @@ TRANSLATIONS = {
         "my_medications": "📋  My Medications",
         "add_medication": "➕  Add Medication",
         "history": "📜  History",
+        "calendar": "📅  Calendar",
         "sign_out": "🚪  Sign Out",
         
         # Medications
@@ -145,6 +222,8 @@ TRANSLATIONS = {
         "per_day": "per day",
         "days_left": "days left",
         "low_stock": "⚠️ Low Stock",
+        "running_out_title": "Refill Soon",
+        "running_out_msg": "These medications run out soon:",
         "in_stock_status": "✓ In Stock",
         "todays_progress": "Today's Progress",
         "done_today": "✅ Done for today!",
@@ -152,7 +231,13 @@ TRANSLATIONS = {
         "more_to_go": "more to go",
         "completed_today": "✓ Completed Today",
         "take_dose": "💊 Take Dose",
+        "take_all_due": "💊  Take All Due",
+        "nothing_due": "All of today's doses have already been taken.",
         "delete": "Delete",
+        "refill": "Refill",
+        "refill_prompt": "How many pills did you add?",
+        "refill_amount_invalid": "Enter a positive whole number of pills.",
+        "stock_updated": "Stock Updated",
         "delete_confirm": "Delete this medication?",
         "delete_success": "Medication deleted.",
         
@@ -174,6 +259,24 @@ TRANSLATIONS = {
         "export_pdf": "📄  Export PDF",
         "no_history": "No history yet",
         "take_some_meds": "Take some medication to see your history here",
+        "show_older": "Show older history",
+        "show_more": "Show more",
+        "search_meds": "Search medications",
+        "search_history": "Search name or date (2024-03-15)",
+        "no_matches": "No matches",
+        
+        # Calendar
+        "calendar_title": "Dose Calendar",
+        "month": "Month",
+        "year": "Year",
+        "weekdays": "Mo Tu We Th Fr Sa Su",
+        "months": "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec",
+        "cal_none": "None",
+        "cal_some": "Some",
+        "cal_all": "All",
+        "cal_extra": "Extra",
+        "doses_of": "doses of",
+        "full_days": "Days with every dose:",
         
         # Dialogs
         "ok": "OK",
@@ -206,6 +309,9 @@ TRANSLATIONS = {
         "pills": "pills",
         "error": "Error",
         "record_failed": "Could not record medication intake.",
+        "change_failed": "Your change could not be applied.",
+        "save_failed": "Changes could not be written to disk:",
+        "save_retry": "They will be saved again with your next change.",
         "export_complete": "Export Complete",
         "pdf_saved": "PDF Report saved to:",
         "export_failed": "Export Failed",
@@ -247,6 +353,7 @@ TRANSLATIONS = {
         "my_medications": "📋  我的药物",
         "add_medication": "➕  添加药物",
         "history": "📜  历史记录",
+        "calendar": "📅  日历",
         "sign_out": "🚪  退出登录",
         
         # Medications
@@ -258,6 +365,8 @@ TRANSLATIONS = {
         "per_day": "每天",
         "days_left": "天剩余",
         "low_stock": "⚠️ 库存不足",
+        "running_out_title": "即将用完",
+        "running_out_msg": "以下药物即将用完：",
         "in_stock_status": "✓ 库存充足",
         "todays_progress": "今日进度",
         "done_today": "✅ 今日已完成！",
@@ -265,7 +374,13 @@ TRANSLATIONS = {
         "more_to_go": "还需服用",
         "completed_today": "✓ 今日已完成",
         "take_dose": "💊 服用",
+        "take_all_due": "💊  全部服用",
+        "nothing_due": "今日所有剂量均已服用。",
         "delete": "删除",
+        "refill": "补充",
+        "refill_prompt": "补充了多少粒？",
+        "refill_amount_invalid": "请输入正整数。",
+        "stock_updated": "库存已更新",
         "delete_confirm": "确定删除该药物？",
         "delete_success": "药物已删除。",
         
@@ -287,6 +402,24 @@ TRANSLATIONS = {
         "export_pdf": "📄  导出PDF",
         "no_history": "暂无记录",
         "take_some_meds": "服用药物后会在这里显示记录",
+        "show_older": "显示更早的记录",
+        "show_more": "显示更多",
+        "search_meds": "搜索药物",
+        "search_history": "搜索名称或日期（2024-03-15）",
+        "no_matches": "没有匹配项",
+        
+        # Calendar
+        "calendar_title": "服药日历",
+        "month": "月",
+        "year": "年",
+        "weekdays": "一 二 三 四 五 六 日",
+        "months": "1月 2月 3月 4月 5月 6月 7月 8月 9月 10月 11月 12月",
+        "cal_none": "未服",
+        "cal_some": "部分",
+        "cal_all": "全部",
+        "cal_extra": "超量",
+        "doses_of": "次，应服",
+        "full_days": "全部服用的天数：",
         
         # Dialogs
         "ok": "确定",
@@ -319,6 +452,9 @@ TRANSLATIONS = {
         "pills": "粒",
         "error": "错误",
         "record_failed": "无法记录服药信息。",
+        "change_failed": "无法应用您的更改。",
+        "save_failed": "更改无法写入磁盘：",
+        "save_retry": "下次更改时将再次保存。",
         "export_complete": "导出完成",
         "pdf_saved": "PDF报告已保存至：",
         "export_failed": "导出失败",
@@ -357,6 +493,7 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "my_medications": "📋  Mes médicaments",
     "add_medication": "➕  Ajouter un médicament",
     "history": "📜  Historique",
+    "calendar": "📅  Calendrier",
     "sign_out": "🚪  Déconnexion",
     "my_medications_title": "Mes médicaments",
     "refresh": "🔄  Rafraîchir",
@@ -366,6 +503,8 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "per_day": "par jour",
     "days_left": "jours restants",
     "low_stock": "⚠️ Stock faible",
+    "running_out_title": "À renouveler",
+    "running_out_msg": "Ces médicaments seront bientôt épuisés :",
     "in_stock_status": "✓ En stock",
     "todays_progress": "Progression du jour",
     "done_today": "✅ Terminé pour aujourd'hui !",
@@ -373,6 +512,8 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "more_to_go": "restants",
     "completed_today": "✓ Terminé aujourd'hui",
     "take_dose": "💊 Prendre",
+    "take_all_due": "💊  Tout prendre",
+    "nothing_due": "Toutes les doses du jour ont déjà été prises.",
     "add_new_medication": "Ajouter un nouveau médicament",
     "add_subtitle": "Saisissez les détails du médicament ci-dessous",
     "medication_name": "Nom du médicament",
@@ -388,6 +529,22 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "export_pdf": "📄  Exporter en PDF",
     "no_history": "Aucun historique",
     "take_some_meds": "Prenez un médicament pour voir l'historique ici",
+    "show_older": "Afficher l'historique plus ancien",
+    "show_more": "Afficher plus",
+    "search_meds": "Rechercher un médicament",
+    "search_history": "Nom ou date (2024-03-15)",
+    "no_matches": "Aucun résultat",
+    "calendar_title": "Calendrier des prises",
+    "month": "Mois",
+    "year": "Année",
+    "weekdays": "Lu Ma Me Je Ve Sa Di",
+    "months": "janv. févr. mars avr. mai juin juil. août sept. oct. nov. déc.",
+    "cal_none": "Aucune",
+    "cal_some": "Partiel",
+    "cal_all": "Toutes",
+    "cal_extra": "En trop",
+    "doses_of": "prises sur",
+    "full_days": "Jours avec toutes les prises :",
     "ok": "OK",
     "input_required": "Saisie requise",
     "enter_username_msg": "Veuillez entrer votre nom d'utilisateur.",
@@ -418,6 +575,9 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "pills": "comprimés",
     "error": "Erreur",
     "record_failed": "Impossible d'enregistrer la prise.",
+    "change_failed": "Votre modification n'a pas pu être appliquée.",
+    "save_failed": "Les modifications n'ont pas pu être écrites sur le disque :",
+    "save_retry": "Elles seront enregistrées à nouveau lors de votre prochaine modification.",
     "export_complete": "Export terminé",
     "pdf_saved": "Rapport PDF enregistré ici :",
     "export_failed": "Échec de l'export",
@@ -426,6 +586,10 @@ TRANSLATIONS["fr"] = {**TRANSLATIONS["en"], **{
     "light_mode": "☀ Clair",
     "dark_mode": "🌙 Sombre",
     "delete": "Supprimer",
+    "refill": "Renouveler",
+    "refill_prompt": "Combien de comprimés avez-vous ajoutés ?",
+    "refill_amount_invalid": "Saisissez un nombre entier positif de comprimés.",
+    "stock_updated": "Stock mis à jour",
     "delete_confirm": "Supprimer ce médicament ?",
     "delete_success": "Médicament supprimé.",
 }}
@@ -499,6 +663,7 @@ class MedicationApp(ctk.CTk):
         self.font_scale = 1.0
         self.font_labels = []
         self.theme_mode = "dark"
+        WIDGETS.translate = self.t
         
         self.title(self.t("app_title"))
         self.geometry("1050x700")
@@ -510,10 +675,48 @@ class MedicationApp(ctk.CTk):
         # Current logged in user
         self.current_user_id = None
         self.current_username = None
+        # Set while a login is checked on the writer thread
+        self.login_pending = False
+        
+        # Pending storage compaction (see delete_medication)
+        self.compact_job = None
+        self.after(BACKUP_INTERVAL_MS, self.backup_storage)
+        
+        # Visible dashboard view and its medication cards by med id
+        self.current_view = None
+        self.med_cards = {}
+        self.views = {}
+        self.stale_views = set()
+        # Search box text per view and the pending debounce jobs
+        self.med_query = ""
+        self.history_query = ""
+        self.search_jobs = {}
+        database.subscribe(self.on_data_change)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Opt-in UI metrics (MED_UI_METRICS=1) and memory profiling
+        # (MED_MEM_PROFILE=1); F12 shows the overlay
+        self.metrics_overlay = None
+        if UI_METRICS.enabled:
+            UI_METRICS.start_probe(self)
+        if MEM_PROFILE.enabled:
+            MEM_PROFILE.start()
+            MEM_PROFILE.add_gauge("font_labels", lambda: len(self.font_labels))
+            MEM_PROFILE.add_gauge("tracked_widgets", lambda: len(WIDGETS.entries))
+            MEM_PROFILE.add_gauge("med_cards", lambda: len(self.med_cards))
+            MEM_PROFILE.add_gauge("data_store", store_sizes)
+            database.subscribe(lambda event: MEM_PROFILE.checkpoint_when_idle(event.type, self))
+        if UI_METRICS.enabled or MEM_PROFILE.enabled:
+            self.bind("<F12>", lambda e: self.toggle_metrics_overlay())
         
         # Initialize database
         init_db()
         
+        # Saves run on the writer thread; results arrive through after()
+        WRITER.on_error = self.on_change_failed
+        WRITER.on_write_error = self.on_save_failed
+        WRITER.start(self)
+        
         # Show login screen first
         self.show_login()
     
@@ -538,12 +741,15 @@ class MedicationApp(ctk.CTk):
         self.refresh_current_view()
     
     def refresh_current_view(self):
-        """Reload UI based on current auth state"""
+        """Re-apply language and theme to the existing widgets in place"""
         self.configure(fg_color=COLORS["bg_dark"])
-        if self.current_user_id:
-            self.show_dashboard()
-        else:
-            self.show_login()
+        WIDGETS.apply()
+        if self.current_view is not None:
+            # Active nav styling is not a plain color role
+            self.set_active_nav(self.current_view)
+        if "calendar" in self.views:
+            # Canvas items take their colors and text when drawn
+            self.draw_calendar()
     
     def adjust_font_scale(self, delta):
         """Increase/decrease text size without changing layout dimensions"""
@@ -568,6 +774,8 @@ class MedicationApp(ctk.CTk):
     
     def register_font_label(self, label):
         """Track font-scale labels so they stay in sync"""
+        # Labels of rebuilt screens would otherwise pile up until the next font change
+        self.font_labels = [lbl for lbl in self.font_labels if lbl.winfo_exists()]
         self.font_labels.append(label)
         label.configure(text=self.font_percent_text())
     
@@ -580,9 +788,43 @@ class MedicationApp(ctk.CTk):
                 alive_labels.append(lbl)
         self.font_labels = alive_labels
     
+    def toggle_metrics_overlay(self):
+        """Show or hide the UI metrics debug window"""
+        if self.metrics_overlay is not None and self.metrics_overlay.winfo_exists():
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+            return
+        
+        overlay = ctk.CTkToplevel(self)
+        overlay.title("UI Metrics")
+        overlay.geometry("620x320")
+        overlay.attributes("-topmost", True)
+        label = ctk.CTkLabel(overlay, text="", justify="left", anchor="nw",
+                             font=ctk.CTkFont(family="Courier", size=12))
+        label.pack(fill="both", expand=True, padx=12, pady=12)
+        self.metrics_overlay = overlay
+        
+        def update():
+            if not overlay.winfo_exists():
+                return
+            lines = UI_METRICS.summary_lines() + MEM_PROFILE.summary_lines()
+            label.configure(text="\n".join(lines) or "No samples yet")
+            overlay.after(1000, update)
+        update()
+    
     def confirm_delete(self, med_name):
         return messagebox.askyesno(self.t("delete"), f"{self.t('delete_confirm')}\n\n{med_name}")
     
+    def remind_running_out(self):
+        """Warn once per login about medications with less than 3 days left"""
+        rows = SERVICE.running_out(self.current_user_id)
+        if not rows:
+            return
+        lines = [f"💊 {row['name']}: {row['days_remaining']} {self.t('days_left')} ({row['run_out']})"
+                 for row in rows[:8]]
+        self.show_dialog(self.t("running_out_title"),
+                         self.t("running_out_msg") + "\n\n" + "\n".join(lines), "warning")
+    
     def show_dialog(self, title, message, dialog_type="info"):
         """Show a custom dialog"""
         CustomDialog(self, title, message, dialog_type, self.t("ok"))
@@ -600,6 +842,7 @@ class MedicationApp(ctk.CTk):
     # ============================================
     # LOGIN SCREEN
     # ============================================
+    @MEM_PROFILE.checkpoint_after("login_view")
     def show_login(self):
         self.clear_window()
         
@@ -609,7 +852,7 @@ class MedicationApp(ctk.CTk):
         self.grid_columnconfigure(1, weight=1)
         
         # Left side - Branding
-        left_frame = ctk.CTkFrame(self, fg_color=COLORS["primary"], corner_radius=0)
+        left_frame = make_widget(ctk.CTkFrame, self, fg_color=C("primary"), corner_radius=0)
         left_frame.grid(row=0, column=0, sticky="nsew")
         
         brand_frame = ctk.CTkFrame(left_frame, fg_color="transparent")
@@ -618,93 +861,93 @@ class MedicationApp(ctk.CTk):
         ctk.CTkLabel(brand_frame, text="💊", font=font(80)).pack(pady=(0, 20))
         ctk.CTkLabel(brand_frame, text="Medication", font=font(38, "bold")).pack()
         ctk.CTkLabel(brand_frame, text="Health Reminder", font=font(38, "bold")).pack()
-        ctk.CTkLabel(brand_frame, text="Track • Remind • Stay Healthy", 
-                     font=font(16), text_color=COLORS["text"]).pack(pady=(25, 0))
+        make_widget(ctk.CTkLabel, brand_frame, text="Track • Remind • Stay Healthy", 
+                    font=font(16), text_color=C("text")).pack(pady=(25, 0))
         
         # Right side - Login Form
-        right_frame = ctk.CTkFrame(self, fg_color=COLORS["bg_dark"], corner_radius=0)
+        right_frame = make_widget(ctk.CTkFrame, self, fg_color=C("bg_dark"), corner_radius=0)
         right_frame.grid(row=0, column=1, sticky="nsew")
         
         # Language toggle at top right
         lang_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
         lang_frame.pack(anchor="ne", padx=20, pady=15)
         
-        ctk.CTkButton(lang_frame, text="A-", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      command=self.decrease_font_size,
-                      text_color=COLORS["text"]).pack(side="left", padx=(0, 8))
-        login_font_label = ctk.CTkLabel(lang_frame, text=self.font_percent_text(),
-                                        font=font(12, "bold"), text_color=COLORS["text_secondary"])
+        make_widget(ctk.CTkButton, lang_frame, text="A-", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    command=self.decrease_font_size,
+                    text_color=C("text")).pack(side="left", padx=(0, 8))
+        login_font_label = make_widget(ctk.CTkLabel, lang_frame, text=self.font_percent_text(),
+                                       font=font(12, "bold"), text_color=C("text_secondary"))
         login_font_label.pack(side="left", padx=(0, 8))
         self.register_font_label(login_font_label)
-        ctk.CTkButton(lang_frame, text="A+", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      command=self.increase_font_size,
-                      text_color=COLORS["text"]).pack(side="left", padx=(0, 12))
-        
-        ctk.CTkButton(lang_frame, text=self.theme_button_text(), width=100, height=scale(32),
-                      font=font(12, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      text_color=COLORS["text"],
-                      corner_radius=8, command=self.toggle_theme).pack(side="left", padx=(0, 10))
-        
-        ctk.CTkButton(lang_frame, text=self.t("language"), width=100, height=scale(32),
-                      font=font(12),
-                      fg_color=COLORS["bg_card"], hover_color=COLORS["accent"],
-                      text_color=COLORS["text"],
-                      corner_radius=8, command=self.toggle_language).pack(side="left")
+        make_widget(ctk.CTkButton, lang_frame, text="A+", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    command=self.increase_font_size,
+                    text_color=C("text")).pack(side="left", padx=(0, 12))
+        
+        make_widget(ctk.CTkButton, lang_frame, text=T(self.theme_button_text), width=100, height=scale(32),
+                    font=font(12, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    text_color=C("text"),
+                    corner_radius=8, command=self.toggle_theme).pack(side="left", padx=(0, 10))
+        
+        make_widget(ctk.CTkButton, lang_frame, text=T("language"), width=100, height=scale(32),
+                    font=font(12),
+                    fg_color=C("bg_card"), hover_color=C("accent"),
+                    text_color=C("text"),
+                    corner_radius=8, command=self.toggle_language).pack(side="left")
         
         form_frame = ctk.CTkFrame(right_frame, fg_color="transparent")
         form_frame.place(relx=0.5, rely=0.5, anchor="center")
         
-        ctk.CTkLabel(form_frame, text=self.t("welcome_back"), 
-                     font=font(32, "bold")).pack(pady=(0, 8))
-        ctk.CTkLabel(form_frame, text=self.t("sign_in_subtitle"), 
-                     font=font(14), text_color=COLORS["text_secondary"]).pack(pady=(0, 35))
+        make_widget(ctk.CTkLabel, form_frame, text=T("welcome_back"), 
+                    font=font(32, "bold")).pack(pady=(0, 8))
+        make_widget(ctk.CTkLabel, form_frame, text=T("sign_in_subtitle"), 
+                    font=font(14), text_color=C("text_secondary")).pack(pady=(0, 35))
         
         # Username field
-        ctk.CTkLabel(form_frame, text=self.t("username"), font=font(13, "bold")).pack(anchor="w", padx=5)
-        self.login_username = ctk.CTkEntry(form_frame, width=320, height=scale(48), 
-                                           placeholder_text=self.t("enter_username"),
-                                           fg_color=COLORS["bg_input"],
-                                           border_color=COLORS["border"],
-                                           corner_radius=10)
+        make_widget(ctk.CTkLabel, form_frame, text=T("username"), font=font(13, "bold")).pack(anchor="w", padx=5)
+        self.login_username = make_widget(ctk.CTkEntry, form_frame, width=320, height=scale(48), 
+                                          placeholder_text=T("enter_username"),
+                                          fg_color=C("bg_input"),
+                                          border_color=C("border"),
+                                          corner_radius=10)
         self.login_username.pack(pady=(5, 18))
         
         # Password field
-        ctk.CTkLabel(form_frame, text=self.t("password"), font=font(13, "bold")).pack(anchor="w", padx=5)
-        self.login_password = ctk.CTkEntry(form_frame, width=320, height=scale(48), 
-                                           placeholder_text=self.t("enter_password"),
-                                           show="●",
-                                           fg_color=COLORS["bg_input"],
-                                           border_color=COLORS["border"],
-                                           corner_radius=10)
+        make_widget(ctk.CTkLabel, form_frame, text=T("password"), font=font(13, "bold")).pack(anchor="w", padx=5)
+        self.login_password = make_widget(ctk.CTkEntry, form_frame, width=320, height=scale(48), 
+                                          placeholder_text=T("enter_password"),
+                                          show="●",
+                                          fg_color=C("bg_input"),
+                                          border_color=C("border"),
+                                          corner_radius=10)
         self.login_password.pack(pady=(5, 30))
         
         # Login button
-        ctk.CTkButton(form_frame, text=self.t("sign_in"), width=320, height=scale(50),
-                      font=font(16, "bold"),
-                      fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"],
-                      corner_radius=10, command=self.handle_login).pack(pady=(0, 20))
+        make_widget(ctk.CTkButton, form_frame, text=T("sign_in"), width=320, height=scale(50),
+                    font=font(16, "bold"),
+                    fg_color=C("primary"), hover_color=C("primary_hover"),
+                    corner_radius=10, command=self.handle_login).pack(pady=(0, 20))
         
         # Divider
         divider_frame = ctk.CTkFrame(form_frame, fg_color="transparent")
         divider_frame.pack(fill="x", pady=5)
-        ctk.CTkFrame(divider_frame, height=1, fg_color=COLORS["border"]).pack(side="left", fill="x", expand=True)
-        ctk.CTkLabel(divider_frame, text=f"  {self.t('new_here')}  ", text_color=COLORS["text_secondary"]).pack(side="left")
-        ctk.CTkFrame(divider_frame, height=1, fg_color=COLORS["border"]).pack(side="left", fill="x", expand=True)
+        make_widget(ctk.CTkFrame, divider_frame, height=1, fg_color=C("border")).pack(side="left", fill="x", expand=True)
+        make_widget(ctk.CTkLabel, divider_frame, text=T(lambda: f"  {self.t('new_here')}  "), text_color=C("text_secondary")).pack(side="left")
+        make_widget(ctk.CTkFrame, divider_frame, height=1, fg_color=C("border")).pack(side="left", fill="x", expand=True)
         
         # Go to Register button
-        ctk.CTkButton(form_frame, text=self.t("create_account_btn"), width=320, height=scale(50),
-                      font=font(16),
-                      fg_color="transparent", hover_color=COLORS["bg_input"],
-                      text_color=COLORS["text"],
-                      border_width=2, border_color=COLORS["border"],
-                      corner_radius=10, command=self.show_register).pack(pady=(15, 0))
+        make_widget(ctk.CTkButton, form_frame, text=T("create_account_btn"), width=320, height=scale(50),
+                    font=font(16),
+                    fg_color="transparent", hover_color=C("bg_input"),
+                    text_color=C("text"),
+                    border_width=2, border_color=C("border"),
+                    corner_radius=10, command=self.show_register).pack(pady=(15, 0))
         
         # Bind Enter key
         self.login_username.bind("<Return>", lambda e: self.login_password.focus())
@@ -728,17 +971,27 @@ class MedicationApp(ctk.CTk):
             self.login_password.focus()
             return
         
-        # Check credentials
-        user_id = None
-        for user in get_data_store()["users"]:
-            if user["username"] == username and user["password"] == password:
-                user_id = user["id"]
-                break
+        if self.login_pending:
+            return
         
+        # Check credentials on the writer thread, after any logout still being
+        # written; only this user's medications and history get loaded
+        self.login_pending = True
+        WRITER.submit(SERVICE.login, username, password,
+                      on_done=lambda user_id: self.on_logged_in(username, user_id),
+                      on_error=self.on_login_failed)
+    
+    def on_login_failed(self, error):
+        self.login_pending = False
+        self.on_change_failed(error)
+    
+    def on_logged_in(self, username, user_id):
+        self.login_pending = False
         if user_id:
             self.current_user_id = user_id
             self.current_username = username
             self.show_dashboard()
+            self.after(300, self.remind_running_out)
         else:
             self.show_dialog(self.t("login_failed"), self.t("invalid_credentials"), "error")
             self.login_password.delete(0, "end")
@@ -747,6 +1000,7 @@ class MedicationApp(ctk.CTk):
     # ============================================
     # REGISTER SCREEN
     # ============================================
+    @MEM_PROFILE.checkpoint_after("register_view")
     def show_register(self):
         self.clear_window()
         
@@ -755,41 +1009,41 @@ class MedicationApp(ctk.CTk):
         self.grid_columnconfigure(0, weight=1)
         
         # Main scrollable container
-        main_container = ctk.CTkScrollableFrame(self, fg_color=COLORS["bg_dark"])
+        main_container = make_widget(ctk.CTkScrollableFrame, self, fg_color=C("bg_dark"))
         main_container.grid(row=0, column=0, sticky="nsew")
         
         # Language toggle at top
         lang_frame = ctk.CTkFrame(main_container, fg_color="transparent")
         lang_frame.pack(anchor="ne", padx=20, pady=10)
         
-        ctk.CTkButton(lang_frame, text="A-", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      command=self.decrease_font_size,
-                      text_color=COLORS["text"]).pack(side="left", padx=(0, 8))
-        register_font_label = ctk.CTkLabel(lang_frame, text=self.font_percent_text(),
-                                           font=font(12, "bold"), text_color=COLORS["text_secondary"])
+        make_widget(ctk.CTkButton, lang_frame, text="A-", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    command=self.decrease_font_size,
+                    text_color=C("text")).pack(side="left", padx=(0, 8))
+        register_font_label = make_widget(ctk.CTkLabel, lang_frame, text=self.font_percent_text(),
+                                          font=font(12, "bold"), text_color=C("text_secondary"))
         register_font_label.pack(side="left", padx=(0, 8))
         self.register_font_label(register_font_label)
-        ctk.CTkButton(lang_frame, text="A+", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      command=self.increase_font_size,
-                      text_color=COLORS["text"]).pack(side="left", padx=(0, 12))
-        
-        ctk.CTkButton(lang_frame, text=self.theme_button_text(), width=100, height=scale(32),
-                      font=font(12, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      text_color=COLORS["text"],
-                      corner_radius=8, command=self.toggle_theme).pack(side="left", padx=(0, 10))
-        
-        ctk.CTkButton(lang_frame, text=self.t("language"), width=100, height=scale(32),
-                      font=font(12),
-                      fg_color=COLORS["bg_card"], hover_color=COLORS["accent"],
-                      text_color=COLORS["text"],
-                      corner_radius=8, command=self.toggle_language).pack(side="left")
+        make_widget(ctk.CTkButton, lang_frame, text="A+", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    command=self.increase_font_size,
+                    text_color=C("text")).pack(side="left", padx=(0, 12))
+        
+        make_widget(ctk.CTkButton, lang_frame, text=T(self.theme_button_text), width=100, height=scale(32),
+                    font=font(12, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    text_color=C("text"),
+                    corner_radius=8, command=self.toggle_theme).pack(side="left", padx=(0, 10))
+        
+        make_widget(ctk.CTkButton, lang_frame, text=T("language"), width=100, height=scale(32),
+                    font=font(12),
+                    fg_color=C("bg_card"), hover_color=C("accent"),
+                    text_color=C("text"),
+                    corner_radius=8, command=self.toggle_language).pack(side="left")
         
         # Center wrapper
         center_wrapper = ctk.CTkFrame(main_container, fg_color="transparent")
@@ -797,64 +1051,64 @@ class MedicationApp(ctk.CTk):
         
         # Header with icon
         ctk.CTkLabel(center_wrapper, text="🎉", font=font(60)).pack(pady=(0, 10))
-        ctk.CTkLabel(center_wrapper, text=self.t("create_account"), 
-                     font=font(32, "bold")).pack(pady=(0, 8))
-        ctk.CTkLabel(center_wrapper, text=self.t("join_subtitle"), 
-                     font=font(14), text_color=COLORS["text_secondary"]).pack(pady=(0, 30))
+        make_widget(ctk.CTkLabel, center_wrapper, text=T("create_account"), 
+                    font=font(32, "bold")).pack(pady=(0, 8))
+        make_widget(ctk.CTkLabel, center_wrapper, text=T("join_subtitle"), 
+                    font=font(14), text_color=C("text_secondary")).pack(pady=(0, 30))
         
         # Form card
-        form_card = ctk.CTkFrame(center_wrapper, fg_color=COLORS["bg_card"], corner_radius=15)
+        form_card = make_widget(ctk.CTkFrame, center_wrapper, fg_color=C("bg_card"), corner_radius=15)
         form_card.pack(padx=20)
         
         form_inner = ctk.CTkFrame(form_card, fg_color="transparent")
         form_inner.pack(padx=40, pady=35)
         
         # Username field
-        ctk.CTkLabel(form_inner, text=self.t("username"), font=font(13, "bold")).pack(anchor="w")
-        self.register_username = ctk.CTkEntry(form_inner, width=300, height=scale(45), 
-                                              placeholder_text=self.t("choose_username"),
-                                              fg_color=COLORS["bg_input"],
-                                              border_color=COLORS["border"],
-                                              corner_radius=10)
+        make_widget(ctk.CTkLabel, form_inner, text=T("username"), font=font(13, "bold")).pack(anchor="w")
+        self.register_username = make_widget(ctk.CTkEntry, form_inner, width=300, height=scale(45), 
+                                             placeholder_text=T("choose_username"),
+                                             fg_color=C("bg_input"),
+                                             border_color=C("border"),
+                                             corner_radius=10)
         self.register_username.pack(pady=(5, 15))
         
         # Password field
-        ctk.CTkLabel(form_inner, text=self.t("password"), font=font(13, "bold")).pack(anchor="w")
-        self.register_password = ctk.CTkEntry(form_inner, width=300, height=scale(45), 
-                                              placeholder_text=self.t("password_hint"),
-                                              show="●",
-                                              fg_color=COLORS["bg_input"],
-                                              border_color=COLORS["border"],
-                                              corner_radius=10)
+        make_widget(ctk.CTkLabel, form_inner, text=T("password"), font=font(13, "bold")).pack(anchor="w")
+        self.register_password = make_widget(ctk.CTkEntry, form_inner, width=300, height=scale(45), 
+                                             placeholder_text=T("password_hint"),
+                                             show="●",
+                                             fg_color=C("bg_input"),
+                                             border_color=C("border"),
+                                             corner_radius=10)
         self.register_password.pack(pady=(5, 15))
         
         # Confirm Password field
-        ctk.CTkLabel(form_inner, text=self.t("confirm_password"), font=font(13, "bold")).pack(anchor="w")
-        self.register_confirm = ctk.CTkEntry(form_inner, width=300, height=scale(45), 
-                                             placeholder_text=self.t("reenter_password"),
-                                             show="●",
-                                             fg_color=COLORS["bg_input"],
-                                             border_color=COLORS["border"],
-                                             corner_radius=10)
+        make_widget(ctk.CTkLabel, form_inner, text=T("confirm_password"), font=font(13, "bold")).pack(anchor="w")
+        self.register_confirm = make_widget(ctk.CTkEntry, form_inner, width=300, height=scale(45), 
+                                            placeholder_text=T("reenter_password"),
+                                            show="●",
+                                            fg_color=C("bg_input"),
+                                            border_color=C("border"),
+                                            corner_radius=10)
         self.register_confirm.pack(pady=(5, 25))
         
         # Register button
-        ctk.CTkButton(form_inner, text=self.t("create_account"), width=300, height=scale(48),
-                      font=font(15, "bold"),
-                      fg_color=COLORS["success"], hover_color=COLORS["success_hover"],
-                      corner_radius=10, command=self.handle_register).pack()
+        make_widget(ctk.CTkButton, form_inner, text=T("create_account"), width=300, height=scale(48),
+                    font=font(15, "bold"),
+                    fg_color=C("success"), hover_color=C("success_hover"),
+                    corner_radius=10, command=self.handle_register).pack()
         
         # Back to login section
         back_frame = ctk.CTkFrame(center_wrapper, fg_color="transparent")
         back_frame.pack(pady=(25, 0))
         
-        ctk.CTkLabel(back_frame, text=self.t("already_have_account"), 
-                     text_color=COLORS["text_secondary"]).pack(side="left", padx=(0, 10))
-        ctk.CTkButton(back_frame, text=self.t("sign_in_instead"), width=80, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"],
-                      text_color="#ffffff",
-                      corner_radius=8, command=self.show_login).pack(side="left")
+        make_widget(ctk.CTkLabel, back_frame, text=T("already_have_account"), 
+                    text_color=C("text_secondary")).pack(side="left", padx=(0, 10))
+        make_widget(ctk.CTkButton, back_frame, text=T("sign_in_instead"), width=80, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("primary"), hover_color=C("primary_hover"),
+                    text_color="#ffffff",
+                    corner_radius=8, command=self.show_login).pack(side="left")
         
         # Bind Enter key
         self.register_username.bind("<Return>", lambda e: self.register_password.focus())
@@ -896,22 +1150,15 @@ class MedicationApp(ctk.CTk):
             self.register_confirm.focus()
             return
         
-        # Check if username exists
-        for user in get_data_store()["users"]:
-            if user["username"].lower() == username.lower():
-                self.show_dialog(self.t("username_taken"), f"'{username}' {self.t('username_exists')}", "error")
-                self.register_username.focus()
-                return
-        
-        # Create new user
-        new_id = get_next_id("users")
-        new_user = {
-            "id": new_id,
-            "username": username,
-            "password": password
-        }
-        get_data_store()["users"].append(new_user)
-        save_data()
+        # Create new user (fails if the username exists)
+        WRITER.submit(SERVICE.register, username, password,
+                      on_done=lambda created: self.on_registered(username, created))
+    
+    def on_registered(self, username, created):
+        if not created:
+            self.show_dialog(self.t("username_taken"), f"'{username}' {self.t('username_exists')}", "error")
+            self.register_username.focus()
+            return
         
         self.show_dialog(self.t("account_created"), f"{self.t('welcome_user')}, {username}!\n\n{self.t('welcome_new_user')}", "success")
         self.show_login()
@@ -919,6 +1166,8 @@ class MedicationApp(ctk.CTk):
     # ============================================
     # DASHBOARD
     # ============================================
+    @MEM_PROFILE.checkpoint_after("dashboard")
+    @UI_METRICS.timed("show_dashboard")
     def show_dashboard(self):
         self.clear_window()
         
@@ -931,21 +1180,26 @@ class MedicationApp(ctk.CTk):
         self.create_sidebar()
         
         # Main content area
-        self.content_frame = ctk.CTkFrame(self, fg_color=COLORS["bg_dark"], corner_radius=0)
+        self.content_frame = make_widget(ctk.CTkFrame, self, fg_color=C("bg_dark"), corner_radius=0)
         self.content_frame.grid(row=0, column=1, sticky="nsew")
-        self.content_frame.grid_rowconfigure(1, weight=1)
+        self.content_frame.grid_rowconfigure(0, weight=1)
         self.content_frame.grid_columnconfigure(0, weight=1)
         
+        # Views are built once per session and hidden when not shown
+        self.views = {}
+        self.stale_views = set()
+        self.views_day = clock.today_key()
+        
         # Show medications by default
         self.show_medications_view()
     
     def create_sidebar(self):
         """Create the sidebar navigation"""
-        sidebar_container = ctk.CTkFrame(self, width=260, fg_color=COLORS["bg_card"], corner_radius=0)
+        sidebar_container = make_widget(ctk.CTkFrame, self, width=260, fg_color=C("bg_card"), corner_radius=0)
         sidebar_container.grid(row=0, column=0, sticky="nsew")
         sidebar_container.grid_propagate(False)
         
-        sidebar = ctk.CTkScrollableFrame(sidebar_container, width=260, fg_color=COLORS["bg_card"], corner_radius=0, label_text="")
+        sidebar = make_widget(ctk.CTkScrollableFrame, sidebar_container, width=260, fg_color=C("bg_card"), corner_radius=0, label_text="")
         sidebar.pack(fill="both", expand=True)
         sidebar.grid_columnconfigure(0, weight=1)
         
@@ -958,36 +1212,37 @@ class MedicationApp(ctk.CTk):
                      font=font(22, "bold")).pack(pady=(8, 0))
         
         # Divider
-        ctk.CTkFrame(sidebar, height=1, fg_color=COLORS["border"]).pack(fill="x", padx=25, pady=(0, 20))
+        make_widget(ctk.CTkFrame, sidebar, height=1, fg_color=C("border")).pack(fill="x", padx=25, pady=(0, 20))
         
         # User info card
-        user_frame = ctk.CTkFrame(sidebar, fg_color=COLORS["accent"], corner_radius=12)
+        user_frame = make_widget(ctk.CTkFrame, sidebar, fg_color=C("accent"), corner_radius=12)
         user_frame.pack(fill="x", padx=20, pady=(0, 25))
         
         user_inner = ctk.CTkFrame(user_frame, fg_color="transparent")
         user_inner.pack(fill="x", padx=15, pady=15)
         
-        ctk.CTkLabel(user_inner, text="👤", font=font(24), text_color=COLORS["text"]).pack(side="left")
-        ctk.CTkLabel(user_inner, text=self.current_username, 
-                     font=font(15, "bold"), text_color=COLORS["text"]).pack(side="left", padx=(10, 0))
+        make_widget(ctk.CTkLabel, user_inner, text="👤", font=font(24), text_color=C("text")).pack(side="left")
+        make_widget(ctk.CTkLabel, user_inner, text=self.current_username, 
+                    font=font(15, "bold"), text_color=C("text")).pack(side="left", padx=(10, 0))
         
         # Navigation buttons
         self.nav_buttons = {}
         
         nav_items = [
-            ("medications", self.t("my_medications"), self.show_medications_view),
-            ("add", self.t("add_medication"), self.show_add_view),
-            ("history", self.t("history"), self.show_history_view),
+            ("medications", T("my_medications"), self.show_medications_view),
+            ("add", T("add_medication"), self.show_add_view),
+            ("history", T("history"), self.show_history_view),
+            ("calendar", T("calendar"), self.show_calendar_view),
         ]
         
         for key, text, command in nav_items:
-            btn = ctk.CTkButton(sidebar, text=text, width=220, height=scale(48),
-                               font=font(14),
-                               fg_color="transparent", 
-                               hover_color=COLORS["accent"],
-                               anchor="w", corner_radius=10,
-                               text_color=COLORS["text"],
-                               command=command)
+            btn = make_widget(ctk.CTkButton, sidebar, text=text, width=220, height=scale(48),
+                             font=font(14),
+                             fg_color="transparent", 
+                             hover_color=C("accent"),
+                             anchor="w", corner_radius=10,
+                             text_color=C("text"),
+                             command=command)
             btn.pack(pady=4, padx=20)
             self.nav_buttons[key] = btn
         
@@ -1004,49 +1259,50 @@ class MedicationApp(ctk.CTk):
         font_frame = ctk.CTkFrame(sidebar, fg_color="transparent")
         font_frame.pack(pady=(0, scale(12)))
         
-        ctk.CTkButton(font_frame, text="A-", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      text_color=COLORS["text"],
-                      command=self.decrease_font_size).pack(side="left", padx=6)
-        sidebar_font_label = ctk.CTkLabel(font_frame, text=self.font_percent_text(),
-                                          font=font(12, "bold"), text_color=COLORS["text_secondary"])
+        make_widget(ctk.CTkButton, font_frame, text="A-", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    text_color=C("text"),
+                    command=self.decrease_font_size).pack(side="left", padx=6)
+        sidebar_font_label = make_widget(ctk.CTkLabel, font_frame, text=self.font_percent_text(),
+                                         font=font(12, "bold"), text_color=C("text_secondary"))
         sidebar_font_label.pack(side="left", padx=4)
         self.register_font_label(sidebar_font_label)
-        ctk.CTkButton(font_frame, text="A+", width=60, height=scale(32),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=8, border_width=1, border_color=COLORS["border"],
-                      text_color=COLORS["text"],
-                      command=self.increase_font_size).pack(side="left", padx=6)
+        make_widget(ctk.CTkButton, font_frame, text="A+", width=60, height=scale(32),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, border_width=1, border_color=C("border"),
+                    text_color=C("text"),
+                    command=self.increase_font_size).pack(side="left", padx=6)
         
         # Theme toggle
-        ctk.CTkButton(sidebar, text=self.theme_button_text(), width=220, height=scale(40),
-                      font=font(13, "bold"),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      corner_radius=10, text_color=COLORS["text"],
-                      command=self.toggle_theme).pack(pady=(0, 10), padx=20)
+        make_widget(ctk.CTkButton, sidebar, text=T(self.theme_button_text), width=220, height=scale(40),
+                    font=font(13, "bold"),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=10, text_color=C("text"),
+                    command=self.toggle_theme).pack(pady=(0, 10), padx=20)
         
         # Language toggle
-        ctk.CTkButton(sidebar, text=self.t("language"), width=220, height=scale(40),
-                      font=font(13),
-                      fg_color=COLORS["bg_input"], hover_color=COLORS["accent"],
-                      text_color=COLORS["text"],
-                      corner_radius=10, command=self.toggle_language).pack(pady=(0, 10), padx=20)
+        make_widget(ctk.CTkButton, sidebar, text=T("language"), width=220, height=scale(40),
+                    font=font(13),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    text_color=C("text"),
+                    corner_radius=10, command=self.toggle_language).pack(pady=(0, 10), padx=20)
         
         # Version info
-        ctk.CTkLabel(sidebar, text=self.t("version"), font=font(11),
-                     text_color=COLORS["text_secondary"]).pack(pady=(0, 10))
+        make_widget(ctk.CTkLabel, sidebar, text=T("version"), font=font(11),
+                    text_color=C("text_secondary")).pack(pady=(0, 10))
         
         # Logout button
-        ctk.CTkButton(sidebar, text=self.t("sign_out"), width=220, height=scale(48),
-                      font=font(14),
-                      fg_color=COLORS["error"], hover_color="#dc2626",
-                      corner_radius=10, command=self.logout).pack(pady=(0, 25), padx=20)
+        make_widget(ctk.CTkButton, sidebar, text=T("sign_out"), width=220, height=scale(48),
+                    font=font(14),
+                    fg_color=C("error"), hover_color="#dc2626",
+                    corner_radius=10, command=self.logout).pack(pady=(0, 25), padx=20)
     
     def set_active_nav(self, active_key):
         """Update navigation button styles"""
+        self.current_view = active_key
         for key, btn in self.nav_buttons.items():
             if key == active_key:
                 btn.configure(fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"],
@@ -1055,13 +1311,56 @@ class MedicationApp(ctk.CTk):
                 btn.configure(fg_color="transparent", hover_color=COLORS["accent"],
                               text_color=COLORS["text"])
     
-    def clear_content(self):
-        """Clear the content frame"""
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
+    def new_view(self, key):
+        """Create the frame of a dashboard view and cache it"""
+        view = ctk.CTkFrame(self.content_frame, fg_color="transparent", corner_radius=0)
+        view.grid(row=0, column=0, sticky="nsew")
+        view.grid_rowconfigure(1, weight=1)
+        view.grid_columnconfigure(0, weight=1)
+        self.views[key] = view
+        return view
+    
+    def show_cached_view(self, key):
+        """Show an already built view, refreshing it if its data is stale.
+        Returns False if the view still has to be built."""
+        self.set_active_nav(key)
+        for other_key, frame in self.views.items():
+            if other_key != key:
+                frame.grid_remove()
+        
+        view = self.views.get(key)
+        if view is None:
+            return False
+        
+        # Today's progress and the history list depend on the date
+        today = clock.today_key()
+        if today != self.views_day:
+            self.views_day = today
+            self.stale_views.update(self.views)
+        
+        if key in self.stale_views:
+            self.stale_views.discard(key)
+            if key == "medications":
+                self.refresh_medications()
+            elif key == "history":
+                self.refresh_history()
+            elif key == "calendar":
+                self.refresh_calendar()
+        view.grid()
+        return True
     
     def logout(self):
         """Sign out and return to login"""
+        self.cancel_compaction()
+        for job in self.search_jobs.values():
+            self.after_cancel(job)
+        self.search_jobs = {}
+        self.current_view = None
+        self.views = {}
+        # Runs after this user's queued writes; archiving writes the
+        # history segments, so it stays off the Tk thread. It takes the
+        # lock itself and not while writing, so reads here never wait on the disk
+        WRITER.submit(SERVICE.logout, lock=False)
         self.current_user_id = None
         self.current_username = None
         self.show_login()
@@ -1069,82 +1368,101 @@ class MedicationApp(ctk.CTk):
     # ============================================
     # MEDICATIONS VIEW
     # ============================================
+    @MEM_PROFILE.checkpoint_after("medications_view")
     def show_medications_view(self):
-        self.set_active_nav("medications")
-        self.clear_content()
+        if self.show_cached_view("medications"):
+            return
+        view = self.new_view("medications")
         
         # Header
-        header = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        header = ctk.CTkFrame(view, fg_color="transparent")
         header.grid(row=0, column=0, sticky="ew", padx=35, pady=(35, 25))
         
-        ctk.CTkLabel(header, text=self.t("my_medications_title"), 
-                     font=font(28, "bold")).pack(side="left")
+        make_widget(ctk.CTkLabel, header, text=T("my_medications_title"), 
+                    font=font(28, "bold")).pack(side="left")
+        
+        self.med_search = make_widget(ctk.CTkEntry, header, width=220, height=scale(42),
+                                      placeholder_text=T("search_meds"),
+                                      fg_color=C("bg_input"), border_color=C("border"),
+                                      corner_radius=10)
+        self.med_search.pack(side="left", padx=(20, 0))
+        self.med_search.bind("<KeyRelease>", lambda e: self.debounce_search("medications", self.apply_med_search))
+        self.med_query = ""
         
-        ctk.CTkButton(header, text=self.t("refresh"), width=120, height=scale(42),
-                      fg_color=COLORS["bg_card"], hover_color=COLORS["accent"],
-                      border_width=1, border_color=COLORS["border"],
-                      text_color=COLORS["text"],
-                      corner_radius=10, command=self.refresh_medications).pack(side="right")
+        make_widget(ctk.CTkButton, header, text=T("refresh"), width=120, height=scale(42),
+                    fg_color=C("bg_card"), hover_color=C("accent"),
+                    border_width=1, border_color=C("border"),
+                    text_color=C("text"),
+                    corner_radius=10, command=self.refresh_medications).pack(side="right")
+        
+        make_widget(ctk.CTkButton, header, text=T("take_all_due"), width=160, height=scale(42),
+                    fg_color=C("primary"), hover_color=C("primary_hover"),
+                    corner_radius=10, command=self.take_all_due).pack(side="right", padx=(0, 10))
         
         # Medications container
-        meds_container = ctk.CTkScrollableFrame(self.content_frame, fg_color="transparent")
+        meds_container = ctk.CTkScrollableFrame(view, fg_color="transparent")
         meds_container.grid(row=1, column=0, sticky="nsew", padx=35, pady=(0, 35))
         
         self.meds_container = meds_container
         self.refresh_medications()
     
+    def get_current_medications(self):
+        """Medications of the logged in user with stock and today's progress"""
+        return SERVICE.get_medications(self.current_user_id)
+    
+    @UI_METRICS.timed("refresh_medications")
     def refresh_medications(self):
         """Refresh the medications list"""
         for widget in self.meds_container.winfo_children():
             widget.destroy()
+        self.med_cards = {}
         
-        # Get today's date string for comparison
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        # Get medications for current user
-        meds = []
-        for med in get_data_store()["medications"]:
-            if med["user_id"] == self.current_user_id:
-                current_stock = med["total_pills"]
-                daily_dose = med["pills_per_day"]
-                
-                if daily_dose > 0:
-                    days_remaining = int(current_stock / daily_dose)
-                else:
-                    days_remaining = 999
-                
-                is_low_stock = days_remaining < 3
-                
-                # Count pills taken today for this medication
-                taken_today = 0
-                for h in get_data_store()["history"]:
-                    if h["med_id"] == med["id"] and h["taken_at"].startswith(today):
-                        taken_today += 1
-                
-                med_data = med.copy()
-                med_data["days_remaining"] = days_remaining
-                med_data["alert"] = is_low_stock
-                med_data["taken_today"] = taken_today
-                meds.append(med_data)
+        if self.med_query:
+            meds = SERVICE.search_medications(self.current_user_id, self.med_query)
+            if not meds:
+                make_widget(ctk.CTkLabel, self.meds_container, text=T("no_matches"),
+                            font=font(16), text_color=C("text_secondary")).pack(pady=40)
+                return
+        else:
+            meds = self.get_current_medications()
         
         if not meds:
-            empty_frame = ctk.CTkFrame(self.meds_container, fg_color=COLORS["bg_card"], corner_radius=15)
+            empty_frame = make_widget(ctk.CTkFrame, self.meds_container, fg_color=C("bg_card"), corner_radius=15)
             empty_frame.pack(fill="x", pady=10)
             
             ctk.CTkLabel(empty_frame, text="📭", font=font(50)).pack(pady=(40, 15))
-            ctk.CTkLabel(empty_frame, text=self.t("no_medications"), 
-                         font=font(20, "bold")).pack()
-            ctk.CTkLabel(empty_frame, text=self.t("click_add"),
-                         text_color=COLORS["text_secondary"]).pack(pady=(8, 40))
+            make_widget(ctk.CTkLabel, empty_frame, text=T("no_medications"), 
+                        font=font(20, "bold")).pack()
+            make_widget(ctk.CTkLabel, empty_frame, text=T("click_add"),
+                        text_color=C("text_secondary")).pack(pady=(8, 40))
             return
         
         for med in meds:
             self.create_medication_card(med)
     
-    def create_medication_card(self, med):
+    def debounce_search(self, view, apply, delay=SEARCH_DELAY_MS):
+        """Run apply once typing in a search box has paused for delay ms"""
+        job = self.search_jobs.pop(view, None)
+        if job is not None:
+            self.after_cancel(job)
+        self.search_jobs[view] = self.after(delay, apply)
+    
+    def apply_med_search(self):
+        self.search_jobs.pop("medications", None)
+        query = self.med_search.get().strip()
+        if query != self.med_query:
+            self.med_query = query
+            self.refresh_medications()
+    
+    @UI_METRICS.timed("create_medication_card")
+    def create_medication_card(self, med, before=None):
         """Create a card for each medication"""
-        card = ctk.CTkFrame(self.meds_container, fg_color=COLORS["bg_card"], corner_radius=15)
-        card.pack(fill="x", pady=8)
+        card = make_widget(ctk.CTkFrame, self.meds_container, fg_color=C("bg_card"), corner_radius=15)
+        if before is not None:
+            card.pack(fill="x", pady=8, before=before)
+        else:
+            card.pack(fill="x", pady=8)
+        self.med_cards[med["id"]] = card
         
         inner = ctk.CTkFrame(card, fg_color="transparent")
         inner.pack(fill="both", expand=True, padx=25, pady=20)
@@ -1158,45 +1476,50 @@ class MedicationApp(ctk.CTk):
         
         # Status badge
         if med['alert']:
-            status_color = COLORS["warning"]
-            status_text = self.t("low_stock")
+            status_color = C("warning")
+            status_text = T("low_stock")
         else:
-            status_color = COLORS["success"]
-            status_text = self.t("in_stock_status")
+            status_color = C("success")
+            status_text = T("in_stock_status")
         
-        status_badge = ctk.CTkFrame(top_row, fg_color=status_color, corner_radius=8)
+        status_badge = make_widget(ctk.CTkFrame, top_row, fg_color=status_color, corner_radius=8)
         
         actions = ctk.CTkFrame(top_row, fg_color="transparent")
         actions.pack(side="right", padx=(10, 0))
         
-        delete_btn = ctk.CTkButton(actions, text=self.t("delete"), width=80, height=scale(32),
-                                   fg_color=COLORS["error"], hover_color="#dc2626",
-                                   corner_radius=8, font=font(12, "bold"),
-                                   text_color="#ffffff",
-                                   command=lambda m=med: self.delete_medication(m))
+        delete_btn = make_widget(ctk.CTkButton, actions, text=T("delete"), width=80, height=scale(32),
+                                 fg_color=C("error"), hover_color="#dc2626",
+                                 corner_radius=8, font=font(12, "bold"),
+                                 text_color="#ffffff",
+                                 command=lambda m=med: self.delete_medication(m))
         delete_btn.pack(side="right")
         
+        make_widget(ctk.CTkButton, actions, text=T("refill"), width=80, height=scale(32),
+                    fg_color=C("bg_input"), hover_color=C("accent"),
+                    corner_radius=8, font=font(12, "bold"), text_color=C("text"),
+                    command=lambda m=med: self.refill_medication(m)).pack(side="right", padx=(0, 8))
+        
         status_badge.pack(side="right", padx=(0, 10))
-        ctk.CTkLabel(status_badge, text=status_text, 
-                     font=font(12, "bold"), text_color="#ffffff").pack(padx=14, pady=6)
+        make_widget(ctk.CTkLabel, status_badge, text=status_text, 
+                    font=font(12, "bold"), text_color="#ffffff").pack(padx=14, pady=6)
         
         # Info row
         info_frame = ctk.CTkFrame(inner, fg_color="transparent")
         info_frame.pack(fill="x", pady=(12, 15))
         
         info_items = [
-            (f"💊 {med['total_pills']}", self.t("in_stock")),
-            (f"📅 {med['pills_per_day']}", self.t("per_day")),
-            (f"⏳ {med['days_remaining']}", self.t("days_left")),
+            (f"💊 {med['total_pills']}", T("in_stock")),
+            (f"📅 {med['pills_per_day']}", T("per_day")),
+            (f"⏳ {med['days_remaining']}", T("days_left")),
         ]
         
         for value, label in info_items:
-            item_frame = ctk.CTkFrame(info_frame, fg_color=COLORS["bg_input"], corner_radius=8)
+            item_frame = make_widget(ctk.CTkFrame, info_frame, fg_color=C("bg_input"), corner_radius=8)
             item_frame.pack(side="left", padx=(0, 10))
             
             ctk.CTkLabel(item_frame, text=value, font=font(14, "bold")).pack(padx=15, pady=(10, 2))
-            ctk.CTkLabel(item_frame, text=label, font=font(11),
-                         text_color=COLORS["text_secondary"]).pack(padx=15, pady=(0, 10))
+            make_widget(ctk.CTkLabel, item_frame, text=label, font=font(11),
+                        text_color=C("text_secondary")).pack(padx=15, pady=(0, 10))
         
         # Today's progress section
         progress_frame = ctk.CTkFrame(inner, fg_color="transparent")
@@ -1208,29 +1531,29 @@ class MedicationApp(ctk.CTk):
         
         # Progress indicator
         if taken_today >= daily_dose:
-            progress_color = COLORS["success"]
-            progress_text = f"{self.t('done_today')} ({taken_today}/{daily_dose})"
+            progress_color = C("success")
+            progress_text = T(lambda: f"{self.t('done_today')} ({taken_today}/{daily_dose})")
         elif taken_today > 0:
-            progress_color = COLORS["warning"]
-            progress_text = f"⏰ {taken_today}/{daily_dose} {self.t('taken_today')} ({remaining_today} {self.t('more_to_go')})"
+            progress_color = C("warning")
+            progress_text = T(lambda: f"⏰ {taken_today}/{daily_dose} {self.t('taken_today')} ({remaining_today} {self.t('more_to_go')})")
         else:
-            progress_color = COLORS["text_secondary"]
-            progress_text = f"📋 0/{daily_dose} {self.t('taken_today')}"
+            progress_color = C("text_secondary")
+            progress_text = T(lambda: f"📋 0/{daily_dose} {self.t('taken_today')}")
         
         # Today's progress card
-        today_card = ctk.CTkFrame(progress_frame, fg_color=COLORS["bg_input"], corner_radius=8)
+        today_card = make_widget(ctk.CTkFrame, progress_frame, fg_color=C("bg_input"), corner_radius=8)
         today_card.pack(fill="x")
         
         today_inner = ctk.CTkFrame(today_card, fg_color="transparent")
         today_inner.pack(fill="x", padx=15, pady=12)
         
-        ctk.CTkLabel(today_inner, text=self.t("todays_progress"), 
-                     font=font(12, "bold"),
-                     text_color=COLORS["text_secondary"]).pack(side="left")
+        make_widget(ctk.CTkLabel, today_inner, text=T("todays_progress"), 
+                    font=font(12, "bold"),
+                    text_color=C("text_secondary")).pack(side="left")
         
-        ctk.CTkLabel(today_inner, text=progress_text, 
-                     font=font(13, "bold"),
-                     text_color=progress_color).pack(side="right")
+        make_widget(ctk.CTkLabel, today_inner, text=progress_text, 
+                    font=font(13, "bold"),
+                    text_color=progress_color).pack(side="right")
         
         # Take button - disabled if already completed for today
         btn_frame = ctk.CTkFrame(inner, fg_color="transparent")
@@ -1238,83 +1561,260 @@ class MedicationApp(ctk.CTk):
         
         if taken_today >= daily_dose:
             # Already completed - show disabled-style button
-            ctk.CTkButton(btn_frame, text=self.t("completed_today"), width=160, height=scale(42),
-                          fg_color=COLORS["success"], hover_color=COLORS["success"],
-                          corner_radius=10, font=font(14, "bold"),
-                          state="disabled").pack(side="right")
+            make_widget(ctk.CTkButton, btn_frame, text=T("completed_today"), width=160, height=scale(42),
+                        fg_color=C("success"), hover_color=C("success"),
+                        corner_radius=10, font=font(14, "bold"),
+                        state="disabled").pack(side="right")
         else:
-            ctk.CTkButton(btn_frame, text=self.t("take_dose"), width=140, height=scale(42),
-                          fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"],
-                          corner_radius=10, font=font(14, "bold"),
-                          command=lambda m=med: self.take_medication(m)).pack(side="right")
+            make_widget(ctk.CTkButton, btn_frame, text=T("take_dose"), width=140, height=scale(42),
+                        fg_color=C("primary"), hover_color=C("primary_hover"),
+                        corner_radius=10, font=font(14, "bold"),
+                        command=lambda m=med: self.take_medication(m)).pack(side="right")
     
     def take_medication(self, med):
         """Record taking a medication"""
-        for m in get_data_store()["medications"]:
-            if m["id"] == med["id"]:
-                m["total_pills"] = max(0, m["total_pills"] - 1)
-                new_stock = m["total_pills"]
-                
-                # Add history entry
-                history_entry = {
-                    "med_id": med["id"],
-                    "medication_name": med["name"],
-                    "taken_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                get_data_store()["history"].append(history_entry)
-                save_data()
-                
-                self.refresh_medications()
-                self.show_dialog(self.t("dose_recorded"), 
-                               f"{self.t('took_dose')} '{med['name']}'.\n\n{self.t('remaining')} {new_stock} {self.t('pills')}", 
-                               "success")
-                return
+        self.preview_medication(med, taken=1, stock_change=-1)
+        WRITER.submit(SERVICE.take_medication, self.current_user_id, med["id"],
+                      on_done=lambda result: self.on_dose_taken(med, *result))
+    
+    def on_dose_taken(self, med, ok, new_stock):
+        if not ok:
+            self.on_change_failed(None, "record_failed")
+            return
+        
+        self.show_dialog(self.t("dose_recorded"), 
+                       f"{self.t('took_dose')} '{med['name']}'.\n\n{self.t('remaining')} {new_stock} {self.t('pills')}", 
+                       "success")
+    
+    def refill_medication(self, med):
+        """Ask for the number of pills added and record a refill"""
+        dialog = ctk.CTkInputDialog(title=f"{self.t('refill')} - {med['name']}",
+                                    text=self.t("refill_prompt"))
+        value = dialog.get_input()
+        if value is None:
+            return
+        
+        try:
+            amount = int(value.strip())
+            if amount <= 0:
+                raise ValueError()
+        except ValueError:
+            self.show_dialog(self.t("invalid_input"), self.t("refill_amount_invalid"), "error")
+            return
+        
+        # Writes a ledger entry; the card updates from the change event
+        self.preview_medication(med, stock_change=amount)
+        WRITER.submit(SERVICE.refill_medication, self.current_user_id, med["id"], amount,
+                      on_done=lambda result: self.on_refilled(med, *result))
+    
+    def on_refilled(self, med, ok, new_stock):
+        if not ok:
+            self.on_change_failed(None, "record_failed")
+            return
+        
+        self.show_dialog(self.t("stock_updated"),
+                         f"'{med['name']}'\n\n{self.t('remaining')} {new_stock} {self.t('pills')}",
+                         "success")
+    
+    def on_data_change(self, event):
+        """Update only the rows touched by a database change event"""
+        if self.current_user_id is None or event.user_id != self.current_user_id:
+            return
+        
+        if "medications" in self.views:
+            # Cards are cheap to patch, so keep this view current even when hidden
+            if event.type in (database.DOSE_RECORDED, database.MEDICATION_UPDATED):
+                self.update_medication_cards(event.med_ids)
+            elif event.type == database.MEDICATION_ADDED:
+                if not self.med_cards or self.med_query:
+                    # Replace the empty-state placeholder, or filter the new card
+                    self.refresh_medications()
+                    return
+                meds = {m["id"]: m for m in self.get_current_medications()}
+                for med_id in event.med_ids:
+                    if med_id in meds:
+                        self.create_medication_card(meds[med_id])
+            elif event.type == database.MEDICATION_DELETED:
+                for med_id in event.med_ids:
+                    card = self.med_cards.pop(med_id, None)
+                    if card is not None:
+                        card.destroy()
+                if not self.med_cards:
+                    self.refresh_medications()
+        
+        if "history" in self.views and event.type in (database.DOSE_RECORDED, database.MEDICATION_DELETED):
+            if self.current_view == "history":
+                self.refresh_history()
+            else:
+                self.stale_views.add("history")
         
-        self.show_dialog(self.t("error"), self.t("record_failed"), "error")
+        if "calendar" in self.views and event.type in (database.DOSE_RECORDED, database.MEDICATION_ADDED,
+                                                       database.MEDICATION_DELETED):
+            if self.current_view == "calendar":
+                self.refresh_calendar()
+            else:
+                self.stale_views.add("calendar")
+    
+    def preview_medication(self, med, taken=0, stock_change=0):
+        """
+        Show the expected result of a submitted change on the card right
+        away; the change event (or on_change_failed) replaces it with the
+        stored values.
+        """
+        card = self.med_cards.get(med["id"])
+        if card is None:
+            return
+        preview = dict(med)
+        preview["total_pills"] = max(0, med["total_pills"] + stock_change)
+        preview["taken_today"] = med["taken_today"] + taken
+        preview["days_remaining"] = days_remaining(preview)
+        preview["alert"] = preview["days_remaining"] < 3
+        self.create_medication_card(preview, before=card)
+        card.destroy()
+    
+    def on_change_failed(self, error=None, message_key="change_failed"):
+        """A submitted change was rejected or raised: drop the previews and tell the user"""
+        if "medications" in self.views:
+            self.refresh_medications()
+        self.show_dialog(self.t("error"), self.t(message_key), "error")
+    
+    def on_save_failed(self, error):
+        """The writer thread could not write the data files; they stay queued"""
+        self.show_dialog(self.t("error"), f"{self.t('save_failed')}\n{error}\n\n{self.t('save_retry')}", "error")
+    
+    def update_medication_cards(self, med_ids):
+        """Rebuild the cards of the given medications in place"""
+        meds = {m["id"]: m for m in self.get_current_medications()}
+        for med_id in med_ids:
+            old_card = self.med_cards.get(med_id)
+            if old_card is None or med_id not in meds:
+                continue
+            self.create_medication_card(meds[med_id], before=old_card)
+            old_card.destroy()
+    
+    def take_all_due(self):
+        """Record one dose of every medication not yet completed today"""
+        due = [m for m in self.get_current_medications() if m["taken_today"] < m["pills_per_day"]]
+        if not due:
+            self.show_dialog(self.t("take_all_due"), self.t("nothing_due"), "info")
+            return
+        
+        for med in due:
+            self.preview_medication(med, taken=1, stock_change=-1)
+        WRITER.submit(SERVICE.take_medications, self.current_user_id, [(m["id"], 1) for m in due],
+                      on_done=lambda result: self.on_all_due_taken(due, *result))
+    
+    def on_all_due_taken(self, due, ok, new_stocks):
+        if not ok:
+            self.on_change_failed(None, "record_failed")
+            return
+        
+        lines = [f"• {m['name']} — {self.t('remaining')} {new_stocks[m['id']]} {self.t('pills')}" for m in due]
+        self.show_dialog(self.t("dose_recorded"), "\n".join(lines), "success")
     
     def delete_medication(self, med):
         """Remove a medication and related history"""
         if not self.confirm_delete(med["name"]):
             return
         
-        data = get_data_store()
-        data["medications"] = [m for m in data["medications"] if m["id"] != med["id"]]
-        data["history"] = [h for h in data["history"] if h.get("med_id") != med["id"]]
-        save_data()
-        self.refresh_medications()
+        # Remove the card now; the tombstone is written on the writer thread
+        # and history rows are removed later by compact_storage
+        card = self.med_cards.pop(med["id"], None)
+        if card is not None:
+            card.destroy()
+        WRITER.submit(SERVICE.delete_medication, self.current_user_id, med["id"],
+                      on_done=self.on_deleted)
+    
+    def on_deleted(self, deleted):
+        if not deleted:
+            self.on_change_failed()
+            return
+        self.schedule_compaction()
         self.show_dialog(self.t("success"), self.t("delete_success"), "success")
     
+    def schedule_compaction(self):
+        """Compact storage once the app has been quiet for a few seconds"""
+        if self.compact_job is not None:
+            self.after_cancel(self.compact_job)
+        self.compact_job = self.after(COMPACT_DELAY_MS, self.compact_storage)
+    
+    def cancel_compaction(self):
+        if self.compact_job is not None:
+            self.after_cancel(self.compact_job)
+            self.compact_job = None
+    
+    def compact_storage(self):
+        """Drop tombstoned medications and their history, then save"""
+        self.cancel_compaction()
+        WRITER.submit(SERVICE.compact)
+    
+    def backup_storage(self):
+        """Hourly incremental snapshot of the data files, then drop old ones"""
+        # Reads, hashes and writes every data file: done on the writer thread,
+        # once the queued saves are on disk. Only that thread writes the
+        # files, so the backup needs no lock and never holds up reads here
+        WRITER.submit(self.take_backup, on_error=self.on_backup_failed, lock=False, write_first=True)
+        self.after(BACKUP_INTERVAL_MS, self.backup_storage)
+    
+    @staticmethod
+    def take_backup():
+        backup.take_snapshot()
+        backup.prune()
+    
+    def on_backup_failed(self, error):
+        print(f"Backup failed: {error}")
+    
+    def on_close(self):
+        """Checkpoint pending deletes and finish queued writes before the window closes"""
+        self.compact_storage()
+        if not WRITER.stop():
+            print(f"Unsaved data files: {', '.join(WRITER.unsaved_files())}")
+        self.destroy()
+    
     # ============================================
     # ADD MEDICATION VIEW
     # ============================================
+    @MEM_PROFILE.checkpoint_after("add_view")
     def show_add_view(self):
-        self.set_active_nav("add")
-        self.clear_content()
+        if self.show_cached_view("add"):
+            self.after(100, self.add_name_entry.focus)
+            return
+        view = self.new_view("add")
         
         # Header
-        header = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        header = ctk.CTkFrame(view, fg_color="transparent")
         header.grid(row=0, column=0, sticky="ew", padx=35, pady=(35, 25))
         
-        ctk.CTkLabel(header, text=self.t("add_new_medication"), 
-                     font=font(28, "bold")).pack(anchor="w")
-        ctk.CTkLabel(header, text=self.t("add_subtitle"),
-                     font=font(14), text_color=COLORS["text_secondary"]).pack(anchor="w", pady=(5, 0))
+        make_widget(ctk.CTkLabel, header, text=T("add_new_medication"), 
+                    font=font(28, "bold")).pack(anchor="w")
+        make_widget(ctk.CTkLabel, header, text=T("add_subtitle"),
+                    font=font(14), text_color=C("text_secondary")).pack(anchor="w", pady=(5, 0))
         
         # Form container
-        form_container = ctk.CTkFrame(self.content_frame, fg_color=COLORS["bg_card"], corner_radius=15)
+        form_container = make_widget(ctk.CTkFrame, view, fg_color=C("bg_card"), corner_radius=15)
         form_container.grid(row=1, column=0, sticky="new", padx=35, pady=(0, 35))
         
         form = ctk.CTkFrame(form_container, fg_color="transparent")
         form.pack(padx=40, pady=40)
         
         # Medication name
-        ctk.CTkLabel(form, text=self.t("medication_name"), font=font(14, "bold")).pack(anchor="w")
-        self.add_name_entry = ctk.CTkEntry(form, width=450, height=scale(48), 
-                                           placeholder_text=self.t("medication_placeholder"),
-                                           fg_color=COLORS["bg_input"],
-                                           border_color=COLORS["border"],
-                                           corner_radius=10)
+        make_widget(ctk.CTkLabel, form, text=T("medication_name"), font=font(14, "bold")).pack(anchor="w")
+        self.add_name_entry = make_widget(ctk.CTkEntry, form, width=450, height=scale(48), 
+                                          placeholder_text=T("medication_placeholder"),
+                                          fg_color=C("bg_input"),
+                                          border_color=C("border"),
+                                          corner_radius=10)
         self.add_name_entry.pack(pady=(8, 25))
+        self.add_name_entry.bind("<KeyRelease>", self.on_name_typed)
+        
+        # Name suggestions, shown under the name field while typing
+        self.name_suggestions = make_widget(ctk.CTkFrame, form, fg_color=C("bg_input"), corner_radius=10)
+        self.suggestion_buttons = [
+            make_widget(ctk.CTkButton, self.name_suggestions, text="", height=scale(32), anchor="w",
+                        fg_color="transparent", hover_color=C("accent"), text_color=C("text"),
+                        corner_radius=8)
+            for _ in range(SUGGESTION_COUNT)
+        ]
         
         # Two column layout
         num_frame = ctk.CTkFrame(form, fg_color="transparent")
@@ -1323,47 +1823,87 @@ class MedicationApp(ctk.CTk):
         # Total pills
         left_col = ctk.CTkFrame(num_frame, fg_color="transparent")
         left_col.pack(side="left", padx=(0, 25))
-        ctk.CTkLabel(left_col, text=self.t("total_pills"), font=font(14, "bold")).pack(anchor="w")
-        self.add_stock_entry = ctk.CTkEntry(left_col, width=212, height=scale(48),
-                                            placeholder_text=self.t("pills_placeholder"),
-                                            fg_color=COLORS["bg_input"],
-                                            border_color=COLORS["border"],
-                                            corner_radius=10)
+        make_widget(ctk.CTkLabel, left_col, text=T("total_pills"), font=font(14, "bold")).pack(anchor="w")
+        self.add_stock_entry = make_widget(ctk.CTkEntry, left_col, width=212, height=scale(48),
+                                           placeholder_text=T("pills_placeholder"),
+                                           fg_color=C("bg_input"),
+                                           border_color=C("border"),
+                                           corner_radius=10)
         self.add_stock_entry.pack(pady=(8, 0))
         
         # Pills per day
         right_col = ctk.CTkFrame(num_frame, fg_color="transparent")
         right_col.pack(side="left")
-        ctk.CTkLabel(right_col, text=self.t("pills_per_day"), font=font(14, "bold")).pack(anchor="w")
-        self.add_daily_entry = ctk.CTkEntry(right_col, width=212, height=scale(48),
-                                            placeholder_text=self.t("per_day_placeholder"),
-                                            fg_color=COLORS["bg_input"],
-                                            border_color=COLORS["border"],
-                                            corner_radius=10)
+        make_widget(ctk.CTkLabel, right_col, text=T("pills_per_day"), font=font(14, "bold")).pack(anchor="w")
+        self.add_daily_entry = make_widget(ctk.CTkEntry, right_col, width=212, height=scale(48),
+                                           placeholder_text=T("per_day_placeholder"),
+                                           fg_color=C("bg_input"),
+                                           border_color=C("border"),
+                                           corner_radius=10)
         self.add_daily_entry.pack(pady=(8, 0))
         
         # Info box
-        info_frame = ctk.CTkFrame(form, fg_color=COLORS["bg_input"], corner_radius=10)
+        info_frame = make_widget(ctk.CTkFrame, form, fg_color=C("bg_input"), corner_radius=10)
         info_frame.pack(fill="x", pady=(0, 30))
         
-        ctk.CTkLabel(info_frame, text=self.t("smart_alerts"), font=font(13, "bold")).pack(anchor="w", padx=20, pady=(15, 5))
-        ctk.CTkLabel(info_frame, text=self.t("smart_alerts_desc"),
-                     font=font(12), text_color=COLORS["text_secondary"],
-                     justify="left").pack(anchor="w", padx=20, pady=(0, 15))
+        make_widget(ctk.CTkLabel, info_frame, text=T("smart_alerts"), font=font(13, "bold")).pack(anchor="w", padx=20, pady=(15, 5))
+        make_widget(ctk.CTkLabel, info_frame, text=T("smart_alerts_desc"),
+                    font=font(12), text_color=C("text_secondary"),
+                    justify="left").pack(anchor="w", padx=20, pady=(0, 15))
         
         # Submit button
-        ctk.CTkButton(form, text=self.t("add_medication_btn"), width=450, height=scale(52),
-                      font=font(16, "bold"),
-                      fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"],
-                      corner_radius=10,
-                      command=self.add_new_medication).pack()
+        make_widget(ctk.CTkButton, form, text=T("add_medication_btn"), width=450, height=scale(52),
+                    font=font(16, "bold"),
+                    fg_color=C("primary"), hover_color=C("primary_hover"),
+                    corner_radius=10,
+                    command=self.add_new_medication).pack()
         
         # Focus first field
         self.after(100, self.add_name_entry.focus)
     
+    def on_name_typed(self, event):
+        if event.keysym == "Escape":
+            self.name_suggestions.pack_forget()
+            return
+        self.debounce_search("add", self.update_name_suggestions, SUGGEST_DELAY_MS)
+    
+    def update_name_suggestions(self):
+        """Offer the user's own medications first, then names from the drug list"""
+        self.search_jobs.pop("add", None)
+        text = self.add_name_entry.get().strip().lower()
+        names = []
+        if text:
+            names = [m["name"] for m in self.get_current_medications() if m["name"].lower().startswith(text)]
+            names += [n for n in DRUGS.suggest(text, SUGGESTION_COUNT) if n not in names]
+            names = [n for n in names if n.lower() != text][:SUGGESTION_COUNT]
+        
+        for button in self.suggestion_buttons:
+            button.pack_forget()
+        if not names:
+            self.name_suggestions.pack_forget()
+            return
+        for button, name in zip(self.suggestion_buttons, names):
+            button.configure(text=name, command=lambda n=name: self.choose_name_suggestion(n))
+            button.pack(fill="x", padx=6, pady=2)
+        self.name_suggestions.pack(fill="x", pady=(0, 25), after=self.add_name_entry)
+    
+    def choose_name_suggestion(self, name):
+        self.add_name_entry.delete(0, "end")
+        self.add_name_entry.insert(0, name)
+        self.name_suggestions.pack_forget()
+        self.add_stock_entry.focus()
+    
+    def canonical_name(self, name):
+        """The spelling already used by one of the user's medications, else the drug list's"""
+        name = name.strip()
+        for med in self.get_current_medications():
+            if med["name"].lower() == name.lower():
+                return med["name"]
+        return DRUGS.canonical(name)
+    
     def add_new_medication(self):
         """Add a new medication"""
-        name = self.add_name_entry.get().strip()
+        name = self.canonical_name(self.add_name_entry.get())
         stock = self.add_stock_entry.get().strip()
         daily = self.add_daily_entry.get().strip()
         
@@ -1391,80 +1931,128 @@ class MedicationApp(ctk.CTk):
             self.show_dialog(self.t("invalid_input"), self.t("positive_numbers"), "error")
             return
         
-        # Add medication
-        new_id = get_next_id("medications")
-        new_med = {
-            "id": new_id,
-            "user_id": self.current_user_id,
-            "name": name,
-            "total_pills": stock,
-            "pills_per_day": daily
-        }
-        get_data_store()["medications"].append(new_med)
-        save_data()
+        # Add medication; the card appears from the change event
+        WRITER.submit(SERVICE.add_medication, self.current_user_id, name, stock, daily,
+                      on_done=lambda med_id: self.on_medication_added(name))
         
         # Clear form
         self.add_name_entry.delete(0, "end")
+        self.name_suggestions.pack_forget()
         self.add_stock_entry.delete(0, "end")
         self.add_daily_entry.delete(0, "end")
         
-        self.show_dialog(self.t("success"), f"'{name}' {self.t('med_added')}", "success")
         self.show_medications_view()
     
+    def on_medication_added(self, name):
+        self.show_dialog(self.t("success"), f"'{name}' {self.t('med_added')}", "success")
+    
     # ============================================
     # HISTORY VIEW
     # ============================================
+    @MEM_PROFILE.checkpoint_after("history_view")
     def show_history_view(self):
-        self.set_active_nav("history")
-        self.clear_content()
+        if self.show_cached_view("history"):
+            return
+        view = self.new_view("history")
         
         # Header
-        header = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        header = ctk.CTkFrame(view, fg_color="transparent")
         header.grid(row=0, column=0, sticky="ew", padx=35, pady=(35, 25))
         
-        ctk.CTkLabel(header, text=self.t("medication_history"), 
-                     font=font(28, "bold")).pack(side="left")
+        make_widget(ctk.CTkLabel, header, text=T("medication_history"), 
+                    font=font(28, "bold")).pack(side="left")
+        
+        self.history_search = make_widget(ctk.CTkEntry, header, width=260, height=scale(42),
+                                          placeholder_text=T("search_history"),
+                                          fg_color=C("bg_input"), border_color=C("border"),
+                                          corner_radius=10)
+        self.history_search.pack(side="left", padx=(20, 0))
+        self.history_search.bind("<KeyRelease>", lambda e: self.debounce_search("history", self.apply_history_search))
+        self.history_query = ""
         
-        ctk.CTkButton(header, text=self.t("export_pdf"), width=140, height=scale(42),
-                      fg_color=COLORS["success"], hover_color=COLORS["success_hover"],
-                      corner_radius=10, command=self.export_pdf).pack(side="right")
+        make_widget(ctk.CTkButton, header, text=T("export_pdf"), width=140, height=scale(42),
+                    fg_color=C("success"), hover_color=C("success_hover"),
+                    corner_radius=10, command=self.export_pdf).pack(side="right")
         
         # History container
-        history_container = ctk.CTkScrollableFrame(self.content_frame, fg_color="transparent")
+        history_container = ctk.CTkScrollableFrame(view, fg_color="transparent")
         history_container.grid(row=1, column=0, sticky="nsew", padx=35, pady=(0, 35))
         
         self.history_container = history_container
+        # Start with the hot store; archived months are read on request
+        self.history_since = database.archive_cutoff() if database.DATA_STORE["archive"] else None
         self.refresh_history()
     
+    @UI_METRICS.timed("refresh_history")
     def refresh_history(self):
         """Refresh the history list"""
         for widget in self.history_container.winfo_children():
             widget.destroy()
         
-        # Get user's medication IDs
-        user_med_ids = [m["id"] for m in get_data_store()["medications"] if m["user_id"] == self.current_user_id]
-        
-        # Filter history
-        history = [h for h in get_data_store()["history"] if h["med_id"] in user_med_ids]
-        history.sort(key=lambda x: x["taken_at"], reverse=True)
+        # Newest first
+        if self.history_query:
+            history = SERVICE.search_history(self.current_user_id, self.history_query, self.history_since)
+        else:
+            history = SERVICE.get_history(self.current_user_id, self.history_since)
+        
+        # Rows are rendered in batches; the buttons stay below the list
+        self.history_rows = history
+        self.history_shown = 0
+        self.history_list = ctk.CTkFrame(self.history_container, fg_color="transparent")
+        self.history_list.pack(fill="x")
+        self.history_more = None
+        if len(history) > HISTORY_BATCH:
+            self.history_more = make_widget(ctk.CTkButton, self.history_container, text=T("show_more"),
+                                            height=scale(40), fg_color=C("bg_card"), hover_color=C("accent"),
+                                            corner_radius=10, command=self.show_more_history)
+            self.history_more.pack(fill="x", pady=(10, 0))
+        self.show_more_history()
+        
+        if self.history_query and not history:
+            make_widget(ctk.CTkLabel, self.history_container, text=T("no_matches"),
+                        font=font(16), text_color=C("text_secondary")).pack(pady=40)
+        
+        if self.history_since is not None:
+            make_widget(ctk.CTkButton, self.history_container, text=T("show_older"), height=scale(40),
+                        fg_color=C("bg_card"), hover_color=C("accent"), corner_radius=10,
+                        command=self.show_older_history).pack(fill="x", pady=(10, 5))
+            return
         
-        if not history:
-            empty_frame = ctk.CTkFrame(self.history_container, fg_color=COLORS["bg_card"], corner_radius=15)
+        if not history and not self.history_query:
+            empty_frame = make_widget(ctk.CTkFrame, self.history_container, fg_color=C("bg_card"), corner_radius=15)
             empty_frame.pack(fill="x", pady=10)
             
             ctk.CTkLabel(empty_frame, text="📭", font=font(50)).pack(pady=(40, 15))
-            ctk.CTkLabel(empty_frame, text=self.t("no_history"), 
-                         font=font(20, "bold")).pack()
-            ctk.CTkLabel(empty_frame, text=self.t("take_some_meds"),
-                         text_color=COLORS["text_secondary"]).pack(pady=(8, 40))
-            return
-        
-        for log in history:
+            make_widget(ctk.CTkLabel, empty_frame, text=T("no_history"), 
+                        font=font(20, "bold")).pack()
+            make_widget(ctk.CTkLabel, empty_frame, text=T("take_some_meds"),
+                        text_color=C("text_secondary")).pack(pady=(8, 40))
+    
+    def show_more_history(self):
+        """Render the next HISTORY_BATCH rows of the current history list"""
+        end = self.history_shown + HISTORY_BATCH
+        for log in self.history_rows[self.history_shown:end]:
             self.create_history_card(log)
+        self.history_shown = min(end, len(self.history_rows))
+        if self.history_more is not None and self.history_shown >= len(self.history_rows):
+            self.history_more.destroy()
+            self.history_more = None
+    
+    def apply_history_search(self):
+        self.search_jobs.pop("history", None)
+        query = self.history_search.get().strip()
+        if query != self.history_query:
+            self.history_query = query
+            self.refresh_history()
+    
+    def show_older_history(self):
+        """Include the archived months (loaded from disk on first use)"""
+        self.history_since = None
+        self.refresh_history()
     
     def create_history_card(self, log):
         """Create a card for each history entry"""
-        card = ctk.CTkFrame(self.history_container, fg_color=COLORS["bg_card"], corner_radius=12)
+        card = make_widget(ctk.CTkFrame, self.history_list, fg_color=C("bg_card"), corner_radius=12)
         card.pack(fill="x", pady=5)
         
         inner = ctk.CTkFrame(card, fg_color="transparent")
@@ -1473,11 +2061,11 @@ class MedicationApp(ctk.CTk):
         ctk.CTkLabel(inner, text=f"💊  {log['medication_name']}", 
                      font=font(16, "bold")).pack(side="left")
         
-        ctk.CTkLabel(inner, text=log['taken_at'], 
-                     font=font(13), text_color=COLORS["text_secondary"]).pack(side="right")
+        make_widget(ctk.CTkLabel, inner, text=clock.format_ts(log['ts'], log['tz']), 
+                    font=font(13), text_color=C("text_secondary")).pack(side="right")
     
     def export_pdf(self):
-        """Export history to PDF"""
+        """Export history to PDF in the background; the report reads a snapshot, so doses can be taken meanwhile"""
         from exporter import generate_pdf_report
         
         folder = "Reports"
@@ -1485,12 +2073,209 @@ class MedicationApp(ctk.CTk):
             os.makedirs(folder)
         
         filename = os.path.join(folder, f"Report_User_{self.current_user_id}.pdf")
-        
-        if generate_pdf_report(self.current_user_id, filename):
+        WRITER.read(generate_pdf_report, self.current_user_id, filename,
+                    on_done=lambda ok: self.on_exported(ok, filename))
+    
+    def on_exported(self, ok, filename):
+        if ok:
             full_path = os.path.abspath(filename)
             self.show_dialog(self.t("export_complete"), f"{self.t('pdf_saved')}\n\n{full_path}", "success")
         else:
             self.show_dialog(self.t("export_failed"), self.t("export_error"), "error")
+    
+    # ============================================
+    # CALENDAR VIEW
+    # ============================================
+    @MEM_PROFILE.checkpoint_after("calendar_view")
+    def show_calendar_view(self):
+        if self.show_cached_view("calendar"):
+            return
+        view = self.new_view("calendar")
+        view.grid_rowconfigure(1, weight=0)
+        view.grid_rowconfigure(2, weight=1)
+        
+        # Header
+        header = ctk.CTkFrame(view, fg_color="transparent")
+        header.grid(row=0, column=0, sticky="ew", padx=35, pady=(35, 15))
+        
+        make_widget(ctk.CTkLabel, header, text=T("calendar_title"),
+                    font=font(28, "bold")).pack(side="left")
+        
+        self.calendar_menu = make_widget(ctk.CTkOptionMenu, header, values=[""], width=220, height=scale(38),
+                                         fg_color=C("bg_input"), button_color=C("accent"),
+                                         button_hover_color=C("primary"), text_color=C("text"),
+                                         corner_radius=10, command=self.choose_calendar_medication)
+        self.calendar_menu.pack(side="right")
+        
+        # Month/year switch and period navigation
+        toolbar = ctk.CTkFrame(view, fg_color="transparent")
+        toolbar.grid(row=1, column=0, sticky="ew", padx=35, pady=(0, 15))
+        
+        self.calendar_mode_buttons = {}
+        for mode in (heatmap.MONTH, heatmap.YEAR):
+            btn = make_widget(ctk.CTkButton, toolbar, text=T(mode), width=90, height=scale(36),
+                              font=font(13), corner_radius=10,
+                              command=lambda m=mode: self.set_calendar_mode(m))
+            btn.pack(side="left", padx=(0, 8))
+            self.calendar_mode_buttons[mode] = btn
+        
+        make_widget(ctk.CTkButton, toolbar, text="▶", width=40, height=scale(36),
+                    fg_color=C("bg_input"), hover_color=C("accent"), text_color=C("text"),
+                    corner_radius=10, command=lambda: self.shift_calendar(1)).pack(side="right")
+        self.calendar_period = make_widget(ctk.CTkLabel, toolbar, text="", width=110,
+                                           font=font(16, "bold"))
+        self.calendar_period.pack(side="right", padx=8)
+        make_widget(ctk.CTkButton, toolbar, text="◀", width=40, height=scale(36),
+                    fg_color=C("bg_input"), hover_color=C("accent"), text_color=C("text"),
+                    corner_radius=10, command=lambda: self.shift_calendar(-1)).pack(side="right")
+        
+        # The whole grid is one canvas, however many days it shows
+        card = make_widget(ctk.CTkFrame, view, fg_color=C("bg_card"), corner_radius=15)
+        card.grid(row=2, column=0, sticky="nsew", padx=35, pady=(0, 35))
+        self.calendar_canvas = make_widget(ctk.CTkCanvas, card, bg=C("bg_card"), highlightthickness=0)
+        self.calendar_canvas.pack(fill="both", expand=True, padx=20, pady=(20, 5))
+        self.calendar_canvas.bind("<Configure>", lambda e: self.draw_calendar())
+        self.calendar_canvas.bind("<Motion>", self.on_calendar_hover)
+        self.calendar_canvas.bind("<Leave>", lambda e: self.calendar_status.configure(text=self.calendar_summary))
+        self.calendar_status = make_widget(ctk.CTkLabel, card, text="", font=font(13),
+                                           text_color=C("text_secondary"))
+        self.calendar_status.pack(pady=(0, 15))
+        
+        self.calendar_mode = heatmap.MONTH
+        self.calendar_year, self.calendar_month = heatmap.month_start()
+        self.calendar_med_id = None
+        self.calendar_counts = {}
+        # (column, row) -> day key of the drawn cells, and (left, top, cell size)
+        self.calendar_cells = {}
+        self.calendar_geometry = (0, 0, 0)
+        self.calendar_summary = ""
+        self.refresh_calendar()
+    
+    def refresh_calendar(self):
+        """Reload the medication choices and redraw the grid"""
+        meds = self.get_current_medications()
+        names = [m["name"] for m in meds]
+        self.calendar_menu.configure(values=names or [""])
+        if self.calendar_med_id not in [m["id"] for m in meds]:
+            self.calendar_med_id = meds[0]["id"] if meds else None
+        self.calendar_menu.set(next((m["name"] for m in meds if m["id"] == self.calendar_med_id), ""))
+        self.draw_calendar()
+    
+    def calendar_medication(self):
+        return next((m for m in self.get_current_medications() if m["id"] == self.calendar_med_id), None)
+    
+    def choose_calendar_medication(self, name):
+        med = next((m for m in self.get_current_medications() if m["name"] == name), None)
+        if med is not None:
+            self.calendar_med_id = med["id"]
+            self.draw_calendar()
+    
+    def set_calendar_mode(self, mode):
+        self.calendar_mode = mode
+        self.draw_calendar()
+    
+    def shift_calendar(self, step):
+        """Show the previous (-1) or next (1) month or year"""
+        self.calendar_year, self.calendar_month = heatmap.shift(self.calendar_mode, self.calendar_year,
+                                                                self.calendar_month, step)
+        self.draw_calendar()
+    
+    @UI_METRICS.timed("draw_calendar")
+    def draw_calendar(self):
+        """Draw the month or year grid from the daily rollup onto the canvas"""
+        canvas = self.calendar_canvas
+        canvas.delete("all")
+        self.calendar_cells = {}
+        mode, year, month = self.calendar_mode, self.calendar_year, self.calendar_month
+        for key, btn in self.calendar_mode_buttons.items():
+            if key == mode:
+                btn.configure(fg_color=COLORS["primary"], hover_color=COLORS["primary_hover"], text_color="#ffffff")
+            else:
+                btn.configure(fg_color=COLORS["bg_input"], hover_color=COLORS["accent"], text_color=COLORS["text"])
+        self.calendar_period.configure(text=str(year) if mode == heatmap.YEAR else f"{year}-{month:02d}")
+        
+        med = self.calendar_medication()
+        if med is None:
+            self.calendar_summary = self.t("no_medications")
+            self.calendar_status.configure(text=self.calendar_summary)
+            return
+        
+        since, until = heatmap.period(mode, year, month)
+        self.calendar_counts = SERVICE.get_day_counts(self.current_user_id, med["id"], since, until)
+        per_day = med["pills_per_day"]
+        layout = heatmap.cells(mode, year, month)
+        columns = max(col for _, col, _ in layout) + 1
+        rows = max(row for _, _, row in layout) + 1
+        
+        # Room for weekday/month labels above, weekday labels left of a year, and the legend below
+        left = scale(34) if mode == heatmap.YEAR else 0
+        top = scale(24)
+        legend = scale(36)
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        size = max(6, min((width - left) // columns, (height - top - legend) // rows, scale(72)))
+        gap = max(2, size // 10)
+        x0 = left + max(0, (width - left - size * columns) // 2)
+        self.calendar_geometry = (x0, top, size)
+        
+        fills = {
+            heatmap.NONE: COLORS["bg_input"],
+            heatmap.SOME: COLORS["warning"],
+            heatmap.ALL: COLORS["success"],
+            heatmap.EXTRA: COLORS["primary"],
+            heatmap.FUTURE: COLORS["bg_card"],
+        }
+        today = clock.today_key()
+        for day, col, row in layout:
+            x, y = x0 + col * size, top + row * size
+            level = heatmap.level(self.calendar_counts.get(day, 0), per_day, day, today)
+            outline = COLORS["text"] if day == today else COLORS["border"] if level == heatmap.FUTURE else ""
+            canvas.create_rectangle(x, y, x + size - gap, y + size - gap, fill=fills[level],
+                                    outline=outline, width=2 if day == today else 1)
+            if mode == heatmap.MONTH:
+                canvas.create_text(x + gap * 2, y + gap * 2, text=str(day % 100), anchor="nw",
+                                   fill=COLORS["text"], font=font(12))
+            self.calendar_cells[(col, row)] = day
+        
+        label_color = COLORS["text_secondary"]
+        weekdays = self.t("weekdays").split()
+        if mode == heatmap.MONTH:
+            for col, name in enumerate(weekdays):
+                canvas.create_text(x0 + col * size + (size - gap) // 2, top // 2, text=name,
+                                   fill=label_color, font=font(12))
+        else:
+            for row in (0, 2, 4):
+                canvas.create_text(x0 - scale(6), top + row * size + (size - gap) // 2, text=weekdays[row],
+                                   anchor="e", fill=label_color, font=font(11))
+            month_names = self.t("months").split()
+            for day, col, row in layout:
+                if day % 100 == 1:
+                    canvas.create_text(x0 + col * size, top // 2, text=month_names[day // 100 % 100 - 1],
+                                       anchor="w", fill=label_color, font=font(11))
+        
+        x, y = x0, top + rows * size + scale(12)
+        box = scale(12)
+        for level, key in ((heatmap.NONE, "cal_none"), (heatmap.SOME, "cal_some"),
+                           (heatmap.ALL, "cal_all"), (heatmap.EXTRA, "cal_extra")):
+            canvas.create_rectangle(x, y, x + box, y + box, fill=fills[level], outline="")
+            item = canvas.create_text(x + box + scale(6), y + box // 2, text=self.t(key), anchor="w",
+                                      fill=label_color, font=font(12))
+            x = canvas.bbox(item)[2] + scale(18)
+        
+        full, total = heatmap.adherence(self.calendar_counts, per_day, since, until, today)
+        self.calendar_summary = f"{self.t('full_days')} {full} / {total}"
+        self.calendar_status.configure(text=self.calendar_summary)
+    
+    def on_calendar_hover(self, event):
+        """Show the doses of the day under the pointer below the grid"""
+        x0, top, size = self.calendar_geometry
+        med = self.calendar_medication() if size else None
+        day = self.calendar_cells.get(((event.x - x0) // size, (event.y - top) // size)) if med else None
+        if day is None:
+            self.calendar_status.configure(text=self.calendar_summary)
+            return
+        count = self.calendar_counts.get(day, 0)
+        self.calendar_status.configure(
+            text=f"{clock.format_day(day)}: {count} {self.t('doses_of')} {med['pills_per_day']}")
 
 
 if __name__ == "__main__":
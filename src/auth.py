@@ -1,12 +1,14 @@
 from database import DATA_STORE, save_data, get_next_id
+from tracing import instrument_module
 
 
 def register_user(username, password):
     """
     Registers a new user into the list.
+    Usernames are unique regardless of case.
     """
     for user in DATA_STORE["users"]:
-        if user["username"] == username:
+        if user["username"].lower() == username.lower():
             return False
 
     new_id = get_next_id("users")
@@ -31,3 +33,6 @@ def login_user(username, password):
             return user["id"]
 
     return None
+
+
+instrument_module(__name__)
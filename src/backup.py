@@ -0,0 +1,358 @@
+"""
+Incremental, content-addressed backups of the data files.
+
+A snapshot covers DB_FILE, every per-user file and every sync change
+log. Each top-level list
+(users, medications, history) is cut into chunks at content-defined
+boundaries: a chunk ends after any record whose hash falls on
+CHUNK_TARGET. Chunks are stored once, gzip-compressed, under their
+SHA-256 in backups/objects/. A snapshot manifest only lists chunk hashes,
+so a new snapshot writes just the chunks that changed since earlier ones
+(normally the tail of each history list). Archived history segments
+are already compressed and never change, so they are stored whole under
+the hash of their bytes. Change logs are only appended to, so they are
+chunked by line the same way and a snapshot stores just the new lines.
+Restoring any snapshot reads its manifest and
+concatenates the chunks, no replay needed.
+
+Headless use:
+    python src/backup.py snapshot
+    python src/backup.py list
+    python src/backup.py restore SNAPSHOT_ID | --at "2025-01-31 08:00"
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import database
+import stock_index
+import sync
+from tracing import instrument_module
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKUP_DIR = os.path.join(_PROJECT_ROOT, "backups")
+
+# Average records per chunk; a chunk ends after a record whose hash % CHUNK_TARGET == 0
+CHUNK_TARGET = 256
+# Hard cap so long runs without a boundary still produce bounded chunks
+MAX_CHUNK_RECORDS = 4096
+# Snapshots kept by prune() (two weeks of hourly backups)
+KEEP_SNAPSHOTS = 24 * 14
+SNAPSHOT_ID_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def _objects_dir():
+    return os.path.join(BACKUP_DIR, "objects")
+
+
+def _snapshots_dir():
+    return os.path.join(BACKUP_DIR, "snapshots")
+
+
+def _object_path(digest):
+    return os.path.join(_objects_dir(), digest[:2], digest + ".gz")
+
+
+def _manifest_path(snapshot_id):
+    return os.path.join(_snapshots_dir(), snapshot_id + ".json")
+
+
+def _read_manifest(snapshot_id):
+    with open(_manifest_path(snapshot_id), "r") as f:
+        return json.load(f)
+
+
+def _atomic_write(path, raw):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, path)
+
+
+def _data_files():
+    """(relative name, absolute path) of every file a snapshot covers."""
+    files = []
+    if os.path.exists(database.DB_FILE):
+        files.append((os.path.basename(database.DB_FILE), database.DB_FILE))
+    for path in sorted(glob.glob(os.path.join(database.USER_DATA_DIR, "user_*.json"))):
+        files.append(("user_data/" + os.path.basename(path), path))
+    return files
+
+
+def _segment_files():
+    """(relative name, absolute path) of every archived history segment."""
+    root = os.path.join(database.USER_DATA_DIR, "archive")
+    files = []
+    for path in sorted(glob.glob(os.path.join(root, "user_*", "*.json.*"))):
+        if not path.endswith(".tmp"):
+            files.append(("archive/" + os.path.relpath(path, root).replace(os.sep, "/"), path))
+    return files
+
+
+def _log_files():
+    """(relative name, absolute path) of every sync change log."""
+    root = os.path.join(database.USER_DATA_DIR, sync.CHANGES_DIR)
+    return [(f"{sync.CHANGES_DIR}/{os.path.basename(path)}", path)
+            for path in sorted(glob.glob(os.path.join(root, "user_*.jsonl")))]
+
+
+def _store_blob(raw, stats):
+    """Stores already-compressed bytes as an object. Returns its hash."""
+    digest = hashlib.sha256(raw).hexdigest()
+    path = _object_path(digest)
+    if not os.path.exists(path):
+        _atomic_write(path, raw)
+        stats["new_chunks"] += 1
+        stats["bytes_written"] += len(raw)
+    stats["chunks"] += 1
+    return digest
+
+
+def _target_path(name):
+    """Absolute path a manifest file name restores to."""
+    if name.startswith("user_data/"):
+        return os.path.join(database.USER_DATA_DIR, name.split("/", 1)[1])
+    if name.startswith(("archive/", sync.CHANGES_DIR + "/")):
+        return os.path.join(database.USER_DATA_DIR, *name.split("/"))
+    return database.DB_FILE
+
+
+def _chunk_records(records):
+    """Yields lists of canonical record encodings cut at content-defined boundaries."""
+    chunk = []
+    for record in records:
+        encoded = json.dumps(record, sort_keys=True, separators=(",", ":"))
+        chunk.append(encoded)
+        boundary = int(hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:8], 16) % CHUNK_TARGET == 0
+        if boundary or len(chunk) >= MAX_CHUNK_RECORDS:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _store_chunk(encoded_records, stats):
+    """Writes a chunk unless an identical one exists. Returns its hash."""
+    raw = ("[" + ",".join(encoded_records) + "]").encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    path = _object_path(digest)
+    if not os.path.exists(path):
+        _atomic_write(path, gzip.compress(raw))
+        stats["new_chunks"] += 1
+        stats["bytes_written"] += os.path.getsize(path)
+    stats["chunks"] += 1
+    return digest
+
+
+def _load_chunk(digest):
+    with gzip.open(_object_path(digest), "rb") as f:
+        return json.loads(f.read())
+
+
+def take_snapshot():
+    """
+    Backs up the data files as they are on disk.
+    Returns (snapshot_id, stats) where stats counts chunks and new bytes.
+    """
+    stats = {"files": 0, "chunks": 0, "new_chunks": 0, "bytes_written": 0}
+    files = {}
+    for name, path in _data_files():
+        with open(path, "rb") as f:
+            data = json.loads(f.read())
+        entry = {"meta": {}, "lists": {}}
+        for key, value in data.items():
+            if key in database.DERIVED_KEYS:
+                # Rebuilt from history by database.load_user() after a restore
+                continue
+            if isinstance(value, list):
+                entry["lists"][key] = [_store_chunk(c, stats) for c in _chunk_records(value)]
+            else:
+                entry["meta"][key] = value
+        files[name] = entry
+        stats["files"] += 1
+
+    segments = {}
+    for name, path in _segment_files():
+        with open(path, "rb") as f:
+            segments[name] = _store_blob(f.read(), stats)
+
+    # Taken with the files they describe; a restored store and its log agree
+    logs = {}
+    for name, path in _log_files():
+        with open(path, "rb") as f:
+            lines = f.read().decode("utf-8").split("\n")
+        logs[name] = [_store_chunk(c, stats) for c in _chunk_records(lines)]
+
+    created = time.time()
+    snapshot_id = datetime.fromtimestamp(created).strftime(SNAPSHOT_ID_FORMAT)
+    suffix = 1
+    while os.path.exists(_manifest_path(snapshot_id)):
+        suffix += 1
+        snapshot_id = f"{datetime.fromtimestamp(created).strftime(SNAPSHOT_ID_FORMAT)}-{suffix}"
+
+    manifest = {"id": snapshot_id, "created": created, "files": files, "segments": segments, "logs": logs}
+    raw = json.dumps(manifest, separators=(",", ":")).encode("utf-8")
+    _atomic_write(_manifest_path(snapshot_id), raw)
+    stats["bytes_written"] += len(raw)
+    return snapshot_id, stats
+
+
+def list_snapshots():
+    """Snapshots oldest first as dicts with id and created (epoch seconds)."""
+    snapshots = []
+    for path in glob.glob(os.path.join(_snapshots_dir(), "*.json")):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        snapshots.append({"id": manifest["id"], "created": manifest["created"]})
+    snapshots.sort(key=lambda s: s["created"])
+    return snapshots
+
+
+def find_snapshot(at):
+    """ID of the latest snapshot taken at or before datetime `at`, or None."""
+    cutoff = at.timestamp()
+    found = None
+    for snapshot in list_snapshots():
+        if snapshot["created"] <= cutoff:
+            found = snapshot["id"]
+    return found
+
+
+def read_snapshot(snapshot_id):
+    """Rebuilds the data files of a snapshot as {file name: data}."""
+    manifest = _read_manifest(snapshot_id)
+    files = {}
+    for name, entry in manifest["files"].items():
+        data = dict(entry["meta"])
+        for key, digests in entry["lists"].items():
+            records = []
+            for digest in digests:
+                records.extend(_load_chunk(digest))
+            data[key] = records
+        files[name] = data
+    return files
+
+
+def restore_snapshot(snapshot_id):
+    """
+    Replaces DB_FILE, the per-user files and the change logs with the
+    snapshot's contents. Files, archive segments and logs that did not
+    exist at snapshot time are removed. A running process must call
+    database.init_db() afterwards. Returns the number of files written.
+    """
+    files = read_snapshot(snapshot_id)
+    targets = set()
+    for name, data in files.items():
+        path = _target_path(name)
+        _atomic_write(path, json.dumps(data, indent=4).encode("utf-8"))
+        targets.add(os.path.abspath(path))
+
+    for name, digest in _read_manifest(snapshot_id).get("segments", {}).items():
+        path = _target_path(name)
+        with open(_object_path(digest), "rb") as f:
+            _atomic_write(path, f.read())
+        targets.add(os.path.abspath(path))
+
+    for name, digests in _read_manifest(snapshot_id).get("logs", {}).items():
+        path = _target_path(name)
+        lines = [line for digest in digests for line in _load_chunk(digest)]
+        _atomic_write(path, "\n".join(lines).encode("utf-8"))
+        targets.add(os.path.abspath(path))
+
+    for _, path in _data_files() + _segment_files() + _log_files():
+        if os.path.abspath(path) not in targets:
+            os.remove(path)
+    # Sequence numbers used after the snapshot may already have reached
+    # other installs; new changes are logged under a new install ID
+    sync.reset_install_id()
+    # The run-out index describes the replaced files; it is rebuilt from
+    # the restored ones the next time it is used
+    index_path = os.path.join(database.USER_DATA_DIR, stock_index.INDEX_FILENAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    return len(targets)
+
+
+def prune(keep=KEEP_SNAPSHOTS):
+    """
+    Deletes all but the newest `keep` snapshots, then removes chunks no
+    remaining snapshot refers to. Returns (snapshots removed, chunks removed).
+    """
+    snapshots = list_snapshots()
+    expired = snapshots[:-keep] if keep > 0 else snapshots
+    for snapshot in expired:
+        os.remove(_manifest_path(snapshot["id"]))
+    if not expired:
+        return 0, 0
+
+    live = set()
+    for snapshot in snapshots[len(expired):]:
+        manifest = _read_manifest(snapshot["id"])
+        for entry in manifest["files"].values():
+            for digests in entry["lists"].values():
+                live.update(digests)
+        live.update(manifest.get("segments", {}).values())
+        for digests in manifest.get("logs", {}).values():
+            live.update(digests)
+
+    removed = 0
+    for path in glob.glob(os.path.join(_objects_dir(), "*", "*.gz")):
+        if os.path.basename(path)[:-3] not in live:
+            os.remove(path)
+            removed += 1
+    return len(expired), removed
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental backups of the medication data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("snapshot", help="back up the current data files")
+    commands.add_parser("list", help="list snapshots")
+    restore = commands.add_parser("restore", help="restore a snapshot")
+    restore.add_argument("snapshot_id", nargs="?")
+    restore.add_argument("--at", help='latest snapshot at or before "YYYY-MM-DD HH:MM"')
+    prune_cmd = commands.add_parser("prune", help="drop old snapshots and unused chunks")
+    prune_cmd.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    args = parser.parse_args(argv)
+
+    if args.command == "snapshot":
+        start = time.perf_counter()
+        snapshot_id, stats = take_snapshot()
+        print(f"Snapshot {snapshot_id}: {stats['files']} files, {stats['new_chunks']} of "
+              f"{stats['chunks']} chunks new, {stats['bytes_written']:,} bytes written "
+              f"in {time.perf_counter() - start:.2f}s.")
+    elif args.command == "list":
+        for snapshot in list_snapshots():
+            created = datetime.fromtimestamp(snapshot["created"]).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{snapshot['id']}  {created}")
+    elif args.command == "restore":
+        snapshot_id = args.snapshot_id
+        if args.at:
+            snapshot_id = find_snapshot(datetime.strptime(args.at, "%Y-%m-%d %H:%M"))
+        if not snapshot_id:
+            print("No matching snapshot.")
+            return 1
+        count = restore_snapshot(snapshot_id)
+        print(f"Restored {count} files from {snapshot_id}.")
+    elif args.command == "prune":
+        snapshots, chunks = prune(args.keep)
+        print(f"Removed {snapshots} snapshots and {chunks} chunks.")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
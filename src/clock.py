@@ -0,0 +1,65 @@
+"""
+Timestamp helpers for stored records.
+
+Records keep "ts" (integer epoch seconds), "tz" (the UTC offset in
+seconds where the record was made) and "day" (that local date as the
+integer YYYYMMDD). Filtering, sorting and grouping use these integers;
+strings are only produced for display and export by format_ts() and
+format_day(). Because the offset is stored, a dose shows the wall-clock
+time it was taken even after a DST change or travel.
+"""
+
+import time
+from datetime import date, datetime, timedelta, timezone
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def stamp(ts):
+    """(ts, tz, day) for epoch seconds ts in the machine's current time zone."""
+    local = time.localtime(ts)
+    return int(ts), local.tm_gmtoff, local.tm_year * 10000 + local.tm_mon * 100 + local.tm_mday
+
+
+def now():
+    """(ts, tz, day) for the current moment."""
+    return stamp(time.time())
+
+
+def parse_local(text, fmt=TIME_FORMAT):
+    """(ts, tz, day) for a local wall-clock string. Raises ValueError if malformed."""
+    if fmt == TIME_FORMAT and len(text) == 19 and text[4] + text[7] + text[10] + text[13] + text[16] == "-- ::":
+        # strptime is slow enough to dominate bulk imports and migrations
+        parsed = datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]),
+                          int(text[11:13]), int(text[14:16]), int(text[17:19]))
+    else:
+        parsed = datetime.strptime(text, fmt)
+    return stamp(time.mktime(parsed.timetuple()))
+
+
+def day_key(value):
+    """YYYYMMDD integer for a date or datetime."""
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def today_key():
+    return day_key(date.today())
+
+
+def key_to_date(day):
+    return date(day // 10000, day // 100 % 100, day % 100)
+
+
+def end_of_day(day):
+    """Last epoch second of a day key in the machine's current time zone."""
+    next_day = key_to_date(day) + timedelta(days=1)
+    return int(time.mktime(next_day.timetuple())) - 1
+
+
+def format_day(day, fmt="%Y-%m-%d"):
+    return key_to_date(day).strftime(fmt)
+
+
+def format_ts(ts, tz, fmt=TIME_FORMAT):
+    """Wall-clock time of ts at the UTC offset it was recorded with."""
+    return datetime.fromtimestamp(ts, timezone(timedelta(seconds=tz))).strftime(fmt)
@@ -1,44 +1,716 @@
+import atexit
+import gzip
 import json
+import lzma
 import os
+import sys
+import threading
+import time
+import weakref
+from collections import namedtuple
+from collections.abc import Sequence
+from contextlib import contextmanager
+from itertools import islice
+
+import clock
+from tracing import instrument_module
 
 # Get the project root directory (parent of src folder)
 _PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Shared user directory (accounts and app preferences)
 DB_FILE = os.path.join(_PROJECT_ROOT, "med_data.json")
+# One file per user holding that user's medications and history
+USER_DATA_DIR = os.path.join(_PROJECT_ROOT, "user_data")
+# Layout version written at the top of every data file, see migrate.py
+SCHEMA_VERSION = 2
+# Keys stored in the per-user files rather than in DB_FILE
+USER_KEYS = ("medications", "history", "archive", "daily", "ledger", "ledger_checkpoints", "sync", "counters")
+# User keys that can be rebuilt from the others (backups skip them)
+DERIVED_KEYS = ("daily", "ledger_checkpoints")
+# History older than this many months is moved to compressed archive segments
+ARCHIVE_AFTER_MONTHS = 12
+# "gzip" or "lzma" (smaller, slower); only affects newly written segments
+ARCHIVE_COMPRESSION = "gzip"
+
 DATA_STORE = {
     "users": [],
+    # App preferences shared by all users (theme, ui_scale, archive_after_months)
+    "prefs": {},
     "medications": [],
     
-    "history": []
+    "history": [],
+    # Index of this user's archive segments, see archive_history()
+    "archive": [],
+    # Doses per medication per day: {str(med_id): {"YYYYMMDD": count}}
+    "daily": {},
+    # Stock changes and their balance checkpoints, see ledger.py
+    "ledger": [],
+    "ledger_checkpoints": [],
+    # Sync positions, see sync.py (the change log itself is a separate file)
+    "sync": {},
+    # Highest ID ever given out per user table, see get_next_id()
+    "counters": {}
 }
+# ID of the user whose medications/history are currently in DATA_STORE
+ACTIVE_USER_ID = None
+# Held while DATA_STORE is read or changed when a writer thread is running, see writer.py
+STORE_LOCK = threading.RLock()
+# Set by use_writer(): takes ([(path, bytes)], operation) instead of writing
+_WRITE_BEHIND = None
+# Set by use_writer(): takes change events sent from other threads
+_RELAY_EVENT = None
+# Set by use_writer(): returns the bytes queued for a path but not yet on disk, or None
+_PENDING_BYTES = None
+
+# Upper bounds (ms) of the storage latency histogram buckets; slower calls go in "inf"
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+# kind ("load"/"save") -> operation name -> stats, see record_io()
+_METRICS = {"load": {}, "save": {}}
+_METRICS_LOCK = threading.Lock()
+# Per-thread stack of names pushed by operation(); the innermost one is used for attribution
+_LOCAL = threading.local()
+# Bumped by every change event; tells readers whether a snapshot is still current
+_GENERATION = 0
+# Snapshots still referenced somewhere, see writable()
+_SNAPSHOTS = weakref.WeakSet()
+
+# Change event types sent to subscribers
+MEDICATION_ADDED = "medication_added"
+MEDICATION_UPDATED = "medication_updated"
+MEDICATION_DELETED = "medication_deleted"
+DOSE_RECORDED = "dose_recorded"
+HISTORY_PURGED = "history_purged"
+DATA_RELOADED = "data_reloaded"
+
+# med_ids is a tuple of affected medication IDs (empty for DATA_RELOADED)
+ChangeEvent = namedtuple("ChangeEvent", ["type", "user_id", "med_ids"])
+
+# List of (callback, event_types or None for all)
+_SUBSCRIBERS = []
+
+
+def subscribe(callback, event_types=None):
+    """
+    Calls callback(event) after every change of the given types
+    (all types if None). Returns the callback so it can be unsubscribed.
+    """
+    types = frozenset(event_types) if event_types is not None else None
+    _SUBSCRIBERS.append((callback, types))
+    return callback
+
+
+def unsubscribe(callback):
+    _SUBSCRIBERS[:] = [(cb, types) for cb, types in _SUBSCRIBERS if cb != callback]
+
+
+def notify(event_type, user_id=None, med_ids=()):
+    """
+    Sends a ChangeEvent to every subscriber interested in event_type.
+    Events sent off the main thread while a writer is running are handed
+    to it instead, so subscribers always run on the main thread.
+    """
+    global _GENERATION
+    _GENERATION += 1
+    if not _SUBSCRIBERS:
+        return
+    event = ChangeEvent(event_type, user_id, tuple(med_ids))
+    if _RELAY_EVENT is not None and threading.current_thread() is not threading.main_thread():
+        _RELAY_EVENT(event)
+        return
+    deliver(event)
+
+
+def deliver(event):
+    for callback, types in list(_SUBSCRIBERS):
+        if types is None or event.type in types:
+            callback(event)
+
+
+def use_writer(write_files=None, relay_event=None, pending_bytes=None):
+    """
+    Routes save_data() output to write_files([(path, bytes)], operation)
+    and events sent from other threads to relay_event(event); reads ask
+    pending_bytes(path) for contents not written yet. Called with no
+    arguments, saves write synchronously again.
+    """
+    global _WRITE_BEHIND, _RELAY_EVENT, _PENDING_BYTES
+    _WRITE_BEHIND = write_files
+    _RELAY_EVENT = relay_event
+    _PENDING_BYTES = pending_bytes
+
+
+def user_file(user_id):
+    """Path of the data file for one user."""
+    return os.path.join(USER_DATA_DIR, f"user_{user_id}.json")
 
 
 def init_db():
     """
     Checks if the JSON file exists. If not, creates it.
-    If it does, loads the data into our DATA_STORE variable.
+    If it does, loads the shared user directory into DATA_STORE.
+    Medications and history are only loaded by load_user().
     """
-    global DATA_STORE
+    global ACTIVE_USER_ID
     if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r") as f:
-            DATA_STORE = json.load(f)
+        import migrate
+        migrate.upgrade_db_file()
+
+        start = time.perf_counter()
+        loaded, size = _read_json(DB_FILE)
+        record_io("load", size, time.perf_counter() - start)
+        loaded.pop("schema_version", None)
+
+        # Update in place so modules that did `from database import DATA_STORE`
+        # keep seeing the live data.
+        DATA_STORE.clear()
+        DATA_STORE.update(loaded)
+        DATA_STORE.setdefault("users", [])
+        DATA_STORE.setdefault("prefs", {})
+        for key in USER_KEYS:
+            DATA_STORE[key] = _empty(key)
+        ACTIVE_USER_ID = None
+        notify(DATA_RELOADED)
     else:
         save_data()
 
 
+def _empty(key):
+    return {} if key in ("daily", "sync", "counters") else []
+
+
+def file_exists(path):
+    """True if the data file is on disk or queued to be written."""
+    return os.path.exists(path) or (_PENDING_BYTES is not None and _PENDING_BYTES(path) is not None)
+
+
+def read_file(path):
+    """
+    Bytes of a data file. Contents saved but still queued for the writer
+    thread are returned instead of the older file on disk, so a read never
+    goes behind the saves made before it.
+    """
+    if _PENDING_BYTES is not None:
+        raw = _PENDING_BYTES(path)
+        if raw is not None:
+            return raw
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _read_json(path):
+    """Returns (data, bytes read)."""
+    raw = read_file(path)
+    return json.loads(raw), len(raw)
+
+
+def _encode(data):
+    """File contents for data, with the schema version first."""
+    return json.dumps({"schema_version": SCHEMA_VERSION, **data}, indent=4).encode("utf-8")
+
+
+def write_file(path, raw):
+    """Replaces path atomically with raw bytes. Returns the number of bytes written."""
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, path)
+    return len(raw)
+
+
+def load_user(user_id):
+    """
+    Loads one user's medications and history into DATA_STORE,
+    replacing whatever user was loaded before.
+    """
+    global ACTIVE_USER_ID
+    data = {}
+    path = user_file(user_id)
+    if file_exists(path):
+        if os.path.exists(path):
+            import migrate
+            migrate.upgrade_user_file(path)
+
+        start = time.perf_counter()
+        data, size = _read_json(path)
+        record_io("load", size, time.perf_counter() - start)
+
+    for key in USER_KEYS:
+        DATA_STORE[key] = data.get(key, _empty(key))
+    ACTIVE_USER_ID = user_id
+    _SEGMENT_CACHE.clear()
+    # Derived data is dropped by migrations and skipped by backups
+    if "daily" not in data and (DATA_STORE["history"] or DATA_STORE["archive"]):
+        rebuild_daily()
+    if "counters" not in data and DATA_STORE["archive"]:
+        # Archived rows may refer to medications compacted before IDs were tracked
+        DATA_STORE["counters"]["medications"] = max((log["med_id"] for log in archived_history()), default=0)
+    if "ledger" not in data:
+        # Earlier stock changes were not recorded; start from today's counts,
+        # dated at each medication's first recorded dose
+        first = {}
+        for log in archived_history() + DATA_STORE["history"]:
+            first[log["med_id"]] = min(log["ts"], first.get(log["med_id"], log["ts"]))
+        now = int(time.time())
+        DATA_STORE["ledger"] = sorted(({"med_id": m["id"], "kind": "initial", "delta": m["total_pills"],
+                                        "ts": first.get(m["id"], now)}
+                                       for m in DATA_STORE["medications"] if not is_deleted(m)),
+                                      key=lambda e: e["ts"])
+    if DATA_STORE["sync"].get("vector") is not None:
+        import sync
+        sync.recover()
+    notify(DATA_RELOADED, user_id)
+
+
+def _upgrade_row(log):
+    """Converts an archived row with a local "taken_at" string to ts/tz/day."""
+    if "ts" not in log:
+        log["ts"], log["tz"], log["day"] = clock.parse_local(log.pop("taken_at"))
+
+
+def unload_user():
+    """Releases the active user's medications and history."""
+    global ACTIVE_USER_ID
+    user_id = ACTIVE_USER_ID
+    for key in USER_KEYS:
+        DATA_STORE[key] = _empty(key)
+    ACTIVE_USER_ID = None
+    _SEGMENT_CACHE.clear()
+    notify(DATA_RELOADED, user_id)
+
+
 def save_data():
-    """Writes the current DATA_STORE to the JSON file."""
-    with open(DB_FILE, "w") as f:
-        json.dump(DATA_STORE, f, indent=4)
+    """
+    Writes the user directory and the active user's file. While a writer
+    thread is running (see use_writer()) the store is only serialized
+    here and the writer puts the bytes on disk.
+    """
+    start = time.perf_counter()
+    shared = {k: v for k, v in DATA_STORE.items() if k not in USER_KEYS}
+    files = [(DB_FILE, _encode(shared))]
+    if ACTIVE_USER_ID is not None:
+        files.append((user_file(ACTIVE_USER_ID), _encode({key: DATA_STORE[key] for key in USER_KEYS})))
+
+    if _WRITE_BEHIND is not None:
+        _WRITE_BEHIND(files, current_operation())
+        return
+    size = sum(write_file(path, raw) for path, raw in files)
+    record_io("save", size, time.perf_counter() - start)
+
+
+def save_file(path, raw):
+    """
+    Writes one derived file (e.g. the run-out index) the way save_data()
+    writes the store: handed to the writer thread while one is running.
+    """
+    if _WRITE_BEHIND is not None:
+        _WRITE_BEHIND([(path, raw)], current_operation())
+        return
+    start = time.perf_counter()
+    record_io("save", write_file(path, raw), time.perf_counter() - start)
+
+
+# ============================================
+# HISTORY ARCHIVE
+# ============================================
+# Segment path -> rows, for segments read since the user was loaded
+_SEGMENT_CACHE = {}
+
+
+def archive_dir(user_id):
+    """Folder holding one user's compressed history segments."""
+    return os.path.join(USER_DATA_DIR, "archive", f"user_{user_id}")
+
+
+def archive_cutoff(months=None, today=None):
+    """
+    Day key (YYYYMM01) of the first day of the oldest month kept in the
+    hot store. months defaults to prefs["archive_after_months"], else
+    ARCHIVE_AFTER_MONTHS.
+    """
+    if months is None:
+        months = DATA_STORE.get("prefs", {}).get("archive_after_months", ARCHIVE_AFTER_MONTHS)
+    today = today or clock.today_key()
+    index = today // 10000 * 12 + (today // 100 % 100 - 1) - months
+    return (index // 12) * 10000 + (index % 12 + 1) * 100 + 1
+
+
+def archive_history(months=None):
+    """
+    Moves the active user's history older than archive_cutoff(months) into
+    one compressed segment per month and saves the smaller hot store.
+    Segments are written before the hot store, so a crash can at worst
+    leave rows in both places, never in neither. Returns rows archived.
+
+    Takes STORE_LOCK to pick the rows and to swap them out, but not while
+    compressing and writing the segments; until then readers keep seeing
+    the rows in the hot store. Call it from the thread that makes the
+    changes (the writer thread in the GUI).
+    """
+    with STORE_LOCK:
+        if ACTIVE_USER_ID is None:
+            return 0
+        cutoff = archive_cutoff(months)
+        by_month = {}
+        for log in DATA_STORE["history"]:
+            if log["day"] < cutoff:
+                by_month.setdefault(log["day"] // 100, []).append(log)
+        if not by_month:
+            return 0
+        folder = archive_dir(ACTIVE_USER_ID)
+        taken = {segment["file"].split(".")[0] for segment in DATA_STORE["archive"]}
+
+    ext = ".json.xz" if ARCHIVE_COMPRESSION == "lzma" else ".json.gz"
+    start = time.perf_counter()
+    size = 0
+    segments = []
+    for month, rows in sorted(by_month.items()):
+        rows.sort(key=lambda x: x["ts"])
+        # A month archived again (e.g. after a backdated import) gets a new part
+        base = label = f"{month // 100:04d}-{month % 100:02d}"
+        part = 1
+        while base in taken:
+            part += 1
+            base = f"{label}-{part}"
+        taken.add(base)
+        name = base + ext
+        size += _write_segment(os.path.join(folder, name), rows)
+        segments.append({"file": name, "first": min(r["day"] for r in rows),
+                         "last": max(r["day"] for r in rows), "count": len(rows)})
+    record_io("save", size, time.perf_counter() - start, op="archive_history")
+
+    archived = {id(log) for rows in by_month.values() for log in rows}
+    with STORE_LOCK:
+        DATA_STORE["archive"].extend(segments)
+        writable("history")[:] = [log for log in DATA_STORE["history"] if id(log) not in archived]
+        save_data()
+    return len(archived)
+
+
+def _write_segment(path, rows):
+    raw = json.dumps(rows, separators=(",", ":")).encode("utf-8")
+    raw = lzma.compress(raw) if path.endswith(".xz") else gzip.compress(raw)
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(raw)
+    os.replace(tmp, path)
+    return len(raw)
+
+
+def _read_segment(path):
+    rows = _SEGMENT_CACHE.get(path)
+    if rows is None:
+        _, rows = _load_segment(path)
+        _SEGMENT_CACHE[path] = rows
+    return rows
+
+
+def _load_segment(path):
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = lzma.decompress(raw) if path.endswith(".xz") else gzip.decompress(raw)
+    rows = json.loads(data)
+    # Segments written before timestamps were integers
+    for log in rows:
+        _upgrade_row(log)
+    record_io("load", len(raw), time.perf_counter() - start)
+    return raw, rows
+
+
+def segment_data(segment):
+    """
+    (file bytes, rows) of one entry of the active user's archive index,
+    read without going through the segment cache.
+    """
+    return _load_segment(os.path.join(archive_dir(ACTIVE_USER_ID), segment["file"]))
+
+
+def archived_history(since=None, until=None):
+    """
+    Archived rows of the active user with since <= day < until (day keys,
+    None for open ends). Only segments whose days overlap the range are
+    opened.
+    """
+    return _archived_rows(DATA_STORE["archive"], ACTIVE_USER_ID, since, until)
+
+
+def _archived_rows(archive, user_id, since, until):
+    rows = []
+    for segment in archive:
+        if since is not None and segment["last"] < since:
+            continue
+        if until is not None and segment["first"] >= until:
+            continue
+        for log in _read_segment(os.path.join(archive_dir(user_id), segment["file"])):
+            if (since is None or log["day"] >= since) and (until is None or log["day"] < until):
+                rows.append(log)
+    return rows
+
+
+# ============================================
+# DAILY ROLLUP
+# ============================================
+def add_daily(med_id, day, count=1):
+    """Adds count doses of med_id on day (YYYYMMDD key) to the rollup."""
+    days = writable("daily").setdefault(str(med_id), {})
+    key = str(day)
+    days[key] = days.get(key, 0) + count
+
+
+def rebuild_daily():
+    """Recomputes the rollup from the hot history and every archive segment."""
+    DATA_STORE["daily"] = {}
+    for log in DATA_STORE["history"] + archived_history():
+        add_daily(log["med_id"], log["day"])
+
+
+def daily_counts(med_ids=None, since=None, until=None):
+    """
+    Yields (med_id, day, count) for since <= day < until (YYYYMMDD day
+    keys, None = open end), limited to med_ids if given.
+    """
+    return _daily_counts(DATA_STORE["daily"], med_ids, since, until)
+
+
+def _daily_counts(daily, med_ids, since, until):
+    for key, days in daily.items():
+        med_id = int(key)
+        if med_ids is not None and med_id not in med_ids:
+            continue
+        for day, count in days.items():
+            day = int(day)
+            if (since is None or day >= since) and (until is None or day < until):
+                yield med_id, day, count
+
+
+# ============================================
+# READ SNAPSHOTS
+# ============================================
+class _Prefix(Sequence):
+    """The first `length` items of a list that is only appended to while this exists."""
+
+    def __init__(self, items, length):
+        self._items = items
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._items[:self._length][index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("snapshot index out of range")
+        return self._items[index]
+
+    def __iter__(self):
+        return islice(self._items, self._length)
+
+
+class Snapshot:
+    """
+    The active user's data as of snapshot(), unaffected by later writes.
+    history and ledger are views of the store's own lists: they are only
+    appended to, and a writer that needs to change them otherwise goes
+    through writable(), which first swaps in a copy for the store. daily
+    is shared the same way. medications and the archive index are small
+    and copied. Rows and entries are shared and must not be modified.
+    """
+
+    def __init__(self):
+        self.user_id = ACTIVE_USER_ID
+        self.generation = _GENERATION
+        self.medications = tuple(dict(med) for med in DATA_STORE["medications"])
+        self.history = _Prefix(DATA_STORE["history"], len(DATA_STORE["history"]))
+        self.ledger = _Prefix(DATA_STORE["ledger"], len(DATA_STORE["ledger"]))
+        self.daily = DATA_STORE["daily"]
+        self.archive = tuple(DATA_STORE["archive"])
+        _SNAPSHOTS.add(self)
+
+    def _shares(self, value):
+        return value is self.history._items or value is self.ledger._items or value is self.daily
+
+    def is_current(self):
+        """False once anything has changed since the snapshot was taken."""
+        return self.generation == _GENERATION
+
+    def archived_history(self, since=None, until=None):
+        """Like archived_history(); segments are never rewritten, so no lock is needed."""
+        return _archived_rows(self.archive, self.user_id, since, until)
+
+    def daily_counts(self, med_ids=None, since=None, until=None):
+        return _daily_counts(self.daily, med_ids, since, until)
+
+
+def snapshot():
+    """
+    Returns a Snapshot of the active user's data. Call it under
+    STORE_LOCK; the snapshot itself can then be read from any thread
+    without the lock, for as long as needed.
+    """
+    return Snapshot()
+
+
+def writable(key):
+    """
+    DATA_STORE[key] for changing in place other than by appending. If a
+    live snapshot holds the current object, the store gets a copy first
+    (the rollup one level deep), so the snapshot keeps what it saw.
+    """
+    value = DATA_STORE[key]
+    if any(snap._shares(value) for snap in list(_SNAPSHOTS)):
+        if isinstance(value, dict):
+            DATA_STORE[key] = {k: dict(v) for k, v in value.items()}
+        else:
+            DATA_STORE[key] = list(value)
+    return DATA_STORE[key]
+
+
+# ============================================
+# STORAGE METRICS
+# ============================================
+@contextmanager
+def operation(name):
+    """Attributes storage calls made inside the block (on this thread) to `name`."""
+    stack = _operations()
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def _operations():
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def current_operation():
+    """Innermost operation() name on this thread, else the calling function."""
+    stack = _operations()
+    return stack[-1] if stack else _caller_name()
+
+
+def _caller_name():
+    """Name of the first function outside this module (and tracing wrappers) on the call stack."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") in (__name__, "tracing"):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "unknown"
+
+
+def record_io(kind, nbytes, seconds, op=None):
+    """
+    Records one storage call. kind is "load" or "save". The operation is
+    `op`, else the innermost operation() block, else the calling function.
+    Other storage backends can call this to report into the same metrics.
+    """
+    if op is None:
+        op = current_operation()
+
+    with _METRICS_LOCK:
+        stats = _METRICS[kind].get(op)
+        if stats is None:
+            stats = {"calls": 0, "bytes": 0, "total_ms": 0.0, "max_ms": 0.0,
+                     "histogram": dict.fromkeys([str(b) for b in LATENCY_BUCKETS_MS] + ["inf"], 0)}
+            _METRICS[kind][op] = stats
+
+        ms = seconds * 1000
+        stats["calls"] += 1
+        stats["bytes"] += nbytes
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
+        for bound in LATENCY_BUCKETS_MS:
+            if ms <= bound:
+                stats["histogram"][str(bound)] += 1
+                break
+        else:
+            stats["histogram"]["inf"] += 1
+
+
+def metrics_snapshot():
+    """Totals plus per-operation load/save stats as a JSON-ready dict."""
+    snapshot = {"timestamp": time.time(), "buckets_ms": list(LATENCY_BUCKETS_MS)}
+    for kind in ("load", "save"):
+        with _METRICS_LOCK:
+            ops = json.loads(json.dumps(_METRICS[kind]))
+        snapshot[kind + "s"] = sum(s["calls"] for s in ops.values())
+        snapshot["bytes_" + ("read" if kind == "load" else "written")] = sum(s["bytes"] for s in ops.values())
+        snapshot[kind + "_operations"] = ops
+    return snapshot
+
+
+def write_metrics_snapshot(path):
+    """Writes metrics_snapshot() to `path` for monitoring scripts."""
+    with open(path, "w") as f:
+        json.dump(metrics_snapshot(), f, indent=4)
+
+
+def reset_metrics():
+    with _METRICS_LOCK:
+        for kind in _METRICS:
+            _METRICS[kind].clear()
+
+
+# MED_STORAGE_METRICS=/path/to/file.json writes a snapshot when the process exits
+if os.environ.get("MED_STORAGE_METRICS"):
+    atexit.register(write_metrics_snapshot, os.environ["MED_STORAGE_METRICS"])
 
 
 def get_next_id(table_key):
     """
     Helper function to simulate Auto-Increment ID.
-    Finds the highest ID in the list and adds 1.
+    Finds the highest ID in the list and adds 1. For the user's own
+    tables, IDs removed by compact() are never handed out again:
+    archived history still refers to them.
     """
     current_list = DATA_STORE.get(table_key, [])
-    if not current_list:
-        return 1
+    highest = DATA_STORE["counters"].get(table_key, 0) if table_key in USER_KEYS else 0
+    for item in current_list:
+        highest = max(highest, item["id"])
+    return highest + 1
+
+
+def is_deleted(record):
+    """True if the record has been tombstoned and is waiting for compaction."""
+    return record.get("deleted", False)
+
+
+def compact():
+    """
+    Physically removes tombstoned medications and their history rows,
+    then writes the store. Returns the number of medications removed.
+    """
+    dead = {m["id"]: m["user_id"] for m in DATA_STORE["medications"] if is_deleted(m)}
+    dead_ids = set(dead)
+    if not dead_ids:
+        return 0
+
+    # Remember the highest ID before it disappears, so get_next_id() skips it
+    counters = DATA_STORE["counters"]
+    counters["medications"] = max([counters.get("medications", 0)] + [m["id"] for m in DATA_STORE["medications"]])
+    # Slice assignment keeps the same list objects for anyone holding them.
+    DATA_STORE["medications"][:] = [m for m in DATA_STORE["medications"] if m["id"] not in dead_ids]
+    writable("history")[:] = [h for h in DATA_STORE["history"] if h.get("med_id") not in dead_ids]
+    for med_id in dead_ids:
+        writable("daily").pop(str(med_id), None)
+    writable("ledger")[:] = [e for e in DATA_STORE["ledger"] if e["med_id"] not in dead_ids]
+    # Positions shifted; ledger.py rebuilds the checkpoints on next use
+    DATA_STORE["ledger_checkpoints"][:] = []
+    save_data()
+
+    for user_id in set(dead.values()):
+        notify(HISTORY_PURGED, user_id, [i for i, u in dead.items() if u == user_id])
+    return len(dead_ids)
+
 
-    existing_ids = [item["id"] for item in current_list]
-    return max(existing_ids) + 1
+instrument_module(__name__)
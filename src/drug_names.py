@@ -0,0 +1,216 @@
+"""
+Offline drug-name suggestions for the Add Medication form.
+
+The bundled list (drug_names.txt, one name per line, "#" comments) or
+the file named by MED_DRUG_NAMES is read on first use into a sorted
+array of lowercase keys, so completions for what has been typed so far
+are one bisect plus a slice. When nothing starts with the text, a
+BK-tree over the same keys finds names within a small edit distance
+("quotiapine" -> "Quetiapine"). Swapped neighbouring letters
+("metfromin") are looked up directly: Levenshtein counts them as two
+edits, and the two-edit search is much slower.
+
+The tree takes a few seconds to build for 100k names, so it is built on
+a background thread once the list is loaded; until it is ready only
+prefix suggestions are returned.
+
+Headless use:
+    python src/drug_names.py TEXT [TEXT...]
+"""
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from tracing import instrument_module
+
+NAMES_FILE = os.environ.get("MED_DRUG_NAMES") or os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               "drug_names.txt")
+# Fuzzy matching starts at this many typed characters
+FUZZY_MIN_LENGTH = 4
+
+
+def _pattern(word):
+    """Bit masks of the positions of each character, for edit_distance()."""
+    masks = {}
+    for i, char in enumerate(word):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def edit_distance(pattern, length, text):
+    """
+    Levenshtein distance between the word _pattern() was built from (of
+    `length` characters) and text, using Myers' bit-parallel algorithm:
+    one pass over text with a handful of integer operations per character.
+    """
+    if length == 0:
+        return len(text)
+    mask = (1 << length) - 1
+    high = 1 << (length - 1)
+    pv, mv, score = mask, 0, length
+    for char in text:
+        eq = pattern.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+class BKTree:
+    """Metric tree over words; nodes are [word, {distance: child}]."""
+
+    def __init__(self, words):
+        self.root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = [word, {}]
+            return
+        pattern, length = _pattern(word), len(word)
+        node = self.root
+        while True:
+            distance = edit_distance(pattern, length, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                return
+            node = child
+
+    def within(self, word, max_distance):
+        """(distance, word) for every word within max_distance edits."""
+        if self.root is None:
+            return []
+        pattern, length = _pattern(word), len(word)
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = edit_distance(pattern, length, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0]))
+            # Triangle inequality: only these subtrees can hold matches
+            for edge, child in node[1].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class DrugDictionary:
+    def __init__(self, path=NAMES_FILE):
+        self.path = path
+        # Sorted lowercase keys and their display names
+        self._keys = None
+        self._names = None
+        self._tree = None
+        self._lock = threading.Lock()
+
+    # ----- loading -----
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._keys is not None:
+                return
+            names = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        name = line.strip()
+                        if name and not name.startswith("#"):
+                            names.setdefault(name.lower(), name)
+            self._keys = sorted(names)
+            self._names = [names[key] for key in self._keys]
+        threading.Thread(target=self._build_tree, name="drug-names", daemon=True).start()
+
+    def _build_tree(self):
+        self._tree = BKTree(self._keys)
+
+    def load(self, wait=False):
+        """Reads the list now; with wait=True also waits for the fuzzy index."""
+        self._ensure_loaded()
+        while wait and self._tree is None:
+            time.sleep(0.01)
+        return len(self._keys)
+
+    # ----- lookups -----
+    def _name(self, key):
+        i = bisect_left(self._keys, key)
+        return self._names[i] if i < len(self._keys) and self._keys[i] == key else None
+
+    def complete(self, text, limit=6):
+        """Names starting with text (case-insensitive), alphabetically."""
+        self._ensure_loaded()
+        prefix = text.strip().lower()
+        if not prefix:
+            return []
+        i = bisect_left(self._keys, prefix)
+        result = []
+        while i < len(self._keys) and len(result) < limit and self._keys[i].startswith(prefix):
+            result.append(self._names[i])
+            i += 1
+        return result
+
+    def similar(self, text, limit=6):
+        """
+        Closest names within 1 edit or one swap of neighbouring letters
+        (2 edits for words of 8+ letters), nearest first.
+        """
+        self._ensure_loaded()
+        word = text.strip().lower()
+        tree = self._tree
+        if tree is None or len(word) < FUZZY_MIN_LENGTH:
+            return []
+        # Most typos are one edit away; the wider search costs far more
+        found = tree.within(word, 1)
+        if not found:
+            swaps = {word[:i] + word[i + 1] + word[i] + word[i + 2:] for i in range(len(word) - 1)}
+            found = [(1, key) for key in swaps if self._name(key) is not None]
+        if not found and len(word) >= 8:
+            found = tree.within(word, 2)
+        return [self._name(key) for _, key in sorted(found)[:limit]]
+
+    def suggest(self, text, limit=6):
+        """Completions of text, or similar names if nothing starts with it."""
+        return self.complete(text, limit) or self.similar(text, limit)
+
+    def canonical(self, text):
+        """The listed spelling of text if it is in the list (any case), else text stripped."""
+        self._ensure_loaded()
+        text = text.strip()
+        return self._name(text.lower()) or text
+
+
+DRUGS = DrugDictionary()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    start = time.perf_counter()
+    count = DRUGS.load(wait=True)
+    print(f"{count} names loaded in {time.perf_counter() - start:.2f}s")
+    for text in argv:
+        start = time.perf_counter()
+        suggestions = DRUGS.suggest(text)
+        print(f"{text!r}: {', '.join(suggestions) or '-'}  ({(time.perf_counter() - start) * 1000:.2f} ms)")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 from fpdf import FPDF
-from medication import get_medication_history
+import clock
+import database
+from service import SERVICE
+from tracing import instrument_module
 
 
 class PDFReport(FPDF):
@@ -16,7 +19,12 @@ class PDFReport(FPDF):
 
 def generate_pdf_report(user_id: int, filename: str = "Medication_Report.pdf"):
     try:
-        history_data = get_medication_history(user_id)
+        with database.operation("export"):
+            # One snapshot for both, so the summary matches the list even
+            # if doses are recorded while the report is being built
+            snap = SERVICE.snapshot()
+            history_data = SERVICE.get_history(user_id, snap=snap)
+            daily_data = SERVICE.get_daily_counts(user_id, snap=snap)
 
         if not history_data:
             print("No history found for this user.")
@@ -29,6 +37,28 @@ def generate_pdf_report(user_id: int, filename: str = "Medication_Report.pdf"):
         pdf.set_font("Times", 'B', 12)
         pdf.set_fill_color(200, 220, 255)
 
+        # Summary per medication, from the daily rollup
+        summary = {}
+        for row in daily_data:
+            entry = summary.setdefault(row['medication_name'], {"doses": 0, "days": 0, "first": row['day']})
+            entry["doses"] += row['count']
+            entry["days"] += 1
+            entry["last"] = row['day']
+
+        pdf.cell(70, 10, "Medication", 1, 0, 'L', True)
+        pdf.cell(30, 10, "Doses", 1, 0, 'L', True)
+        pdf.cell(30, 10, "Days", 1, 0, 'L', True)
+        pdf.cell(60, 10, "Period", 1, 1, 'L', True)
+
+        pdf.set_font("Times", size=12)
+        for name, entry in sorted(summary.items()):
+            pdf.cell(70, 10, str(name), 1)
+            pdf.cell(30, 10, str(entry["doses"]), 1)
+            pdf.cell(30, 10, str(entry["days"]), 1)
+            pdf.cell(60, 10, f"{clock.format_day(entry['first'])} - {clock.format_day(entry['last'])}", 1, 1)
+        pdf.ln(10)
+
+        pdf.set_font("Times", 'B', 12)
         pdf.cell(100, 10, "Medication Name", 1, 0, 'L', True)
         pdf.cell(90, 10, "Time Taken", 1, 1, 'L', True)
 
@@ -36,7 +66,7 @@ def generate_pdf_report(user_id: int, filename: str = "Medication_Report.pdf"):
 
         for record in history_data:
             name = record['medication_name']
-            time = record['time_taken']
+            time = clock.format_ts(record['ts'], record['tz'])
             pdf.cell(100, 10, str(name), 1)
             pdf.cell(90, 10, str(time), 1, 1)
 
@@ -47,3 +77,6 @@ def generate_pdf_report(user_id: int, filename: str = "Medication_Report.pdf"):
     except Exception as e:
         print(f"Error generating PDF: {e}")
         return False
+
+
+instrument_module(__name__)
@@ -0,0 +1,96 @@
+"""
+Layout of the adherence calendar.
+
+The calendar view draws every day of a month or a year as one rectangle
+on a single canvas, coloured by how many doses the daily rollup holds
+for that day compared with the medication's pills_per_day. This module
+decides where each day goes and which colour level it gets; the GUI only
+turns cells into canvas items, so a year is ~365 canvas items rather
+than a widget per history row.
+
+Month grids have a row per week and Monday..Sunday columns; year grids
+have a column per week and Monday..Sunday rows.
+"""
+
+from datetime import date, timedelta
+
+import clock
+from tracing import instrument_module
+
+MONTH = "month"
+YEAR = "year"
+
+# Colour levels, see level()
+NONE, SOME, ALL, EXTRA, FUTURE = range(5)
+
+
+def period(mode, year, month=1):
+    """(since, until) day keys of the month or year shown, until exclusive."""
+    if mode == YEAR:
+        return year * 10000 + 101, (year + 1) * 10000 + 101
+    next_year, next_month = shift(MONTH, year, month, 1)
+    return year * 10000 + month * 100 + 1, next_year * 10000 + next_month * 100 + 1
+
+
+def shift(mode, year, month, step):
+    """(year, month) step months (or years) away."""
+    if mode == YEAR:
+        return year + step, month
+    index = year * 12 + month - 1 + step
+    return index // 12, index % 12 + 1
+
+
+def cells(mode, year, month=1):
+    """(day key, column, row) for every day of the period, in date order."""
+    since, until = period(mode, year, month)
+    first = clock.key_to_date(since)
+    last = clock.key_to_date(until) - timedelta(days=1)
+    # Monday of the first week, so week numbers count from the grid's left/top
+    start = first - timedelta(days=first.weekday())
+    result = []
+    day = first
+    while day <= last:
+        week = (day - start).days // 7
+        if mode == YEAR:
+            result.append((clock.day_key(day), week, day.weekday()))
+        else:
+            result.append((clock.day_key(day), day.weekday(), week))
+        day += timedelta(days=1)
+    return result
+
+
+def level(count, per_day, day=None, today=None):
+    """Colour level of a day with count doses against per_day prescribed."""
+    if day is not None and day > (today or clock.today_key()):
+        return FUTURE
+    if count <= 0:
+        return NONE
+    if count < per_day:
+        return SOME
+    return ALL if count == per_day else EXTRA
+
+
+def adherence(counts, per_day, since, until, today=None):
+    """
+    (days with every dose, days so far) between since and until, counting
+    only days up to today. counts maps day keys to doses.
+    """
+    today = today or clock.today_key()
+    end = min(clock.key_to_date(until), clock.key_to_date(today) + timedelta(days=1))
+    day = clock.key_to_date(since)
+    full = total = 0
+    while day < end:
+        total += 1
+        if counts.get(clock.day_key(day), 0) >= per_day:
+            full += 1
+        day += timedelta(days=1)
+    return full, total
+
+
+def month_start(day=None):
+    """(year, month) of a day key, today by default."""
+    current = clock.key_to_date(day) if day else date.today()
+    return current.year, current.month
+
+
+instrument_module(__name__)
@@ -0,0 +1,253 @@
+"""
+Bulk import of medications and dose history from CSV or JSON Lines files.
+
+All rows are validated first. If any row is invalid nothing is changed,
+otherwise everything is applied in memory and written with a single
+save_data() call.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from database import DATA_STORE, save_data, get_next_id, is_deleted, notify, add_daily
+from database import MEDICATION_ADDED, DOSE_RECORDED
+import clock
+import ledger
+import sync
+from tracing import instrument_module
+
+
+def read_rows(path):
+    """
+    Yields one dict per row from a .csv file or a JSON Lines file
+    (.jsonl / .ndjson). Blank lines in JSON Lines files are skipped.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if ext == ".csv":
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _to_int(value, field, errors, row_no, minimum=0):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        errors.append(f"row {row_no}: '{field}' must be a whole number")
+        return None
+
+    if number < minimum:
+        errors.append(f"row {row_no}: '{field}' must be at least {minimum}")
+        return None
+
+    return number
+
+
+def validate_medications(rows):
+    """
+    Checks medication rows (name, total_pills, pills_per_day).
+    Returns (clean_rows, errors).
+    """
+    clean = []
+    errors = []
+
+    for row_no, row in enumerate(rows, start=1):
+        name = str(row.get("name") or "").strip()
+        if not name:
+            errors.append(f"row {row_no}: 'name' is required")
+            continue
+
+        total = _to_int(row.get("total_pills"), "total_pills", errors, row_no)
+        daily = _to_int(row.get("pills_per_day"), "pills_per_day", errors, row_no, minimum=1)
+        if total is None or daily is None:
+            continue
+
+        clean.append({"name": name, "total_pills": total, "pills_per_day": daily})
+
+    return clean, errors
+
+
+def validate_history(rows, known_names):
+    """
+    Checks history rows (medication_name or med_id, taken_at, optional
+    amount of pills taken in that dose).
+    known_names maps lower-cased medication names to IDs.
+    Returns (clean_rows, errors).
+    """
+    known_ids = set(known_names.values())
+    clean = []
+    errors = []
+
+    for row_no, row in enumerate(rows, start=1):
+        med_id = row.get("med_id")
+        if med_id not in (None, ""):
+            med_id = _to_int(med_id, "med_id", errors, row_no, minimum=1)
+            if med_id is None:
+                continue
+            if med_id not in known_ids:
+                errors.append(f"row {row_no}: unknown med_id {med_id}")
+                continue
+        else:
+            name = str(row.get("medication_name") or "").strip()
+            med_id = known_names.get(name.lower())
+            if med_id is None:
+                errors.append(f"row {row_no}: unknown medication '{name}'")
+                continue
+
+        taken_at = str(row.get("taken_at") or "").strip()
+        try:
+            ts, tz, day = clock.parse_local(taken_at)
+        except ValueError:
+            errors.append(f"row {row_no}: 'taken_at' must look like 2025-01-31 08:00:00")
+            continue
+
+        amount = row.get("amount")
+        if amount in (None, ""):
+            amount = 1
+        else:
+            amount = _to_int(amount, "amount", errors, row_no, minimum=1)
+            if amount is None:
+                continue
+
+        clean.append({"med_id": med_id, "ts": ts, "tz": tz, "day": day, "amount": amount})
+
+    return clean, errors
+
+
+def import_records(user_id, medications=(), history=(), adjust_stock=True):
+    """
+    Imports medication and history rows for one user in a single pass.
+
+    Medication names are matched case-insensitively against the user's
+    existing medications; unknown names create new medications. History
+    rows are resolved to medication IDs, one history row each, and each
+    dose's amount is subtracted from stock when adjust_stock is True.
+
+    Returns a dict with "medications", "history" and "errors". When
+    "errors" is not empty nothing was imported.
+    """
+    med_rows, errors = validate_medications(medications)
+
+    user_meds = [m for m in DATA_STORE["medications"]
+                 if m["user_id"] == user_id and not is_deleted(m)]
+    names = {m["name"].lower(): m["id"] for m in user_meds}
+
+    # Work out which rows are new before touching the store, so history rows
+    # can refer to medications imported in the same batch.
+    next_id = get_next_id("medications")
+    new_meds = []
+    for row in med_rows:
+        key = row["name"].lower()
+        if key in names:
+            continue
+        med = {"id": next_id, "user_id": user_id, **row}
+        names[key] = next_id
+        new_meds.append(med)
+        next_id += 1
+
+    history_rows, history_errors = validate_history(history, names)
+    errors.extend(f"history {e}" for e in history_errors)
+
+    if errors:
+        return {"medications": 0, "history": 0, "errors": errors}
+
+    # New medications start at their first imported dose, so the ledger
+    # never shows them below zero before they existed
+    first_dose = {}
+    for row in history_rows:
+        first_dose[row["med_id"]] = min(row["ts"], first_dose.get(row["med_id"], row["ts"]))
+    DATA_STORE["medications"].extend(new_meds)
+    stock = [ledger.entry(med["id"], ledger.INITIAL, med["total_pills"], first_dose.get(med["id"]))
+             for med in new_meds]
+    for med in new_meds:
+        sync.log_medication(med)
+    meds_by_id = {m["id"]: m for m in user_meds + new_meds}
+
+    # One history row per dose, as take_medications() records it; amount
+    # only says how many pills that dose used. Doses are booked in time
+    # order so the ledger can answer stock and consumption at past dates.
+    entries = []
+    for row in sorted(history_rows, key=lambda r: r["ts"]):
+        med = meds_by_id[row["med_id"]]
+        entries.append({
+            "med_id": med["id"],
+            "medication_name": med["name"],
+            "ts": row["ts"],
+            "tz": row["tz"],
+            "day": row["day"]
+        })
+        add_daily(med["id"], row["day"])
+        if adjust_stock:
+            new_total = max(0, med["total_pills"] - row["amount"])
+            if new_total != med["total_pills"]:
+                stock.append(ledger.entry(med["id"], ledger.DOSE, new_total - med["total_pills"], row["ts"]))
+                med["total_pills"] = new_total
+
+    DATA_STORE["history"].extend(entries)
+    sync.log_doses(entries)
+    ledger.record_many(stock)
+    save_data()
+
+    if new_meds:
+        notify(MEDICATION_ADDED, user_id, [m["id"] for m in new_meds])
+    dosed_ids = sorted({row["med_id"] for row in history_rows})
+    if dosed_ids:
+        notify(DOSE_RECORDED, user_id, dosed_ids)
+
+    return {"medications": len(new_meds), "history": len(entries), "errors": []}
+
+
+def import_files(user_id, medications_path=None, history_path=None, adjust_stock=True):
+    """Reads the given files and passes their rows to import_records()."""
+    medications = list(read_rows(medications_path)) if medications_path else []
+    history = list(read_rows(history_path)) if history_path else []
+    return import_records(user_id, medications, history, adjust_stock)
+
+
+def main(argv=None):
+    """Headless entry point: python src/importer.py USER_ID [--medications F] [--history F]"""
+    import argparse
+    from database import init_db, load_user
+
+    parser = argparse.ArgumentParser(description="Bulk import medications and dose history.")
+    parser.add_argument("user_id", type=int)
+    parser.add_argument("--medications", help="CSV or JSON Lines file of medications")
+    parser.add_argument("--history", help="CSV or JSON Lines file of dose history")
+    parser.add_argument("--keep-stock", action="store_true",
+                        help="do not subtract imported doses from stock")
+    args = parser.parse_args(argv)
+
+    init_db()
+    load_user(args.user_id)
+
+    start = time.perf_counter()
+    result = import_files(args.user_id, args.medications, args.history,
+                          adjust_stock=not args.keep_stock)
+    elapsed = time.perf_counter() - start
+
+    if result["errors"]:
+        for error in result["errors"][:50]:
+            print(error)
+        print(f"Import aborted: {len(result['errors'])} invalid rows.")
+        return 1
+
+    rows = result["medications"] + result["history"]
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"Imported {result['medications']} medications and {result['history']} doses "
+          f"in {elapsed:.2f}s ({rate:,.0f} rows/s).")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
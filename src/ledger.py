@@ -0,0 +1,190 @@
+"""
+Stock ledger: every change to a medication's pill count as an event.
+
+DATA_STORE["ledger"] is an append-only list of
+{"med_id", "kind", "delta", "ts"} where kind is initial, dose, refill
+or adjust and ts is epoch seconds. Every CHECKPOINT_EVERY entries a
+checkpoint stores the running balance and total consumed pills of each
+medication, so the stock at any time is one bisect over the checkpoints plus a replay of
+at most CHECKPOINT_EVERY entries. Checkpoints are derived data and are
+rebuilt on demand when missing (after compaction, a restore or a
+backdated import).
+
+    python src/ledger.py alice                      # stock today, 30-day use
+    python src/ledger.py alice --on 2024-03-01 --days 7
+    python src/ledger.py alice --med Aspirin        # every entry of one medication
+"""
+
+import sys
+import time
+from bisect import bisect_right
+
+import clock
+import database
+from database import DATA_STORE
+import sync
+from tracing import instrument_module
+
+INITIAL = "initial"
+DOSE = "dose"
+REFILL = "refill"
+ADJUST = "adjust"
+
+CHECKPOINT_EVERY = 100
+
+
+def entry(med_id, kind, delta, ts=None):
+    """One stock change; delta is the signed change in pills."""
+    return {
+        "med_id": med_id,
+        "kind": kind,
+        "delta": delta,
+        "ts": int(ts if ts is not None else time.time())
+    }
+
+
+def record(med_id, kind, delta, ts=None):
+    """Appends one stock change; delta is the signed change in pills."""
+    record_many([entry(med_id, kind, delta, ts)])
+
+
+def record_many(new_entries):
+    """
+    Adds entry() dicts with one change-log write. Entries older than the
+    last one (backdated imports) are merged in time order and the
+    checkpoints are rebuilt on next use.
+    """
+    if not new_entries:
+        return
+    entries = DATA_STORE["ledger"]
+    stamps = [e["ts"] for e in entries[-1:] + new_entries]
+    if any(a > b for a, b in zip(stamps, stamps[1:])):
+        entries = database.writable("ledger")
+        entries.extend(new_entries)
+        entries.sort(key=lambda e: e["ts"])
+        DATA_STORE["ledger_checkpoints"][:] = []
+    else:
+        entries.extend(new_entries)
+    sync.log_stock(new_entries)
+    if len(entries) // CHECKPOINT_EVERY > len(DATA_STORE["ledger_checkpoints"]):
+        _checkpoints()
+
+
+def _replay(balances, consumed, entries, until=None):
+    for entry in entries:
+        if until is not None and entry["ts"] > until:
+            break
+        key = str(entry["med_id"])
+        balances[key] = balances.get(key, 0) + entry["delta"]
+        if entry["kind"] == DOSE:
+            consumed[key] = consumed.get(key, 0) - entry["delta"]
+
+
+def _checkpoints():
+    """Checkpoint list, extended up to the last full CHECKPOINT_EVERY block."""
+    entries = DATA_STORE["ledger"]
+    checkpoints = DATA_STORE["ledger_checkpoints"]
+    while len(checkpoints) < len(entries) // CHECKPOINT_EVERY:
+        if checkpoints:
+            last = checkpoints[-1]
+            balances, consumed, pos = dict(last["balances"]), dict(last["consumed"]), last["pos"]
+        else:
+            balances, consumed, pos = {}, {}, 0
+        end = pos + CHECKPOINT_EVERY
+        _replay(balances, consumed, entries[pos:end])
+        checkpoints.append({"pos": end, "ts": entries[end - 1]["ts"],
+                            "balances": balances, "consumed": consumed})
+    return checkpoints
+
+
+def _state_at(ts):
+    """(balances, consumed) keyed by str(med_id) as of epoch seconds ts."""
+    checkpoints = _checkpoints()
+    i = bisect_right(checkpoints, ts, key=lambda c: c["ts"])
+    if i:
+        start = checkpoints[i - 1]
+        balances, consumed, pos = dict(start["balances"]), dict(start["consumed"]), start["pos"]
+    else:
+        balances, consumed, pos = {}, {}, 0
+    _replay(balances, consumed, DATA_STORE["ledger"][pos:], until=ts)
+    return balances, consumed
+
+
+def stock_on(med_id, ts):
+    """
+    Pills in stock at epoch seconds ts. None if the medication had no
+    ledger entries yet.
+    """
+    balances, _ = _state_at(ts)
+    return balances.get(str(med_id))
+
+
+def consumed_between(med_id, since, until):
+    """Pills taken as doses with since < ts <= until (epoch seconds)."""
+    _, before = _state_at(since)
+    _, after = _state_at(until)
+    key = str(med_id)
+    return after.get(key, 0) - before.get(key, 0)
+
+
+def consumption_rate(med_id, days=30):
+    """Average pills per day taken over the last `days` days."""
+    now = int(time.time())
+    return consumed_between(med_id, now - days * 86400, now) / days
+
+
+def entries_for(med_id):
+    """Ledger entries of one medication, oldest first."""
+    return [e for e in DATA_STORE["ledger"] if e["med_id"] == med_id]
+
+
+def main(argv=None):
+    import argparse
+    from datetime import datetime
+
+    from service import SERVICE
+
+    parser = argparse.ArgumentParser(description="Show a user's stock history from the ledger.")
+    parser.add_argument("username")
+    parser.add_argument("--on", help="stock at the end of this day, YYYY-MM-DD (default: today)")
+    parser.add_argument("--days", type=int, default=30, help="average use over this many days")
+    parser.add_argument("--med", help="list every ledger entry of this medication instead")
+    args = parser.parse_args(argv)
+
+    try:
+        day = clock.day_key(datetime.strptime(args.on, "%Y-%m-%d")) if args.on else clock.today_key()
+    except ValueError:
+        print(f"--on must look like 2025-01-31, not '{args.on}'")
+        return 1
+
+    database.init_db()
+    user_id = next((u["id"] for u in DATA_STORE["users"] if u["username"] == args.username), None)
+    if user_id is None:
+        print(f"Unknown user '{args.username}'")
+        return 1
+    database.load_user(user_id)
+    meds = [m for m in SERVICE.get_medications(user_id)
+            if args.med is None or m["name"].lower() == args.med.lower()]
+    if not meds:
+        print(f"No medication named '{args.med}'" if args.med else "No medications.")
+        return 1 if args.med else 0
+
+    if args.med:
+        for e in SERVICE.stock_entries(user_id, meds[0]["id"]):
+            when = time.strftime(clock.TIME_FORMAT, time.localtime(e["ts"]))
+            print(f"{when}  {e['kind']:<7} {e['delta']:+5}")
+        return 0
+
+    print(f"Stock on {clock.format_day(day)}, average use over {args.days} days:")
+    for med in meds:
+        stock = SERVICE.stock_on(user_id, med["id"], day)
+        rate = SERVICE.consumption_rate(user_id, med["id"], args.days)
+        print(f"  {med['name']}: {'-' if stock is None else stock} pills, {rate:.1f}/day")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
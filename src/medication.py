@@ -1,5 +1,10 @@
-from datetime import datetime
-from database import DATA_STORE, save_data, get_next_id
+from database import DATA_STORE, save_data, get_next_id, is_deleted, notify, snapshot
+from database import add_daily
+from database import MEDICATION_ADDED, MEDICATION_UPDATED, MEDICATION_DELETED, DOSE_RECORDED
+import clock
+import ledger
+import sync
+from tracing import instrument_module
 
 def add_medication(user_id, name, total_pills, pills_per_day):
     new_id = get_next_id("medications")
@@ -13,18 +18,25 @@ def add_medication(user_id, name, total_pills, pills_per_day):
     }
 
     DATA_STORE["medications"].append(med_dict)
+    sync.log_medication(med_dict)
+    ledger.record(new_id, ledger.INITIAL, total_pills)
     save_data()
+    notify(MEDICATION_ADDED, user_id, [new_id])
     return True
 
 
 def get_user_medications(user_id):
     """
-    Returns a list of meds for the user with calculated Days Remaining.
+    Returns a list of meds for the user with calculated Days Remaining
+    and the number of doses taken today.
     """
     output_list = []
 
+    today = str(clock.today_key())
+    daily = DATA_STORE["daily"]
+
     for med in DATA_STORE["medications"]:
-        if med["user_id"] == user_id:
+        if med["user_id"] == user_id and not is_deleted(med):
 
             current_stock = med["total_pills"]
             daily_dose = med["pills_per_day"]
@@ -39,6 +51,7 @@ def get_user_medications(user_id):
             med_for_ui = med.copy()
             med_for_ui["days_remaining"] = days_remaining
             med_for_ui["alert"] = is_low_stock
+            med_for_ui["taken_today"] = daily.get(str(med["id"]), {}).get(today, 0)
 
             output_list.append(med_for_ui)
 
@@ -46,48 +59,169 @@ def get_user_medications(user_id):
 
 
 def take_medication(med_id, amount=1):
-    found_med = None
-    for med in DATA_STORE["medications"]:
-        if med["id"] == med_id:
-            found_med = med
-            break
+    ok, stocks = take_medications([(med_id, amount)])
+    if not ok:
+        return False, 0
+    return True, stocks[med_id]
+
 
-    if not found_med:
+def take_medications(doses):
+    """
+    Records several doses at once. doses is a list of (med_id, amount).
+    Either every dose is recorded with a single save, or nothing changes
+    if any med_id is unknown.
+    Returns (success, {med_id: new_stock}).
+    """
+    meds_by_id = {}
+    for med in DATA_STORE["medications"]:
+        if not is_deleted(med):
+            meds_by_id[med["id"]] = med
+
+    for med_id, amount in doses:
+        if med_id not in meds_by_id:
+            return False, {}
+
+    ts, tz, day = clock.now()
+    new_stocks = {}
+    entries = []
+
+    for med_id, amount in doses:
+        found_med = meds_by_id[med_id]
+        new_total = max(0, found_med["total_pills"] - amount)
+        ledger.record(med_id, ledger.DOSE, new_total - found_med["total_pills"], ts)
+        found_med["total_pills"] = new_total
+        new_stocks[med_id] = new_total
+
+        history_entry = {
+            "med_id": med_id,
+            "medication_name": found_med["name"],
+            "ts": ts,
+            "tz": tz,
+            "day": day
+        }
+        DATA_STORE["history"].append(history_entry)
+        entries.append(history_entry)
+        add_daily(med_id, day)
+
+    if doses:
+        sync.log_doses(entries)
+        save_data()
+        for user_id in {meds_by_id[med_id]["user_id"] for med_id in new_stocks}:
+            notify(DOSE_RECORDED, user_id,
+                   [med_id for med_id in new_stocks if meds_by_id[med_id]["user_id"] == user_id])
+    return True, new_stocks
+
+
+def refill_medication(med_id, amount):
+    """
+    Adds a refill of `amount` pills to stock.
+    Returns (success, new_stock).
+    """
+    if amount <= 0:
         return False, 0
+    for med in DATA_STORE["medications"]:
+        if med["id"] == med_id and not is_deleted(med):
+            med["total_pills"] += amount
+            ledger.record(med_id, ledger.REFILL, amount)
+            save_data()
+            notify(MEDICATION_UPDATED, med["user_id"], [med_id])
+            return True, med["total_pills"]
 
-    current = found_med["total_pills"]
-    new_stock = max(0, current - amount)
-    found_med["total_pills"] = new_stock
+    return False, 0
 
-    history_entry = {
-        "med_id": med_id,
-        "medication_name": found_med["name"],
-        "taken_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    DATA_STORE["history"].append(history_entry)
 
-    save_data()
-    return True, new_stock
+def adjust_stock(med_id, new_total):
+    """
+    Corrects the stock to a counted value, recording the difference.
+    Returns (success, new_stock).
+    """
+    if new_total < 0:
+        return False, 0
+    for med in DATA_STORE["medications"]:
+        if med["id"] == med_id and not is_deleted(med):
+            delta = new_total - med["total_pills"]
+            if delta:
+                med["total_pills"] = new_total
+                ledger.record(med_id, ledger.ADJUST, delta)
+                save_data()
+                notify(MEDICATION_UPDATED, med["user_id"], [med_id])
+            return True, new_total
+
+    return False, 0
 
 
-def get_medication_history(user_id):
+def delete_medication(med_id):
     """
-    Filters history logs.
+    Marks a medication as deleted and saves the tombstone. Its history
+    stays in the store until database.compact() runs, but every query
+    skips it straight away.
     """
-    user_med_ids = []
     for med in DATA_STORE["medications"]:
-        if med["user_id"] == user_id:
-            user_med_ids.append(med["id"])
+        if med["id"] == med_id and not is_deleted(med):
+            med["deleted"] = True
+            sync.log_delete(med)
+            save_data()
+            notify(MEDICATION_DELETED, med["user_id"], [med_id])
+            return True
+
+    return False
+
 
-    user_history = [log for log in DATA_STORE["history"] if log["med_id"] in user_med_ids]
+def get_medication_history(user_id, since=None, until=None, snap=None):
+    """
+    Filters history logs to since <= day < until (YYYYMMDD day keys,
+    None = open end). Archived rows are read only when the range reaches
+    into the archive. Rows carry ts/tz/day; format them with clock.format_ts().
+    Reads snap (a database.Snapshot) if given, else the store as it is now.
+    """
+    snap = snap or snapshot()
+    user_med_ids = set()
+    for med in snap.medications:
+        if med["user_id"] == user_id and not is_deleted(med):
+            user_med_ids.add(med["id"])
 
-    user_history.sort(key=lambda x: x["taken_at"], reverse=True)
+    user_history = [log for rows in (snap.history, snap.archived_history(since, until)) for log in rows
+                    if log["med_id"] in user_med_ids
+                    and (since is None or log["day"] >= since)
+                    and (until is None or log["day"] < until)]
+
+    user_history.sort(key=lambda x: x["ts"], reverse=True)
 
     result = []
     for log in user_history:
         result.append({
             "medication_name": log["medication_name"],
-            "time_taken": log["taken_at"]
+            "ts": log["ts"],
+            "tz": log["tz"],
+            "day": log["day"]
         })
 
     return result
+
+
+def get_daily_counts(user_id, since=None, until=None, snap=None):
+    """
+    Doses per medication per day from the rollup, oldest day first.
+    Returns dicts with med_id, medication_name, day (YYYYMMDD key) and count.
+    Reads snap (a database.Snapshot) if given, else the store as it is now.
+    """
+    snap = snap or snapshot()
+    names = {}
+    for med in snap.medications:
+        if med["user_id"] == user_id and not is_deleted(med):
+            names[med["id"]] = med["name"]
+
+    rows = []
+    for med_id, day, count in snap.daily_counts(set(names), since, until):
+        rows.append({
+            "med_id": med_id,
+            "medication_name": names[med_id],
+            "day": day,
+            "count": count
+        })
+
+    rows.sort(key=lambda x: (x["day"], x["medication_name"]))
+    return rows
+
+
+instrument_module(__name__)
@@ -0,0 +1,235 @@
+"""
+Opt-in memory profiling for the GUI and the data store.
+
+Enable by starting the app with MED_MEM_PROFILE=1 (a number > 1 sets how
+many stack frames tracemalloc keeps per allocation). When disabled,
+checkpoint_after() returns the function unchanged and nothing is traced.
+
+A tracemalloc snapshot is taken after every view transition and once the
+app is idle after each data change. Every checkpoint records the traced
+total, the allocation sites that grew most since the previous
+checkpoint, the number of live Tk widgets per dashboard view and any
+registered gauges (tracked widget lists, DATA_STORE sizes). Records are
+appended as JSON lines to logs/memory.log; summary_lines() feeds the
+F12 overlay.
+
+Headless leak check (exits 1 if memory keeps growing):
+    python src/mem_profile.py [--rounds 200]
+"""
+
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from functools import wraps
+
+from ui_metrics import count_widgets
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_FILE = os.path.join(_PROJECT_ROOT, "logs", "memory.log")
+
+# Allocation sites listed per checkpoint
+TOP_SITES = 10
+# Files whose allocations are profiler noise; dropped from the site lists
+# (filtering the snapshot itself costs far more than grouping it)
+_IGNORED = {tracemalloc.__file__, "<frozen importlib._bootstrap>",
+            "<frozen importlib._bootstrap_external>", "<unknown>"}
+
+
+def _setting():
+    value = os.environ.get("MED_MEM_PROFILE", "")
+    if value in ("", "0"):
+        return 0
+    return int(value) if value.isdigit() else 1
+
+
+def view_widgets(root):
+    """Live widgets per cached dashboard view, plus everything else as "other"."""
+    counts = {}
+    for key, frame in getattr(root, "views", {}).items():
+        if frame.winfo_exists():
+            counts[key] = count_widgets(frame)
+    counts["other"] = count_widgets(root) - sum(counts.values())
+    return counts
+
+
+class MemoryProfiler:
+    def __init__(self, frames):
+        self.enabled = frames > 0
+        self.frames = max(1, frames)
+        self.gauges = {}
+        self.records = []
+        self._previous = None
+        self._pending = None
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def add_gauge(self, name, func):
+        """func() -> number, recorded at every checkpoint."""
+        self.gauges[name] = func
+
+    # ----- snapshots -----
+    @staticmethod
+    def _sites(stats):
+        return [s for s in stats if s.traceback[0].filename not in _IGNORED][:TOP_SITES]
+
+    def checkpoint(self, label, root=None):
+        """Takes a snapshot and records growth since the previous one. Returns the record."""
+        if not tracemalloc.is_tracing():
+            return None
+        start = time.perf_counter()
+        # Unreachable cycles would otherwise show up as growth until the GC runs
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        record = {"label": label, "traced_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1)}
+
+        if self._previous is not None:
+            stats = snapshot.compare_to(self._previous, "lineno")
+            record["growth_kb"] = round(sum(s.size_diff for s in stats) / 1024, 1)
+            record["top_growth"] = [
+                {"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                 "kb": round(s.size_diff / 1024, 1), "count": s.count_diff}
+                for s in self._sites(stats) if s.size_diff > 0
+            ]
+        else:
+            record["top_sites"] = [
+                {"site": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                 "kb": round(s.size / 1024, 1), "count": s.count}
+                for s in self._sites(snapshot.statistics("lineno"))
+            ]
+        self._previous = snapshot
+
+        if root is not None:
+            record["widgets"] = view_widgets(root)
+        for name, func in self.gauges.items():
+            record[name] = func()
+        record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        self.records.append(record)
+        del self.records[:-100]
+        self._log(record)
+        return record
+
+    def checkpoint_when_idle(self, label, root):
+        """Coalesces bursts of data changes into one checkpoint once Tk is idle."""
+        if self._pending is None:
+            self._pending = root.after_idle(self._run_pending, label, root)
+
+    def _run_pending(self, label, root):
+        self._pending = None
+        self.checkpoint(label, root)
+
+    def checkpoint_after(self, label):
+        """Decorator for MedicationApp methods (args[0] is the Tk root)."""
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.checkpoint(label, args[0])
+            return wrapper
+        return decorator
+
+    # ----- output -----
+    def _log(self, record):
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        with open(LOG_FILE, "a") as f:
+            f.write(json.dumps({"ts": round(time.time(), 3), **record}) + "\n")
+
+    def summary_lines(self):
+        """Latest checkpoint for the debug overlay."""
+        if not self.records:
+            return []
+        last = self.records[-1]
+        lines = [f"memory @ {last['label']}: {last['traced_kb']:.0f} KB traced "
+                 f"({last.get('growth_kb', 0):+.0f} KB), peak {last['peak_kb']:.0f} KB"]
+        if "widgets" in last:
+            lines.append("widgets: " + "  ".join(f"{k} {v}" for k, v in last["widgets"].items()))
+        gauges = [f"{name} {last[name]}" for name in self.gauges if name in last]
+        if gauges:
+            lines.append("gauges: " + "  ".join(gauges))
+        for site in last.get("top_growth", [])[:5]:
+            lines.append(f"  {site['kb']:+8.1f} KB  {site['site']}")
+        return lines
+
+
+MEM_PROFILE = MemoryProfiler(_setting())
+
+
+def store_sizes():
+    """Lengths of the DATA_STORE lists and dicts, as one gauge value."""
+    import database
+    return {key: len(value) for key, value in database.DATA_STORE.items()}
+
+
+# ============================================
+# HEADLESS LEAK CHECK
+# ============================================
+def leak_check(rounds=200, warmup=20, limit_kb=256):
+    """
+    Repeats add/take/delete/compact and logout/login cycles on a
+    throwaway store. Returns (ok, growth_kb) where growth is traced
+    memory after `rounds` cycles minus after `warmup`; ok if under limit_kb.
+    """
+    import shutil
+    import tempfile
+
+    import database
+    from service import SERVICE
+
+    # Short runs measure growth over their second half
+    warmup = max(1, min(warmup, rounds // 2))
+    folder = tempfile.mkdtemp(prefix="med_mem_")
+    saved = database.DB_FILE, database.USER_DATA_DIR
+    database.DB_FILE = os.path.join(folder, "med_data.json")
+    database.USER_DATA_DIR = os.path.join(folder, "user_data")
+    tracemalloc.start(1)
+    try:
+        database.init_db()
+        SERVICE.register("memcheck", "memcheck")
+        baseline = None
+        for i in range(rounds):
+            user_id = SERVICE.login("memcheck", "memcheck")
+            SERVICE.add_medication(user_id, f"Check {i % 5}", 100, 2)
+            med_id = SERVICE.get_medications(user_id)[-1]["id"]
+            SERVICE.take_medication(user_id, med_id)
+            SERVICE.get_history(user_id)
+            SERVICE.delete_medication(user_id, med_id)
+            SERVICE.compact()
+            SERVICE.logout()
+            if i + 1 == warmup:
+                gc.collect()
+                baseline = tracemalloc.get_traced_memory()[0]
+        gc.collect()
+        growth = (tracemalloc.get_traced_memory()[0] - baseline) / 1024
+        return growth < limit_kb, round(growth, 1)
+    finally:
+        tracemalloc.stop()
+        database.DB_FILE, database.USER_DATA_DIR = saved
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the backend for memory growth.")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--limit-kb", type=int, default=256)
+    args = parser.parse_args(argv)
+
+    ok, growth = leak_check(args.rounds, limit_kb=args.limit_kb)
+    print(f"{'OK' if ok else 'LEAK'}: {growth:+.1f} KB after {args.rounds} cycles (limit {args.limit_kb} KB)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
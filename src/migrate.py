@@ -0,0 +1,410 @@
+"""
+Versioned schema upgrades for the JSON data files.
+
+Every file starts with "schema_version"; files without it are version 1.
+Upgrading streams the file record by record: top-level lists are read
+one element at a time and written straight to a temporary file, which
+replaces the original only when complete. Memory use is bounded by the
+largest single record, not the file size.
+
+Version history (DB_FILE and per-user files share the numbering):
+    1  no schema_version; DB_FILE may still hold every user's
+       medications and history; dose times are local "taken_at" strings
+    2  per-user files; history has ts/tz/day, ledger entries have ts,
+       the archive index uses day keys; derived keys are rebuilt on load
+
+database.init_db() and load_user() call upgrade_db_file() and
+upgrade_user_file() before reading, so the app upgrades lazily.
+Headless use (upgrades everything at once):
+    python src/migrate.py [--check]
+"""
+
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import clock
+import database
+from tracing import instrument_module
+
+# Characters read per refill of the streaming reader
+CHUNK_SIZE = 1 << 16
+DROP = object()
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+
+# ============================================
+# STREAMING JSON
+# ============================================
+class _Reader:
+    """Incremental parser for a top-level object whose values may be large lists."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ("" at end of file)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self, expected):
+        char = self.peek()
+        if char not in expected:
+            raise ValueError(f"expected one of {expected!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def read_events(path):
+    """
+    Yields ("value", key, value) for scalar/object members and
+    ("list", key, None), ("item", key, element)..., ("end", key, None)
+    for list members of the file's top-level object.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f)
+        reader.take("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.take(":")
+            if reader.peek() == "[":
+                reader.take("[")
+                yield "list", key, None
+                if reader.peek() == "]":
+                    reader.take("]")
+                else:
+                    while True:
+                        yield "item", key, reader.value()
+                        if reader.take(",]") == "]":
+                            break
+                yield "end", key, None
+            else:
+                yield "value", key, reader.value()
+            if reader.take(",}") == "}":
+                return
+
+
+class _Writer:
+    """Writes a top-level object member by member to path + ".tmp"."""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.f = open(path + ".tmp", "w", encoding="utf-8")
+        self.f.write("{")
+        self.members = 0
+        self.items = 0
+        self.bytes = 1
+
+    def _write(self, text):
+        self.f.write(text)
+        self.bytes += len(text)
+
+    def _key(self, key):
+        self._write(("," if self.members else "") + "\n    " + json.dumps(key) + ": ")
+        self.members += 1
+
+    def value(self, key, value):
+        self._key(key)
+        self._write(json.dumps(value))
+
+    def start_list(self, key):
+        self._key(key)
+        self._write("[")
+        self.items = 0
+
+    def item(self, value):
+        self._write(("," if self.items else "") + "\n        " + json.dumps(value))
+        self.items += 1
+
+    def raw_item(self, encoded):
+        self._write(("," if self.items else "") + "\n        " + encoded)
+        self.items += 1
+
+    def end_list(self):
+        self._write("\n    ]" if self.items else "]")
+
+    def close(self):
+        """Flushes to disk and atomically replaces the target file."""
+        self._write("\n}\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.path + ".tmp", self.path)
+        return self.bytes
+
+
+# ============================================
+# MIGRATION STEPS
+# ============================================
+class Migration:
+    """Upgrades one record at a time from `version` to `version + 1`."""
+    version = None
+    # Top-level keys removed by this step
+    drop_keys = ()
+
+    def item(self, key, record):
+        """Returns the upgraded list element, or DROP."""
+        return record
+
+    def value(self, key, value):
+        """Returns the upgraded non-list member, or DROP."""
+        return value
+
+
+class TimestampsToIntegers(Migration):
+    """1 -> 2: local time strings become ts/tz/day; derived data is rebuilt."""
+    version = 1
+    drop_keys = database.DERIVED_KEYS
+
+    def item(self, key, record):
+        if key == "history" and "taken_at" in record:
+            record["ts"], record["tz"], record["day"] = clock.parse_local(record.pop("taken_at"))
+        elif key == "ledger" and "at" in record:
+            record["ts"] = clock.parse_local(record.pop("at"))[0]
+        elif key == "archive":
+            for field in ("first", "last"):
+                if isinstance(record[field], str):
+                    record[field] = int(record[field][:10].replace("-", ""))
+        return record
+
+
+MIGRATIONS = [TimestampsToIntegers()]
+
+
+def _steps_from(version):
+    return [step for step in MIGRATIONS if step.version >= version]
+
+
+def _apply_item(steps, key, record):
+    for step in steps:
+        if key in step.drop_keys:
+            return DROP
+        record = step.item(key, record)
+        if record is DROP:
+            return DROP
+    return record
+
+
+def _apply_value(steps, key, value):
+    for step in steps:
+        if key in step.drop_keys:
+            return DROP
+        value = step.value(key, value)
+        if value is DROP:
+            return DROP
+    return value
+
+
+# ============================================
+# RUNNER
+# ============================================
+def file_version(path):
+    """Schema version of a data file, read from its first member only."""
+    for kind, key, value in read_events(path):
+        if kind == "value" and key == "schema_version":
+            return value
+        return 1
+    return 1
+
+
+def _copy(path, steps, skip_keys=()):
+    """Streams path through the steps into a new file. Returns bytes written."""
+    writer = _Writer(path)
+    writer.value("schema_version", database.SCHEMA_VERSION)
+    dropped = None
+    try:
+        for kind, key, value in read_events(path):
+            if key == "schema_version" or key in skip_keys:
+                continue
+            if kind == "value":
+                value = _apply_value(steps, key, value)
+                if value is not DROP:
+                    writer.value(key, value)
+            elif kind == "list":
+                dropped = any(key in step.drop_keys for step in steps)
+                if not dropped:
+                    writer.start_list(key)
+            elif kind == "item":
+                if not dropped:
+                    value = _apply_item(steps, key, value)
+                    if value is not DROP:
+                        writer.item(value)
+            elif not dropped:
+                writer.end_list()
+    except BaseException:
+        writer.f.close()
+        os.remove(path + ".tmp")
+        raise
+    return writer.close()
+
+
+def upgrade_user_file(path):
+    """Upgrades one per-user file in place. Returns the old version, or None if current."""
+    version = file_version(path)
+    if version >= database.SCHEMA_VERSION:
+        return None
+    start = time.perf_counter()
+    size = _copy(path, _steps_from(version))
+    database.record_io("save", size, time.perf_counter() - start, op="migrate")
+    return version
+
+
+def upgrade_db_file():
+    """
+    Upgrades DB_FILE in place. A version 1 file that still holds every
+    user's medications and history is split into per-user files first.
+    Returns the old version, or None if current.
+    """
+    path = database.DB_FILE
+    version = file_version(path)
+    if version >= database.SCHEMA_VERSION:
+        return None
+    start = time.perf_counter()
+    steps = _steps_from(version)
+    size = _split_legacy(path, steps)
+    size += _copy(path, steps, skip_keys=("medications", "history"))
+    database.record_io("save", size, time.perf_counter() - start, op="migrate")
+    return version
+
+
+def _split_legacy(path, steps):
+    """
+    Streams the medications and history of a single-file store into
+    per-user files. Pass one maps medication IDs to users; pass two
+    appends each record to a per-user part file; the parts are then
+    joined into user files. Returns bytes written (0 if nothing to split).
+    """
+    owner = {}
+    has_legacy = False
+    for kind, key, value in read_events(path):
+        if key in ("medications", "history"):
+            has_legacy = True
+            if kind == "item" and key == "medications":
+                owner[value["id"]] = value["user_id"]
+    if not has_legacy:
+        return 0
+
+    parts_dir = os.path.join(database.USER_DATA_DIR, ".migrate")
+    os.makedirs(parts_dir, exist_ok=True)
+    parts = {}
+    try:
+        for kind, key, value in read_events(path):
+            if kind != "item" or key not in ("medications", "history"):
+                continue
+            user_id = value["user_id"] if key == "medications" else owner.get(value.get("med_id"))
+            if user_id is None:
+                continue
+            value = _apply_item(steps, key, value)
+            if value is DROP:
+                continue
+            part = parts.get((user_id, key))
+            if part is None:
+                part = parts[(user_id, key)] = open(
+                    os.path.join(parts_dir, f"user_{user_id}.{key}"), "w", encoding="utf-8")
+            part.write(json.dumps(value) + "\n")
+        for part in parts.values():
+            part.close()
+
+        size = 0
+        for user_id in sorted({user_id for user_id, _ in parts}):
+            writer = _Writer(database.user_file(user_id))
+            writer.value("schema_version", database.SCHEMA_VERSION)
+            for key in ("medications", "history"):
+                writer.start_list(key)
+                part_path = os.path.join(parts_dir, f"user_{user_id}.{key}")
+                if os.path.exists(part_path):
+                    with open(part_path, "r", encoding="utf-8") as f:
+                        for line in f:
+                            writer.raw_item(line.rstrip("\n"))
+                writer.end_list()
+            size += writer.close()
+        return size
+    finally:
+        for part in parts.values():
+            part.close()
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def upgrade_all():
+    """Upgrades DB_FILE and every per-user file. Returns {path: old version}."""
+    upgraded = {}
+    if os.path.exists(database.DB_FILE):
+        version = upgrade_db_file()
+        if version is not None:
+            upgraded[database.DB_FILE] = version
+    for path in sorted(glob.glob(os.path.join(database.USER_DATA_DIR, "user_*.json"))):
+        version = upgrade_user_file(path)
+        if version is not None:
+            upgraded[path] = version
+    return upgraded
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Upgrade the data files to the current schema.")
+    parser.add_argument("--check", action="store_true", help="only report file versions")
+    args = parser.parse_args(argv)
+
+    paths = [database.DB_FILE] if os.path.exists(database.DB_FILE) else []
+    paths += sorted(glob.glob(os.path.join(database.USER_DATA_DIR, "user_*.json")))
+    if args.check:
+        for path in paths:
+            print(f"v{file_version(path)}  {path}")
+        print(f"Current schema version: {database.SCHEMA_VERSION}")
+        return 0
+
+    start = time.perf_counter()
+    upgraded = upgrade_all()
+    for path, version in upgraded.items():
+        print(f"v{version} -> v{database.SCHEMA_VERSION}  {path}")
+    print(f"Upgraded {len(upgraded)} of {len(paths)} files in {time.perf_counter() - start:.2f}s.")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
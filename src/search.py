@@ -0,0 +1,105 @@
+"""
+Incremental search over the medication and history lists.
+
+SearchIndex is built once per list (the service caches it next to the
+list it indexes). Names are split into lowercase tokens kept in one
+sorted array, so each query word is a prefix range found with two
+bisects. History rows are also indexed by their day as "YYYY-MM-DD",
+so "2024", "2024-03" or "2024-03-15" select a day range the same way.
+A row matches when every query word matches its name or its day.
+
+Because every word is a prefix, typing more can only narrow the result;
+when a query extends the previous one the index filters the previous
+matches instead of searching again.
+"""
+
+import re
+from bisect import bisect_left
+
+from tracing import instrument_module
+
+_TOKEN = re.compile(r"\w+")
+# Sorts after every character that can appear in a token
+_END = "\uffff"
+
+
+def tokens(text):
+    return _TOKEN.findall(text.lower())
+
+
+def day_text(day):
+    """"YYYY-MM-DD" for a YYYYMMDD day key."""
+    return f"{day // 10000:04d}-{day // 100 % 100:02d}-{day % 100:02d}"
+
+
+def _prefix_range(keys, prefix):
+    lo = bisect_left(keys, prefix)
+    return lo, bisect_left(keys, prefix + _END, lo)
+
+
+class SearchIndex:
+    """Indexes rows by the tokens of row[name_key] and, if given, the day in row[day_key]."""
+
+    def __init__(self, rows, name_key, day_key=None):
+        self.rows = rows
+        self._row_tokens = [tokens(row[name_key]) for row in rows]
+        # (token, row position), sorted
+        pairs = sorted((token, i) for i, row_tokens in enumerate(self._row_tokens)
+                       for token in set(row_tokens))
+        self._token_keys = [token for token, _ in pairs]
+        self._token_rows = [i for _, i in pairs]
+        self._row_days = None
+        if day_key is not None:
+            self._row_days = [day_text(row[day_key]) for row in rows]
+            pairs = sorted((day, i) for i, day in enumerate(self._row_days))
+            self._day_keys = [day for day, _ in pairs]
+            self._day_rows = [i for _, i in pairs]
+        # (query, matching positions) of the last search
+        self._last = ("", None)
+
+    def _lookup(self, word):
+        """Positions of the rows that match one query word."""
+        found = None
+        for token in tokens(word):
+            lo, hi = _prefix_range(self._token_keys, token)
+            rows = set(self._token_rows[lo:hi])
+            found = rows if found is None else found & rows
+        found = found or set()
+        if self._row_days is not None:
+            lo, hi = _prefix_range(self._day_keys, word)
+            found.update(self._day_rows[lo:hi])
+        return found
+
+    def _matches(self, i, word):
+        if self._row_days is not None and self._row_days[i].startswith(word):
+            return True
+        words = tokens(word)
+        return bool(words) and all(any(token.startswith(w) for token in self._row_tokens[i]) for w in words)
+
+    def search(self, query):
+        """Positions of the rows matching every word of query, in row order."""
+        words = query.lower().split()
+        query = " ".join(words)
+        if not words:
+            self._last = ("", None)
+            return list(range(len(self.rows)))
+
+        last_query, last_result = self._last
+        if last_result is not None and query.startswith(last_query):
+            # Typing extended the query, so only previous matches can still match
+            result = [i for i in last_result if all(self._matches(i, word) for word in words)]
+        else:
+            found = None
+            for word in words:
+                rows = self._lookup(word)
+                found = rows if found is None else found & rows
+            result = sorted(found)
+        self._last = (query, result)
+        return result
+
+    def filter(self, query):
+        """Matching rows, in row order."""
+        return [self.rows[i] for i in self.search(query)]
+
+
+instrument_module(__name__)
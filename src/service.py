@@ -0,0 +1,225 @@
+"""
+Single entry point to the backend for the GUI and the exporter.
+
+Wraps the auth, medication and database functions and memoizes the
+derived views (medication list with stock/today info, sorted history)
+per user. The cache listens to database change events, so it drops
+exactly the views a write affects no matter which module made it.
+
+Every method holds database.STORE_LOCK, so the GUI can read while the
+writer thread (see writer.py) runs the mutations it submitted. History
+and daily counts hold it only to take a snapshot (see database.Snapshot)
+and are computed after releasing it; long readers such as the exporter
+pass one snapshot to several queries so they see a single state.
+"""
+
+import database
+import auth
+import clock
+import ledger
+import medication
+import search
+import stock_index
+import sync
+from tracing import instrument_module
+
+
+class MedicationService:
+    def __init__(self):
+        # (user_id, today) -> medication list, (user_id, since) -> history list
+        self._med_cache = {}
+        self._history_cache = {}
+        # cache key -> SearchIndex over that cached list
+        self._search_cache = {}
+        database.subscribe(self._on_change)
+
+    # ----- cache helpers -----
+    def invalidate(self, user_id=None, medications=True, history=True):
+        """Drop cached views for one user, or for everyone if user_id is None."""
+        if user_id is None:
+            self._search_cache.clear()
+        # Otherwise stale search indexes are replaced when their list is rebuilt
+        if medications:
+            if user_id is None:
+                self._med_cache.clear()
+            else:
+                for key in [k for k in self._med_cache if k[0] == user_id]:
+                    del self._med_cache[key]
+        if history:
+            if user_id is None:
+                self._history_cache.clear()
+            else:
+                for key in [k for k in self._history_cache if k[0] == user_id]:
+                    del self._history_cache[key]
+
+    def _on_change(self, event):
+        if event.type == database.DATA_RELOADED:
+            self.invalidate()
+        elif event.type in (database.MEDICATION_ADDED, database.MEDICATION_UPDATED):
+            self.invalidate(event.user_id, history=False)
+        elif event.type in (database.DOSE_RECORDED, database.MEDICATION_DELETED):
+            self.invalidate(event.user_id)
+        # HISTORY_PURGED only removes rows the queries already skip, and
+        # archiving moves rows without changing any query result
+
+    # ----- accounts -----
+    def login(self, username, password):
+        """Checks credentials and loads that user's data. Returns user_id or None."""
+        with database.STORE_LOCK:
+            user_id = auth.login_user(username, password)
+            if user_id is not None:
+                with database.operation("login"):
+                    database.load_user(user_id)
+                self.sync_folder()
+        return user_id
+
+    def logout(self):
+        """Flushes pending deletes, archives old history and releases the active user's data."""
+        with database.operation("logout"):
+            with database.STORE_LOCK:
+                self.sync_folder()
+                database.compact()
+            # Takes the lock itself, except while it writes the segments
+            database.archive_history()
+            with database.STORE_LOCK:
+                database.unload_user()
+
+    def register(self, username, password):
+        with database.operation("register"), database.STORE_LOCK:
+            return auth.register_user(username, password)
+
+    # ----- reads -----
+    def get_medications(self, user_id):
+        """Medications with days_remaining, alert and taken_today (cached)."""
+        key = (user_id, clock.today_key())
+        if key not in self._med_cache:
+            with database.STORE_LOCK:
+                self._med_cache[key] = medication.get_user_medications(user_id)
+        return self._med_cache[key]
+
+    def snapshot(self):
+        """Read-only view of the active user's data that later writes leave alone."""
+        with database.STORE_LOCK:
+            return database.snapshot()
+
+    def get_history(self, user_id, since=None, snap=None):
+        """
+        History newest first as medication_name / ts / tz rows (cached).
+        since (a YYYYMMDD day key) limits it to rows from that day on; None
+        includes the archive. With snap, reads that snapshot (uncached).
+        """
+        if snap is not None:
+            return medication.get_medication_history(user_id, since, snap=snap)
+        key = (user_id, since)
+        rows = self._history_cache.get(key)
+        if rows is None:
+            snap = self.snapshot()
+            rows = medication.get_medication_history(user_id, since, snap=snap)
+            # A write that landed meanwhile may already have cleared the cache
+            if snap.is_current():
+                self._history_cache[key] = rows
+        return rows
+
+    def search_medications(self, user_id, query):
+        """get_medications() rows whose name matches every word of query."""
+        return self._index(("medications", user_id), self.get_medications(user_id), "name").filter(query)
+
+    def search_history(self, user_id, query, since=None):
+        """get_history() rows whose medication name or day ("2024-03") matches every word of query."""
+        rows = self.get_history(user_id, since)
+        return self._index(("history", user_id, since), rows, "medication_name", "day").filter(query)
+
+    def _index(self, key, rows, name_key, day_key=None):
+        index = self._search_cache.get(key)
+        if index is None or index.rows is not rows:
+            index = self._search_cache[key] = search.SearchIndex(rows, name_key, day_key)
+        return index
+
+    def get_daily_counts(self, user_id, since=None, until=None, snap=None):
+        """Doses per medication per day; reads the rollup, so it is not cached."""
+        return medication.get_daily_counts(user_id, since, until, snap=snap or self.snapshot())
+
+    def get_day_counts(self, user_id, med_id, since=None, until=None):
+        """{day key: doses} of one medication from the rollup, for the calendar."""
+        snap = self.snapshot()
+        return {day: count for _, day, count in snap.daily_counts({med_id}, since, until)}
+
+    def running_out(self, user_id=None, days=stock_index.LOW_STOCK_DAYS):
+        """Medications with fewer than `days` days of stock, soonest first (all users if None)."""
+        return stock_index.INDEX.running_out(days, user_id)
+
+    def stock_on(self, user_id, med_id, day):
+        """Pills of med_id in stock at the end of a day key, from the ledger; None before its first entry."""
+        with database.STORE_LOCK:
+            return ledger.stock_on(med_id, clock.end_of_day(day))
+
+    def consumption_rate(self, user_id, med_id, days=30):
+        """Average pills of med_id taken per day over the last `days` days."""
+        with database.STORE_LOCK:
+            return ledger.consumption_rate(med_id, days)
+
+    def stock_entries(self, user_id, med_id):
+        """Ledger entries of med_id, oldest first."""
+        with database.STORE_LOCK:
+            return ledger.entries_for(med_id)
+
+    # ----- writes -----
+    def add_medication(self, user_id, name, total_pills, pills_per_day):
+        with database.operation("add_medication"), database.STORE_LOCK:
+            return medication.add_medication(user_id, name, total_pills, pills_per_day)
+
+    def take_medication(self, user_id, med_id, amount=1):
+        with database.operation("take_medication"), database.STORE_LOCK:
+            return medication.take_medication(med_id, amount)
+
+    def take_medications(self, user_id, doses):
+        with database.operation("take_medications"), database.STORE_LOCK:
+            return medication.take_medications(doses)
+
+    def refill_medication(self, user_id, med_id, amount):
+        with database.operation("refill_medication"), database.STORE_LOCK:
+            return medication.refill_medication(med_id, amount)
+
+    def adjust_stock(self, user_id, med_id, new_total):
+        with database.operation("adjust_stock"), database.STORE_LOCK:
+            return medication.adjust_stock(med_id, new_total)
+
+    def delete_medication(self, user_id, med_id):
+        with database.operation("delete_medication"), database.STORE_LOCK:
+            return medication.delete_medication(med_id)
+
+    def compact(self):
+        """Physically removes deleted medications; query results are unchanged."""
+        # The tombstones are already saved; this drops the dead rows
+        with database.operation("compact"), database.STORE_LOCK:
+            return database.compact()
+
+    def sync_folder(self, folder=None):
+        """
+        Exchanges the active user's changes with other installs through a
+        shared folder, prefs["sync_folder"] by default. Returns (sent,
+        received), or None if no folder is set or the folder is unreachable.
+        """
+        folder = folder or database.DATA_STORE["prefs"].get("sync_folder")
+        if not folder:
+            return None
+        with database.operation("sync"), database.STORE_LOCK:
+            if database.ACTIVE_USER_ID is None:
+                return None
+            username = sync.username(database.ACTIVE_USER_ID)
+            try:
+                return sync.sync_folder(username, folder)
+            except OSError as e:
+                print(f"Sync failed: {e}")
+                return None
+
+    def import_records(self, user_id, medications=(), history=(), adjust_stock=True):
+        import importer
+        with database.operation("import"), database.STORE_LOCK:
+            return importer.import_records(user_id, medications, history, adjust_stock)
+
+
+SERVICE = MedicationService()
+
+
+instrument_module(__name__)
@@ -0,0 +1,239 @@
+"""
+Install-wide index of medications ordered by when they run out.
+
+Every live medication of every user is kept in a binary heap keyed by
+its projected run-out day: the day its stock last changed plus the days
+that stock lasts (total_pills // pills_per_day). The key stays valid
+while nobody is signed in, so "what runs out in the next N days" walks
+only the k matching entries (O(k log k)) instead of loading every
+user's file. The index is updated from database change events and
+written to user_data/stock_index.json when the user signs out and at
+exit; if that file is missing it is rebuilt from the per-user files.
+Updates lost in a crash are redone when that user next signs in, since
+loading a user compares the index with their medications.
+
+Headless use:
+    python src/stock_index.py [--days 3] [--user USER_ID]
+"""
+
+import atexit
+import glob
+import heapq
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+import clock
+import database
+from tracing import instrument_module
+
+INDEX_FILENAME = "stock_index.json"
+# Matches the "alert" threshold of medication.get_user_medications()
+LOW_STOCK_DAYS = 3
+
+
+def days_remaining(med):
+    if med["pills_per_day"] > 0:
+        return int(med["total_pills"] / med["pills_per_day"])
+    return 999
+
+
+def run_out_day(med, since=None):
+    """Day key when med's stock runs out, counting from `since` (a date, default today)."""
+    return clock.day_key((since or date.today()) + timedelta(days=days_remaining(med)))
+
+
+class StockIndex:
+    def __init__(self):
+        # (user_id, med_id) -> (run_out day key, name, total_pills, pills_per_day)
+        self._entries = None
+        # (run_out, user_id, med_id); entries that no longer match
+        # self._entries are skipped and dropped when the heap is rebuilt
+        self._heap = []
+        # Changes not written to the index file yet, and the file the
+        # entries were loaded from
+        self._dirty = False
+        self._file = None
+        database.subscribe(self._on_change)
+
+    def path(self):
+        return os.path.join(database.USER_DATA_DIR, INDEX_FILENAME)
+
+    # ----- loading -----
+    def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        self._file = self.path()
+        rows = json.loads(database.read_file(self._file)) if database.file_exists(self._file) else None
+        # Files from before run-out days were stored hold 4-column rows
+        if rows is not None and all(len(row) == 6 for row in rows):
+            for user_id, med_id, run_out, name, total, per_day in rows:
+                self._entries[(user_id, med_id)] = (run_out, name, total, per_day)
+        else:
+            self._rebuild_from_files()
+        self._heapify()
+
+    def _rebuild_from_files(self):
+        """Reads every user's file once; used when the index file is missing."""
+        for path in glob.glob(os.path.join(database.USER_DATA_DIR, "user_*.json")):
+            # Saves still queued for the writer thread are newer than the file
+            data = json.loads(database.read_file(path))
+            # The stock was last counted at its newest ledger entry
+            changed = {}
+            for entry in data.get("ledger", []):
+                changed[entry["med_id"]] = max(entry["ts"], changed.get(entry["med_id"], entry["ts"]))
+            for med in data.get("medications", []):
+                if not database.is_deleted(med):
+                    since = clock.key_to_date(clock.stamp(changed[med["id"]])[2]) if med["id"] in changed else None
+                    self._entries[(med["user_id"], med["id"])] = self._entry(med, since)
+        # The active user's in-memory data is newer than their file
+        if database.ACTIVE_USER_ID is not None:
+            self._sync_user(database.ACTIVE_USER_ID)
+        self._dirty = True
+        self.save()
+
+    def _heapify(self):
+        self._heap = [(entry[0], user_id, med_id) for (user_id, med_id), entry in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def save(self):
+        """Writes the index file if it changed since the last save."""
+        if not self._dirty or self._entries is None:
+            return
+        self._dirty = False
+        rows = [[user_id, med_id, *entry] for (user_id, med_id), entry in self._entries.items()]
+        # Events arrive on the Tk thread; the writer thread does the disk write
+        database.save_file(self._file, json.dumps(rows).encode("utf-8"))
+
+    # ----- maintenance -----
+    @staticmethod
+    def _entry(med, since=None):
+        return run_out_day(med, since), med["name"], med["total_pills"], med["pills_per_day"]
+
+    def _set(self, user_id, med):
+        key = (user_id, med["id"])
+        current = self._entries.get(key)
+        if current is not None and current[2:] == (med["total_pills"], med["pills_per_day"]):
+            # Same stock: the run-out day still holds, whenever it was projected
+            if current[1] == med["name"]:
+                return False
+            self._entries[key] = (current[0], med["name"], *current[2:])
+            return True
+        self._entries[key] = self._entry(med)
+        heapq.heappush(self._heap, (self._entries[key][0], user_id, med["id"]))
+        return True
+
+    def _remove(self, user_id, med_id):
+        return self._entries.pop((user_id, med_id), None) is not None
+
+    def _sync_user(self, user_id):
+        """Makes the user's entries match the medications in DATA_STORE."""
+        live = {}
+        for med in database.DATA_STORE["medications"]:
+            if med["user_id"] == user_id and not database.is_deleted(med):
+                live[med["id"]] = med
+        changed = False
+        for key in [k for k in self._entries if k[0] == user_id and k[1] not in live]:
+            changed |= self._remove(*key)
+        for med in live.values():
+            changed |= self._set(user_id, med)
+        return changed
+
+    def _on_change(self, event):
+        if event.type == database.DATA_RELOADED and event.user_id is None:
+            # init_db(): files may have been replaced (e.g. a restore)
+            self._entries = None
+            self._heap = []
+            self._dirty = False
+            return
+        if event.type == database.HISTORY_PURGED:
+            return
+        self._ensure_loaded()
+        if event.type == database.DATA_RELOADED:
+            # load_user() syncs the new user; unload_user() (sign-out) saves
+            if event.user_id == database.ACTIVE_USER_ID:
+                self._dirty |= self._sync_user(event.user_id)
+            else:
+                self.save()
+            return
+
+        meds = {m["id"]: m for m in database.DATA_STORE["medications"] if m["id"] in event.med_ids}
+        changed = False
+        for med_id in event.med_ids:
+            med = meds.get(med_id)
+            if med is None or database.is_deleted(med):
+                changed |= self._remove(event.user_id, med_id)
+            else:
+                changed |= self._set(event.user_id, med)
+        if changed:
+            # Stale heap entries are skipped by running_out(); drop them
+            # once they outnumber the live ones
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heapify()
+            self._dirty = True
+
+    # ----- queries -----
+    def running_out(self, days=LOW_STOCK_DAYS, user_id=None):
+        """
+        Medications with fewer than `days` days of stock, soonest first, as
+        dicts with user_id, med_id, name, days_remaining and run_out (date).
+        """
+        self._ensure_loaded()
+        heap = self._heap
+        today = date.today()
+        cutoff = clock.day_key(today + timedelta(days=days))
+        result = []
+        seen = set()
+        # Walk the heap as a tree, visiting children only while the parent
+        # is below the cutoff, so only matching entries are touched.
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            (run_out, entry_user, med_id), i = heapq.heappop(frontier)
+            if run_out >= cutoff:
+                break
+            current = self._entries.get((entry_user, med_id))
+            if (current is not None and current[0] == run_out and (entry_user, med_id) not in seen
+                    and (user_id is None or user_id == entry_user)):
+                seen.add((entry_user, med_id))
+                result.append({"user_id": entry_user, "med_id": med_id, "name": current[1],
+                               "days_remaining": max(0, (clock.key_to_date(run_out) - today).days),
+                               "run_out": clock.format_day(run_out)})
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+
+INDEX = StockIndex()
+# Sign-out saves the index; this covers closing without signing out and the CLI tools
+atexit.register(INDEX.save)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List medications that are running out.")
+    parser.add_argument("--days", type=int, default=LOW_STOCK_DAYS,
+                        help="show medications with fewer than this many days left")
+    parser.add_argument("--user", type=int, help="only this user ID")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    usernames = {u["id"]: u["username"] for u in database.DATA_STORE["users"]}
+    rows = INDEX.running_out(args.days, args.user)
+    if not rows:
+        print(f"Nothing runs out in the next {args.days} days.")
+        return 0
+    for row in rows:
+        print(f"{row['run_out']}  {row['days_remaining']:>3}d  "
+              f"{usernames.get(row['user_id'], row['user_id'])}: {row['name']}")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
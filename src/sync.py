@@ -0,0 +1,782 @@
+"""
+Delta synchronization of one user's data between installations.
+
+Change tracking starts the first time a user syncs. From then on every
+change to the user's data is appended to their change log,
+user_data/changes/user_<id>.jsonl, as an operation tagged with the
+install that made it ("o", a random ID kept in user_data/install_id) and
+that install's sequence number ("s"):
+
+    {"o", "s", "t": "med",     "key", "name", "ppd"}   medication added
+    {"o", "s", "t": "delete",  "key"}                  medication deleted
+    {"o", "s", "t": "dose",    "key", "name", "ts", "tz", "day"}
+    {"o", "s", "t": "stock",   "key", "kind", "delta", "ts"}
+    {"o", "s", "t": "segment", "file", "hash", "first", "last", "count", "keys"}
+
+The log is a file of its own: it is only appended to, read only while
+syncing, and never part of the store that save_data() writes.
+
+Medications are referred to by "key" (their "sync_key", unique across
+installs) because medication IDs are only unique per install.
+DATA_STORE["sync"] holds the positions:
+    "vector"    highest sequence number applied from each install
+    "peers"     the vector each install we synced with reported last
+    "trimmed"   highest sequence number dropped from the log, per install
+    "exported", "offsets"   how far the shared folder has been written and read
+Two installs exchange exactly the operations the other has not seen, so
+the cost follows the number of changes, not the size of the store. After
+each sync the log drops the operations every known peer has passed; an
+install that syncs for the first time after that gets the whole store as
+bootstrap operations instead (see apply_snapshot()).
+Operations from one install are applied in sequence order, and each one
+is applied at most once on every install. Doses and stock changes are
+never edited, so concurrent ones simply all apply. The ledger is kept in
+time order and stock is recomputed from it, so every install ends up
+with the same balances whatever order the changes arrived in.
+
+What the store already holds when tracking starts is logged as bootstrap
+operations ("b": 1). Those are matched against existing records by
+content (medication name, dose time), so installs that were copied from
+the same files by hand do not double up. Archived history is logged as
+one "segment" operation per archive segment, naming the file and its
+SHA-256; the rows are read from the segment only when the operation is
+sent, so only the install that wrote the segment can send them.
+
+Transports:
+    a shared folder   each install appends its own operations to
+                      FOLDER/USERNAME/<install>.jsonl, reads the others
+                      from where it stopped last time and leaves its
+                      vector in <install>.vector.json
+    a localhost TCP   one side runs serve(), the other sync_socket()
+    socket            with the user's password; both send only what the
+                      other side lacks
+
+Headless use (the app must not be running on the same data):
+    python src/sync.py [--root DIR] serve [--port 8765] [--once]
+    python src/sync.py [--root DIR] connect USERNAME [--host H] [--port 8765]
+    python src/sync.py [--root DIR] folder USERNAME PATH
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sys
+import uuid
+from bisect import bisect_right
+from collections import Counter
+
+import auth
+import database
+from database import DATA_STORE
+from tracing import instrument_module
+
+DEFAULT_PORT = 8765
+INSTALL_FILE = "install_id"
+CHANGES_DIR = "changes"
+VECTOR_SUFFIX = ".vector.json"
+# Bytes read per step when looking for the last operations of the log
+TAIL_CHUNK = 1 << 16
+
+MED = "med"
+DELETE = "delete"
+DOSE = "dose"
+STOCK = "stock"
+SEGMENT = "segment"
+# ledger.INITIAL (ledger imports this module)
+INITIAL = "initial"
+
+# USER_DATA_DIR -> install ID
+_INSTALL_IDS = {}
+
+
+def install_id():
+    """
+    Random ID of this installation, created on first use. The file
+    records where it was created, so a data folder copied to another
+    machine or path gets a new ID instead of reusing the sequence numbers.
+    """
+    folder = database.USER_DATA_DIR
+    if folder not in _INSTALL_IDS:
+        path = os.path.join(folder, INSTALL_FILE)
+        place = {"host": socket.gethostname(), "path": os.path.abspath(folder)}
+        saved = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                saved = json.load(f)
+        if {k: saved.get(k) for k in place} != place:
+            saved = {"id": uuid.uuid4().hex[:12], **place}
+            os.makedirs(folder, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(saved, f)
+        _INSTALL_IDS[folder] = saved["id"]
+    return _INSTALL_IDS[folder]
+
+
+def reset_install_id():
+    """Gives this installation a new ID from the next change on (used by backup restores)."""
+    path = os.path.join(database.USER_DATA_DIR, INSTALL_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    _INSTALL_IDS.pop(database.USER_DATA_DIR, None)
+
+
+# ============================================
+# CHANGE LOG
+# ============================================
+def log_file(user_id):
+    """Path of one user's change log."""
+    return os.path.join(database.USER_DATA_DIR, CHANGES_DIR, f"user_{user_id}.jsonl")
+
+
+def _encode_ops(ops):
+    return "".join(json.dumps(op, separators=(",", ":")) + "\n" for op in ops)
+
+
+def _parse(line):
+    """The operation on one log line, or None for a blank or cut-off line."""
+    try:
+        return json.loads(line) if line.strip() else None
+    except ValueError:
+        # Cut short by a crash while appending
+        return None
+
+
+def _write_ops(ops):
+    """Appends operations to the loaded user's change log."""
+    if not ops:
+        return
+    path = log_file(database.ACTIVE_USER_ID)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab+") as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # The last line was cut short by a crash; keep it apart from the new ones
+                f.write(b"\n")
+        f.write(_encode_ops(ops).encode("utf-8"))
+
+
+def _read_log():
+    """Every operation in the loaded user's change log, in log order."""
+    path = log_file(database.ACTIVE_USER_ID)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [op for op in map(_parse, f) if op is not None]
+
+
+def _last_seq(origin):
+    """Sequence number of origin's last operation in the log (0 if none), read from the end."""
+    path = log_file(database.ACTIVE_USER_ID)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        rest = b""
+        while end > 0:
+            start = max(0, end - TAIL_CHUNK)
+            f.seek(start)
+            lines = (f.read(end - start) + rest).split(b"\n")
+            # Unless at the start of the file, the first piece is the end of a longer line
+            rest = lines.pop(0) if start else b""
+            for line in reversed(lines):
+                op = _parse(line)
+                if op is not None and op["o"] == origin:
+                    return op["s"]
+            end = start
+    return 0
+
+
+def _number(op):
+    """op as the next operation of this install."""
+    origin = install_id()
+    vector = DATA_STORE["sync"]["vector"]
+    vector[origin] = vector.get(origin, 0) + 1
+    return {"o": origin, "s": vector[origin], **op}
+
+
+def _append_local(op):
+    """Logs an operation made here. Does nothing until bootstrap() has run."""
+    if DATA_STORE["sync"].get("vector") is not None:
+        _write_ops([_number(op)])
+
+
+def recover():
+    """
+    Called by database.load_user() for a user whose changes are tracked.
+    The log is appended before the store is saved, so after a crash or a
+    restore it can be ahead; numbering continues after its last operation.
+    """
+    vector = DATA_STORE["sync"]["vector"]
+    me = install_id()
+    vector[me] = max(vector.get(me, 0), _last_seq(me))
+
+
+def _med_op(med):
+    return {"t": MED, "key": med["sync_key"], "name": med["name"], "ppd": med["pills_per_day"]}
+
+
+def log_medication(med):
+    """Call after a new medication is added to the store."""
+    vector = DATA_STORE["sync"].get("vector")
+    if vector is None:
+        return
+    if "sync_key" not in med:
+        # IDs are only unique per install; the sequence number of this op is not
+        origin = install_id()
+        med["sync_key"] = f"{origin}:{vector.get(origin, 0) + 1}"
+    _append_local(_med_op(med))
+
+
+def log_delete(med):
+    if "sync_key" in med:
+        _append_local({"t": DELETE, "key": med["sync_key"]})
+
+
+def log_doses(rows):
+    """Call after history rows are appended; logs them all with one write."""
+    if DATA_STORE["sync"].get("vector") is None:
+        return
+    keys = {med["id"]: med.get("sync_key") for med in DATA_STORE["medications"]}
+    _write_ops([_number({"t": DOSE, "key": keys[row["med_id"]], "name": row["medication_name"],
+                         "ts": row["ts"], "tz": row["tz"], "day": row["day"]})
+                for row in rows if keys.get(row["med_id"]) is not None])
+
+
+def log_stock(entries):
+    """Call after ledger entries are added; writes them with one append."""
+    if DATA_STORE["sync"].get("vector") is None:
+        return
+    keys = {med["id"]: med.get("sync_key") for med in DATA_STORE["medications"]}
+    _write_ops([_number({"t": STOCK, "key": keys[entry["med_id"]], "kind": entry["kind"],
+                         "delta": entry["delta"], "ts": entry["ts"]})
+                for entry in entries if keys.get(entry["med_id"]) is not None])
+
+
+def _segment_op(segment, keys):
+    """Bootstrap operation standing for one archive segment, or None if no live medication is in it."""
+    raw, rows = database.segment_data(segment)
+    med_keys = {str(row["med_id"]): keys[row["med_id"]] for row in rows if row["med_id"] in keys}
+    if not med_keys:
+        return None
+    return {"t": SEGMENT, "file": segment["file"], "hash": hashlib.sha256(raw).hexdigest(),
+            "first": segment["first"], "last": segment["last"], "count": segment["count"],
+            "keys": med_keys, "b": 1}
+
+
+def _store_ops():
+    """
+    The loaded user's medications, stock changes and history as bootstrap
+    operations, not yet numbered. Repeated doses or stock changes at the
+    same second are numbered ("n") so they stay distinct.
+    """
+    ops = []
+    keys = {}
+    for med in DATA_STORE["medications"]:
+        if not database.is_deleted(med) and "sync_key" in med:
+            keys[med["id"]] = med["sync_key"]
+            ops.append({**_med_op(med), "b": 1})
+
+    seen = Counter()
+    for entry in DATA_STORE["ledger"]:
+        key = keys.get(entry["med_id"])
+        if key is not None:
+            content = _stock_content(key, entry)
+            ops.append({"t": STOCK, "key": key, "kind": entry["kind"], "delta": entry["delta"],
+                        "ts": entry["ts"], "b": 1, "n": seen[content]})
+            seen[content] += 1
+
+    for row in sorted(DATA_STORE["history"], key=lambda r: r["ts"]):
+        key = keys.get(row["med_id"])
+        if key is not None:
+            content = (key, row["ts"])
+            ops.append({"t": DOSE, "key": key, "name": row["medication_name"], "ts": row["ts"],
+                        "tz": row["tz"], "day": row["day"], "b": 1, "n": seen[content]})
+            seen[content] += 1
+
+    for segment in DATA_STORE["archive"]:
+        op = _segment_op(segment, keys)
+        if op is not None:
+            ops.append(op)
+    return ops
+
+
+def bootstrap():
+    """
+    Starts change tracking for the loaded user: gives every medication a
+    sync key and logs what the store already holds (see _store_ops()).
+    """
+    me = install_id()
+    # A log left from earlier tracking (e.g. before a restore) keeps its
+    # numbers, so peers that saw them do not skip these operations
+    DATA_STORE["sync"] = {"vector": {me: _last_seq(me)}, "exported": {}, "offsets": {},
+                          "peers": {}, "trimmed": {}}
+    names = Counter()
+    for med in DATA_STORE["medications"]:
+        if database.is_deleted(med):
+            continue
+        base = "name:" + med["name"].strip().lower()
+        names[base] += 1
+        med["sync_key"] = base if names[base] == 1 else f"{base}#{names[base]}"
+    _write_ops([_number(op) for op in _store_ops()])
+    database.save_data()
+
+
+def _state():
+    """DATA_STORE["sync"], starting change tracking on the user's first sync."""
+    if DATA_STORE["sync"].get("vector") is None:
+        bootstrap()
+    state = DATA_STORE["sync"]
+    for key in ("exported", "offsets", "peers", "trimmed"):
+        state.setdefault(key, {})
+    return state
+
+
+def changes_since(vector):
+    """Operations the holder of `vector` has not seen, in log order."""
+    return [op for op in _read_log() if op["s"] > vector.get(op["o"], 0)]
+
+
+def _missing(vector):
+    """Installs some of whose operations the holder of `vector` lacks but the log has dropped."""
+    trimmed = DATA_STORE["sync"]["trimmed"]
+    return sorted(origin for origin, seq in trimmed.items() if vector.get(origin, 0) < seq)
+
+
+def _with_rows(ops):
+    """ops as sent: segment operations made here carry the segment's rows."""
+    me = install_id()
+    segments = {segment["file"]: segment for segment in DATA_STORE["archive"]}
+    sent = []
+    for op in ops:
+        segment = segments.get(op["file"]) if op["t"] == SEGMENT and op.get("o", me) == me else None
+        if segment is not None:
+            try:
+                raw, rows = database.segment_data(segment)
+            except OSError:
+                raw, rows = b"", None
+            # A segment replaced since (e.g. by a restore) is not sent
+            if rows is not None and hashlib.sha256(raw).hexdigest() == op["hash"]:
+                op = {**op, "rows": rows}
+        sent.append(op)
+    return sent
+
+
+def trim():
+    """
+    Drops the operations every known peer has passed from the log.
+    Returns the number dropped.
+    """
+    state = DATA_STORE["sync"]
+    if not state["peers"]:
+        return 0
+    me = install_id()
+    exported = state["exported"].get(me)
+    keep = []
+    dropped = 0
+    for op in _read_log():
+        origin, seq = op["o"], op["s"]
+        needed = any(vector.get(origin, 0) < seq for peer, vector in state["peers"].items() if peer != origin)
+        if origin == me and exported is not None and seq > exported:
+            # Not in this install's outbox in the shared folder yet
+            needed = True
+        if needed:
+            keep.append(op)
+        else:
+            state["trimmed"][origin] = max(state["trimmed"].get(origin, 0), seq)
+            dropped += 1
+    if dropped:
+        database.write_file(log_file(database.ACTIVE_USER_ID), _encode_ops(keep).encode("utf-8"))
+    return dropped
+
+
+# ============================================
+# MERGING
+# ============================================
+def _stock_content(med_id, entry):
+    # Opening balances are dated when the ledger was created, which differs
+    # between copies of a file from before the ledger existed
+    if entry["kind"] == INITIAL:
+        return med_id, INITIAL
+    return med_id, entry["kind"], entry["ts"], entry["delta"]
+
+
+class _Merge:
+    """Applies a batch of remote operations to the loaded user's store."""
+
+    def __init__(self):
+        self.meds = {}
+        for med in DATA_STORE["medications"]:
+            for key in [med.get("sync_key")] + med.get("sync_aliases", []):
+                if key is not None:
+                    self.meds[key] = med
+        self.events = {}
+        # med_id -> sum of the stock changes applied
+        self.restock = Counter()
+        self.ledger_reordered = False
+        # Content counts for bootstrap operations, built on first need
+        self._doses = None
+        self._stock = None
+
+    def _event(self, event_type, med_id):
+        self.events.setdefault(event_type, set()).add(med_id)
+
+    def _live_med_named(self, name):
+        for med in DATA_STORE["medications"]:
+            if not database.is_deleted(med) and med["name"].strip().lower() == name.strip().lower():
+                return med
+        return None
+
+    def apply(self, op):
+        handler = getattr(self, "_apply_" + op["t"], None)
+        if handler is not None:
+            handler(op)
+
+    def _apply_med(self, op):
+        if op["key"] in self.meds:
+            return
+        med = self._live_med_named(op["name"]) if op.get("b") else None
+        if med is not None:
+            # The same medication, tracked separately before the installs first synced
+            med.setdefault("sync_aliases", []).append(op["key"])
+        else:
+            med = {"id": database.get_next_id("medications"), "user_id": database.ACTIVE_USER_ID,
+                   "name": op["name"], "total_pills": 0, "pills_per_day": op["ppd"], "sync_key": op["key"]}
+            DATA_STORE["medications"].append(med)
+            self._event(database.MEDICATION_ADDED, med["id"])
+        self.meds[op["key"]] = med
+
+    def _apply_delete(self, op):
+        med = self.meds.get(op["key"])
+        if med is not None and not database.is_deleted(med):
+            med["deleted"] = True
+            self._event(database.MEDICATION_DELETED, med["id"])
+
+    def _apply_dose(self, op):
+        med = self.meds.get(op["key"])
+        if med is None:
+            return
+        if op.get("b"):
+            if self._doses is None:
+                rows = DATA_STORE["history"] + database.archived_history()
+                self._doses = Counter((row["med_id"], row["ts"]) for row in rows)
+            content = (med["id"], op["ts"])
+            if self._doses[content] > op["n"]:
+                return
+            self._doses[content] += 1
+        DATA_STORE["history"].append({"med_id": med["id"], "medication_name": op["name"],
+                                      "ts": op["ts"], "tz": op["tz"], "day": op["day"]})
+        database.add_daily(med["id"], op["day"])
+        self._event(database.DOSE_RECORDED, med["id"])
+
+    def _apply_segment(self, op):
+        # Passed on by an install that does not have the segment file
+        if "rows" not in op:
+            return
+        seen = Counter()
+        for row in op["rows"]:
+            key = op["keys"].get(str(row["med_id"]))
+            content = (key, row["ts"])
+            self._apply_dose({"t": DOSE, "key": key, "name": row["medication_name"], "ts": row["ts"],
+                              "tz": row["tz"], "day": row["day"], "b": 1, "n": seen[content]})
+            seen[content] += 1
+
+    def _apply_stock(self, op):
+        med = self.meds.get(op["key"])
+        if med is None:
+            return
+        if op.get("b"):
+            if self._stock is None:
+                self._stock = Counter(_stock_content(e["med_id"], e) for e in DATA_STORE["ledger"])
+            content = _stock_content(med["id"], op)
+            if self._stock[content] > op["n"]:
+                return
+            self._stock[content] += 1
+        entries = DATA_STORE["ledger"]
+        entry = {"med_id": med["id"], "kind": op["kind"], "delta": op["delta"], "ts": op["ts"]}
+        if entries and entries[-1]["ts"] > op["ts"]:
+            # Keep the ledger in time order; its checkpoints are rebuilt on next use
+            entries = database.writable("ledger")
+            entries.insert(bisect_right(entries, op["ts"], key=lambda e: e["ts"]), entry)
+            self.ledger_reordered = True
+        else:
+            entries.append(entry)
+        self.restock[med["id"]] += op["delta"]
+
+    def finish(self):
+        if self.ledger_reordered:
+            DATA_STORE["ledger_checkpoints"][:] = []
+        # Stock is the ledger's sum, floored at 0. Above 0 that sum is the
+        # current count, so only meds that ran out need the ledger summed.
+        totals = {}
+        empty = set()
+        for med in DATA_STORE["medications"]:
+            if med["id"] in self.restock:
+                total = med["total_pills"] + self.restock[med["id"]]
+                if med["total_pills"] > 0 and total >= 0:
+                    totals[med["id"]] = total
+                else:
+                    empty.add(med["id"])
+        if empty:
+            totals.update({med_id: 0 for med_id in empty})
+            for entry in DATA_STORE["ledger"]:
+                if entry["med_id"] in empty:
+                    totals[entry["med_id"]] += entry["delta"]
+        for med in DATA_STORE["medications"]:
+            if med["id"] in totals and med["total_pills"] != max(0, totals[med["id"]]):
+                med["total_pills"] = max(0, totals[med["id"]])
+                self._event(database.MEDICATION_UPDATED, med["id"])
+        database.save_data()
+        for event_type, med_ids in self.events.items():
+            database.notify(event_type, database.ACTIVE_USER_ID, sorted(med_ids))
+
+
+def apply_changes(ops):
+    """
+    Applies operations received from other installs to the loaded user,
+    skipping those already seen. Returns the number applied.
+    """
+    vector = _state()["vector"]
+    merge = _Merge()
+    applied = []
+    for op in ops:
+        origin, seq = op["o"], op["s"]
+        # Seen already, or a gap that a later sync will fill in order
+        if seq != vector.get(origin, 0) + 1:
+            continue
+        merge.apply(op)
+        vector[origin] = seq
+        applied.append({k: v for k, v in op.items() if k != "rows"})
+    if applied:
+        merge.finish()
+        # Logged too, so they can be passed on to installs that sync with this one
+        _write_ops(applied)
+    return len(applied)
+
+
+def apply_snapshot(ops, vector):
+    """
+    Applies the whole store of an install whose log has already dropped
+    operations this one lacks (see _store_ops()), then counts everything
+    in that install's vector as seen. Returns the number of operations.
+    """
+    state = _state()
+    merge = _Merge()
+    for op in ops:
+        merge.apply(op)
+    for origin, seq in vector.items():
+        if seq > state["vector"].get(origin, 0):
+            state["vector"][origin] = seq
+            # Not in this log either: installs behind this point get a snapshot from here too
+            state["trimmed"][origin] = max(state["trimmed"].get(origin, 0), seq)
+    merge.finish()
+    return len(ops)
+
+
+def _changes_for(vector):
+    """Message with what the holder of `vector` lacks: the operations, or a snapshot if some were dropped."""
+    if _missing(vector):
+        return {"snapshot": _with_rows(_store_ops())}
+    return {"ops": _with_rows(changes_since(vector))}
+
+
+def _apply_message(message):
+    if "snapshot" in message:
+        return apply_snapshot(message["snapshot"], message["vector"])
+    return apply_changes(message["ops"])
+
+
+# ============================================
+# TRANSPORTS
+# ============================================
+def sync_folder(username, folder):
+    """
+    Exchanges the loaded user's changes through a shared folder.
+    Returns (sent, received) operation counts.
+    """
+    outbox_dir = os.path.join(folder, username)
+    os.makedirs(outbox_dir, exist_ok=True)
+    state = _state()
+    me = install_id()
+
+    outgoing = [op for op in _read_log() if op["o"] == me and op["s"] > state["exported"].get(me, 0)]
+    if outgoing:
+        with open(os.path.join(outbox_dir, me + ".jsonl"), "a", encoding="utf-8") as f:
+            for op in _with_rows(outgoing):
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        state["exported"][me] = outgoing[-1]["s"]
+
+    received = 0
+    for name in sorted(os.listdir(outbox_dir)):
+        if not name.endswith(".jsonl") or name == me + ".jsonl":
+            continue
+        offset = state["offsets"].get(name, 0)
+        with open(os.path.join(outbox_dir, name), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written by the other install is read next time
+        end = data.rfind(b"\n") + 1
+        if not end:
+            continue
+        received += apply_changes([json.loads(line) for line in data[:end].splitlines() if line.strip()])
+        state["offsets"][name] = offset + end
+
+    # Every install using the folder is a peer; their vectors tell what the log can drop
+    database.write_file(os.path.join(outbox_dir, me + VECTOR_SUFFIX), json.dumps(state["vector"]).encode("utf-8"))
+    for name in os.listdir(outbox_dir):
+        if name.endswith(VECTOR_SUFFIX) and name != me + VECTOR_SUFFIX:
+            with open(os.path.join(outbox_dir, name), "r", encoding="utf-8") as f:
+                state["peers"][name[:-len(VECTOR_SUFFIX)]] = json.load(f)
+    trim()
+    database.save_data()
+    return len(outgoing), received
+
+
+def _send(f, message):
+    f.write(json.dumps(message).encode("utf-8") + b"\n")
+    f.flush()
+
+
+def _receive(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError("connection closed by peer")
+    return json.loads(line)
+
+
+def sync_socket(username, password, host="127.0.0.1", port=DEFAULT_PORT, timeout=30):
+    """
+    Exchanges the loaded user's changes with serve() on another install,
+    which checks username and password against its own accounts.
+    Returns (sent, received) operation counts.
+    """
+    state = _state()
+    with socket.create_connection((host, port), timeout) as conn, conn.makefile("rwb") as f:
+        _send(f, {"user": username, "password": password, "install": install_id(), "vector": state["vector"]})
+        reply = _receive(f)
+        if "error" in reply:
+            raise ConnectionError(reply["error"])
+        received = _apply_message(reply)
+        outgoing = _changes_for(reply["vector"])
+        _send(f, {**outgoing, "vector": state["vector"]})
+        done = _receive(f)
+    state["peers"][reply["install"]] = done["vector"]
+    trim()
+    database.save_data()
+    return len(outgoing.get("ops", outgoing.get("snapshot"))), received
+
+
+def _user_id(username):
+    for user in DATA_STORE["users"]:
+        if user["username"] == username:
+            return user["id"]
+    return None
+
+
+def username(user_id):
+    for user in DATA_STORE["users"]:
+        if user["id"] == user_id:
+            return user["username"]
+    return None
+
+
+def _handle(f):
+    hello = _receive(f)
+    user_id = auth.login_user(hello.get("user"), hello.get("password"))
+    if user_id is None:
+        _send(f, {"error": "invalid username or password"})
+        return None
+    with database.STORE_LOCK, database.operation("sync"):
+        previous = database.ACTIVE_USER_ID
+        if previous != user_id:
+            database.load_user(user_id)
+        try:
+            state = _state()
+            _send(f, {"install": install_id(), "vector": state["vector"], **_changes_for(hello["vector"])})
+            answer = _receive(f)
+            received = _apply_message(answer)
+            state["peers"][hello["install"]] = answer["vector"]
+            trim()
+            database.save_data()
+            _send(f, {"ok": True, "received": received, "vector": state["vector"]})
+        finally:
+            if previous != user_id:
+                database.unload_user()
+                if previous is not None:
+                    database.load_user(previous)
+    return hello["user"], received
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, once=False):
+    """Answers sync_socket() calls, one at a time. With once=True returns after the first."""
+    with socket.create_server((host, port)) as server:
+        print(f"Waiting for sync on {host}:{port}")
+        while True:
+            conn, address = server.accept()
+            with conn, conn.makefile("rwb") as f:
+                try:
+                    result = _handle(f)
+                    if result is not None:
+                        print(f"Synced '{result[0]}' with {address[0]}: {result[1]} changes received")
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Sync with {address[0]} failed: {e}")
+            if once:
+                return
+
+
+def main(argv=None):
+    import argparse
+    import getpass
+
+    parser = argparse.ArgumentParser(description="Synchronize a user's data with another installation.")
+    parser.add_argument("--root", help="folder holding med_data.json and user_data/ (default: this install)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve", help="wait for other installs to connect")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_cmd.add_argument("--once", action="store_true", help="exit after one sync")
+    connect_cmd = commands.add_parser("connect", help="sync with an install running 'serve' (asks for the password)")
+    connect_cmd.add_argument("username")
+    connect_cmd.add_argument("--host", default="127.0.0.1")
+    connect_cmd.add_argument("--port", type=int, default=DEFAULT_PORT)
+    folder_cmd = commands.add_parser("folder", help="sync through a shared folder")
+    folder_cmd.add_argument("username")
+    folder_cmd.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.root:
+        database.DB_FILE = os.path.join(args.root, "med_data.json")
+        database.USER_DATA_DIR = os.path.join(args.root, "user_data")
+    database.init_db()
+
+    if args.command == "serve":
+        serve(args.host, args.port, args.once)
+        return 0
+
+    user_id = _user_id(args.username)
+    if user_id is None:
+        print(f"Unknown user '{args.username}'")
+        return 1
+    password = getpass.getpass(f"Password for {args.username}: ") if args.command == "connect" else None
+    with database.operation("sync"):
+        database.load_user(user_id)
+        try:
+            if args.command == "connect":
+                sent, received = sync_socket(args.username, password, args.host, args.port)
+            else:
+                sent, received = sync_folder(args.username, args.path)
+        except (OSError, ValueError) as e:
+            print(f"Sync failed: {e}")
+            return 1
+    print(f"Sent {sent} changes, received {received}.")
+    return 0
+
+
+instrument_module(__name__)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Optional call tracing for the backend modules.
+
+Set MED_TRACE=1 to wrap every public function (and public method of
+public classes) in the instrumented modules. Each call records count,
+cumulative time, self time (excluding traced callees) and the total
+length of list/dict/tuple/set arguments. At exit a report sorted by
+self time is printed, or written to MED_TRACE_OUTPUT; if that path ends
+in .json a Chrome trace (chrome://tracing, Perfetto) is written instead.
+
+When MED_TRACE is not set instrument_module() returns immediately and
+nothing is wrapped, so there is no overhead.
+"""
+
+import atexit
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from functools import wraps
+
+ENABLED = os.environ.get("MED_TRACE", "") not in ("", "0")
+OUTPUT = os.environ.get("MED_TRACE_OUTPUT", "")
+# Chrome trace events kept in memory; later calls are only counted
+MAX_TRACE_EVENTS = 200_000
+
+_STATS = {}
+_EVENTS = []
+# Traced functions run on the Tk, writer and reader threads
+_STATS_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_START = time.perf_counter()
+
+
+def _arg_size(args, kwargs):
+    size = 0
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, (list, tuple, dict, set)):
+            size += len(value)
+    return size
+
+
+def traced(func, name=None):
+    """Wraps func so its calls are recorded. Returns func unchanged if tracing is off."""
+    if not ENABLED:
+        return func
+    name = name or f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_LOCAL, "stack", None)
+        if stack is None:
+            stack = _LOCAL.stack = []
+        # Each frame accumulates the time spent in traced callees
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            child_time = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+
+            size = _arg_size(args, kwargs)
+            with _STATS_LOCK:
+                stats = _STATS.get(name)
+                if stats is None:
+                    stats = _STATS[name] = {"calls": 0, "cum": 0.0, "self": 0.0, "arg_size": 0}
+                stats["calls"] += 1
+                stats["cum"] += elapsed
+                stats["self"] += elapsed - child_time
+                stats["arg_size"] += size
+
+                if len(_EVENTS) < MAX_TRACE_EVENTS:
+                    _EVENTS.append({
+                        "name": name, "ph": "X", "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "ts": (start - _START) * 1e6, "dur": elapsed * 1e6,
+                        "args": {"arg_size": size},
+                    })
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def instrument_module(module_name):
+    """Wraps the public functions and public class methods defined in a module."""
+    if not ENABLED:
+        return
+    module = sys.modules[module_name]
+
+    for attr, value in list(vars(module).items()):
+        if attr.startswith("_") or getattr(value, "__module__", None) != module_name:
+            continue
+        if inspect.isfunction(value) and not getattr(value, "__traced__", False):
+            setattr(module, attr, traced(value))
+        elif inspect.isclass(value):
+            for method_name, method in list(vars(value).items()):
+                if (not method_name.startswith("_") and inspect.isfunction(method)
+                        and not getattr(method, "__traced__", False)):
+                    setattr(value, method_name, traced(method))
+
+
+def report_lines():
+    """Per-function stats, highest self time first."""
+    lines = [f"{'function':<52} {'calls':>8} {'cum ms':>10} {'self ms':>10} {'avg args':>9}"]
+    with _STATS_LOCK:
+        stats = {name: dict(s) for name, s in _STATS.items()}
+    for name, s in sorted(stats.items(), key=lambda kv: kv[1]["self"], reverse=True):
+        lines.append(f"{name:<52} {s['calls']:>8} {s['cum'] * 1000:>10.2f} "
+                     f"{s['self'] * 1000:>10.2f} {s['arg_size'] / s['calls']:>9.1f}")
+    return lines
+
+
+def write_chrome_trace(path):
+    with _STATS_LOCK:
+        events = list(_EVENTS)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _dump_at_exit():
+    if not _STATS:
+        return
+    if OUTPUT.endswith(".json"):
+        write_chrome_trace(OUTPUT)
+    elif OUTPUT:
+        with open(OUTPUT, "w") as f:
+            f.write("\n".join(report_lines()) + "\n")
+    else:
+        print("\n".join(report_lines()), file=sys.stderr)
+
+
+if ENABLED:
+    atexit.register(_dump_at_exit)
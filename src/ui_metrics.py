@@ -0,0 +1,132 @@
+"""
+Opt-in render-time and event-loop latency metrics for the GUI.
+
+Enable by starting the app with MED_UI_METRICS=1. When disabled the
+timed() decorator returns the function unchanged, so there is no cost.
+
+Records per view build: duration and (for the outermost timed call) how
+many widgets were created. A periodic after() probe measures how late
+the Tk event loop runs scheduled callbacks. Everything is appended as
+JSON lines to a rotating log and summarized for the debug overlay.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import deque
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_FILE = os.path.join(_PROJECT_ROOT, "logs", "ui_metrics.log")
+
+PROBE_INTERVAL_MS = 100
+# Number of recent event-loop lag samples kept for the overlay
+RECENT_SAMPLES = 300
+
+
+def count_widgets(root):
+    """Number of Tk widgets below root (inclusive)."""
+    total = 1
+    stack = list(root.winfo_children())
+    while stack:
+        widget = stack.pop()
+        total += 1
+        stack.extend(widget.winfo_children())
+    return total
+
+
+class UIMetrics:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.stats = {}
+        self.lag_samples = deque(maxlen=RECENT_SAMPLES)
+        self._depth = 0
+        self._logger = None
+
+    def _log(self, record):
+        if self._logger is None:
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+            self._logger = logging.getLogger("med_ui_metrics")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            handler = RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=3)
+            self._logger.addHandler(handler)
+        record["ts"] = round(time.time(), 3)
+        self._logger.info(json.dumps(record))
+
+    def record(self, name, seconds, widgets=None):
+        info = self.stats.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0,
+                                            "last": 0.0, "widgets": None})
+        info["count"] += 1
+        info["total"] += seconds
+        info["max"] = max(info["max"], seconds)
+        info["last"] = seconds
+        if widgets is not None:
+            info["widgets"] = widgets
+
+        entry = {"kind": "view", "name": name, "ms": round(seconds * 1000, 2)}
+        if widgets is not None:
+            entry["widgets"] = widgets
+        self._log(entry)
+
+    def timed(self, name):
+        """Decorator for MedicationApp methods (args[0] is the Tk root)."""
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                root = args[0]
+                # Counting widgets walks the whole tree, so only the
+                # outermost timed call does it.
+                outer = self._depth == 0
+                before = count_widgets(root) if outer else None
+                self._depth += 1
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self._depth -= 1
+                    widgets = count_widgets(root) - before if outer else None
+                    self.record(name, elapsed, widgets)
+            return wrapper
+        return decorator
+
+    def start_probe(self, root, interval_ms=PROBE_INTERVAL_MS):
+        """Schedules an after() callback and records how late it fires."""
+        if not self.enabled:
+            return
+
+        def probe(expected):
+            now = time.perf_counter()
+            lag_ms = max(0.0, (now - expected) * 1000)
+            self.lag_samples.append(lag_ms)
+            if lag_ms >= 50:
+                self._log({"kind": "lag", "ms": round(lag_ms, 1)})
+            root.after(interval_ms, probe, time.perf_counter() + interval_ms / 1000)
+
+        root.after(interval_ms, probe, time.perf_counter() + interval_ms / 1000)
+
+    def summary_lines(self):
+        """Human-readable lines for the debug overlay, slowest first."""
+        lines = []
+        if self.lag_samples:
+            ordered = sorted(self.lag_samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            lines.append(f"event loop lag: last {self.lag_samples[-1]:.0f}ms  "
+                         f"p95 {p95:.0f}ms  max {ordered[-1]:.0f}ms")
+        for name, info in sorted(self.stats.items(), key=lambda kv: kv[1]["total"], reverse=True):
+            avg = info["total"] / info["count"] * 1000
+            line = (f"{name}: n={info['count']}  last {info['last'] * 1000:.1f}ms  "
+                    f"avg {avg:.1f}ms  max {info['max'] * 1000:.1f}ms")
+            if info["widgets"] is not None:
+                line += f"  widgets {info['widgets']}"
+            lines.append(line)
+        return lines
+
+
+UI_METRICS = UIMetrics(os.environ.get("MED_UI_METRICS", "") not in ("", "0"))
@@ -0,0 +1,248 @@
+"""
+Background persistence for the GUI.
+
+While the window is open a single worker thread owns the data files.
+The GUI submits mutations (service calls) with submit(); the worker runs
+them one at a time under database.STORE_LOCK. save_data() inside them
+only serializes the store and hands the bytes back to the worker, which
+writes them once the mutation has returned; saves queued while the disk
+is slow collapse into one write per file. A slow or failing disk
+therefore delays only the files, never the button that caused the write.
+Until they are on disk, database.read_file() returns the queued bytes,
+so loading a user or rebuilding an index never reads an older file.
+
+Results, failures and the change events sent by the mutations come back
+through a queue that the GUI drains with poll() from Tk's after() loop,
+so callbacks and subscribers always run on the main thread.
+
+Long reads (PDF export) run on their own thread with read(), outside
+the lock: they work on a database.Snapshot, so they neither wait for the
+worker nor hold it up.
+
+Without start() (scripts and the CLI tools) nothing changes and
+save_data() writes synchronously.
+"""
+
+import contextlib
+import queue
+import threading
+import time
+import traceback
+
+import database
+from tracing import instrument_module
+
+# How often the GUI drains the result queue
+POLL_MS = 50
+
+# Job that writes the pending files
+_WRITE = object()
+
+
+class StorageWriter:
+    def __init__(self):
+        self._jobs = queue.Queue()
+        # ("done" | "error" | "event" | "write_error", callback, value)
+        self._results = queue.Queue()
+        # path -> (bytes, operation); only the newest contents of each file are kept
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # The files _write_pending() is putting on disk right now
+        self._writing = {}
+        self._write_queued = False
+        self._thread = None
+        self._root = None
+        # Called on the main thread with the exception when a mutation
+        # without its own on_error fails, or when files cannot be written
+        self.on_error = None
+        self.on_write_error = None
+
+    def start(self, root):
+        """Starts the worker and polls for results from root's event loop."""
+        if self._thread is not None:
+            return
+        database.use_writer(self._queue_files, self._relay_event, self.pending_bytes)
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+        self._root = root
+        root.after(POLL_MS, self._tick)
+
+    def stop(self):
+        """Writes everything still pending and returns to synchronous saves."""
+        if self._thread is None:
+            return True
+        saved = self.flush()
+        self._jobs.put(None)
+        self._thread.join()
+        self._thread = None
+        database.use_writer()
+        return saved
+
+    # ----- called from the main thread -----
+    def submit(self, func, *args, on_done=None, on_error=None, lock=True, write_first=False):
+        """
+        Runs func(*args) on the worker. on_done(result) or on_error(exc)
+        is called from poll() once it has run; the files may still be
+        being written at that point. Runs func right away (on this
+        thread) when the worker is not running.
+
+        With lock=False func runs without STORE_LOCK and takes it itself
+        where it touches the store (jobs still run one at a time). With
+        write_first=True the pending files are written before func runs,
+        for jobs that read the data files straight from disk.
+        """
+        if self._thread is None:
+            try:
+                with database.STORE_LOCK if lock else contextlib.nullcontext():
+                    result = func(*args)
+            except Exception as e:
+                traceback.print_exc()
+                self._call(on_error or self.on_error, e)
+                return
+            self._call(on_done, result)
+            return
+        self._jobs.put((func, args, on_done, on_error, lock, write_first))
+
+    def read(self, func, *args, on_done=None, on_error=None):
+        """
+        Runs func(*args) on a thread of its own, without STORE_LOCK; func
+        must take what it needs from a snapshot. Callbacks as for submit().
+        """
+        if self._thread is None:
+            self._run_reader(func, args, on_done, on_error)
+            self.poll()
+            return
+        threading.Thread(target=self._run_reader, args=(func, args, on_done, on_error),
+                         name="storage-reader", daemon=True).start()
+
+    def flush(self):
+        """
+        Blocks until every submitted mutation has run and its files are
+        written, then runs their callbacks. Returns False if some files
+        could not be written.
+        """
+        if self._thread is not None:
+            self._request_write()
+            self._jobs.join()
+            self.poll()
+        with self._pending_lock:
+            return not self._pending
+
+    def unsaved_files(self):
+        with self._pending_lock:
+            return sorted(self._pending)
+
+    def poll(self):
+        """Runs the callbacks and change events that arrived from the worker."""
+        while True:
+            try:
+                kind, callback, value = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "event":
+                with database.STORE_LOCK:
+                    database.deliver(value)
+            elif kind == "done":
+                self._call(callback, value)
+            elif kind == "error":
+                self._call(callback or self.on_error, value)
+            else:
+                self._call(self.on_write_error, value)
+
+    def _tick(self):
+        # Rescheduled first so results keep arriving while a callback shows a modal dialog
+        if self._thread is not None:
+            self._root.after(POLL_MS, self._tick)
+        self.poll()
+
+    @staticmethod
+    def _call(callback, value):
+        if callback is not None:
+            callback(value)
+
+    # ----- called from any thread -----
+    def pending_bytes(self, path):
+        """Contents queued for path but not on disk yet, or None."""
+        with self._pending_lock:
+            entry = self._pending.get(path) or self._writing.get(path)
+        return entry[0] if entry else None
+
+    def _queue_files(self, files, op):
+        with self._pending_lock:
+            for path, raw in files:
+                self._pending[path] = (raw, op)
+        self._request_write()
+
+    def _request_write(self):
+        with self._pending_lock:
+            if not self._pending or self._write_queued:
+                return
+            self._write_queued = True
+        self._jobs.put(_WRITE)
+
+    def _relay_event(self, event):
+        self._results.put(("event", None, event))
+
+    # ----- worker thread -----
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                if job is _WRITE:
+                    self._write_pending()
+                else:
+                    self._run_job(*job)
+            finally:
+                self._jobs.task_done()
+
+    def _run_job(self, func, args, on_done, on_error, lock, write_first):
+        if write_first:
+            self._write_pending()
+        try:
+            with database.STORE_LOCK if lock else contextlib.nullcontext():
+                result = func(*args)
+        except Exception as e:
+            traceback.print_exc()
+            self._results.put(("error", on_error, e))
+        else:
+            self._results.put(("done", on_done, result))
+
+    def _run_reader(self, func, args, on_done, on_error):
+        try:
+            result = func(*args)
+        except Exception as e:
+            traceback.print_exc()
+            self._results.put(("error", on_error, e))
+        else:
+            self._results.put(("done", on_done, result))
+
+    def _write_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._writing = pending
+            self._write_queued = False
+        error = None
+        for path, (raw, op) in pending.items():
+            start = time.perf_counter()
+            try:
+                database.write_file(path, raw)
+            except OSError as e:
+                error = e
+                # Retried with the next save or flush() unless newer contents arrived
+                with self._pending_lock:
+                    self._pending.setdefault(path, (raw, op))
+                continue
+            database.record_io("save", len(raw), time.perf_counter() - start, op=op)
+        with self._pending_lock:
+            self._writing = {}
+        if error is not None:
+            print(f"Saving failed: {error}")
+            self._results.put(("write_error", None, error))
+
+
+WRITER = StorageWriter()
+
+
+instrument_module(__name__)
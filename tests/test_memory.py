@@ -0,0 +1,54 @@
+"""Memory regression checks: the headless backend cycle and, when a
+display is available, view switching in the Tk app."""
+import os
+
+import pytest
+
+import database
+from mem_profile import leak_check, view_widgets
+
+
+def test_backend_cycles_do_not_grow():
+    ok, growth = leak_check(rounds=60, warmup=10)
+    assert ok, f"{growth:+.1f} KB after 60 cycles"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    pytest.importorskip("customtkinter")
+    import tkinter
+
+    if os.name != "nt" and not os.environ.get("DISPLAY"):
+        pytest.skip("no display")
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "med_data.json"))
+    monkeypatch.setattr(database, "USER_DATA_DIR", str(tmp_path / "user_data"))
+
+    from app import MedicationApp
+
+    try:
+        window = MedicationApp()
+    except tkinter.TclError as error:
+        pytest.skip(f"Tk unavailable: {error}")
+    yield window
+    window.on_close()
+
+
+def test_view_switching_keeps_widget_counts_flat(app):
+    from service import SERVICE
+
+    SERVICE.register("viewcheck", "viewcheck")
+    user_id = SERVICE.login("viewcheck", "viewcheck")
+    SERVICE.add_medication(user_id, "Check", 100, 2)
+    app.on_logged_in("viewcheck", user_id)
+
+    def switch(rounds):
+        for _ in range(rounds):
+            for show in (app.show_medications_view, app.show_history_view,
+                         app.show_calendar_view, app.show_add_view):
+                show()
+                app.update()
+
+    switch(3)
+    before = view_widgets(app), len(app.font_labels)
+    switch(20)
+    assert (view_widgets(app), len(app.font_labels)) == before